@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+""" Measures how Repairman scales, using synthetic containers instead of a Docker daemon.
+    Results are written as JSON, and can be compared with results of a previous run to catch regressions.
+
+    python3 ./benchmarks/run.py --output results.json
+    python3 ./benchmarks/run.py --baseline results.json --tolerance 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import typing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)) + '/../')
+
+from repairman import create_parser
+from repairman.lib.entity import ApplicationGlobalPolicy
+from repairman.lib.journal import Journal
+from repairman.lib.notify import Notify, NotificationCoalescer, NotificationDispatcher
+from repairman.lib.summary import SummaryCache
+from repairman.lib.synthetic import SyntheticAdapter, SyntheticDockerApi
+
+NAMESPACE = 'bench_'
+
+
+def create_policy(*argv) -> ApplicationGlobalPolicy:
+    """ Policy with the same defaults as the command line has """
+
+    params = vars(create_parser().parse_args(['--namespace', NAMESPACE] + list(argv)))
+
+    for key in list(params.keys()):
+        if key.startswith('http_'):
+            del params[key]
+
+    return ApplicationGlobalPolicy(params)
+
+
+def create_adapter(policy: ApplicationGlobalPolicy, count: int, latency: float = 0.0) -> SyntheticAdapter:
+    notify = Notify(policy, NotificationCoalescer(NotificationDispatcher(queue_size=1000, timeout=1, retries=0),
+                                                  window=0))
+
+    return SyntheticAdapter(policy, notify, SyntheticDockerApi(count=count, namespace=NAMESPACE, latency=latency))
+
+
+def measure(action: typing.Callable, repeat: int) -> dict:
+    """ Durations of each repetition in seconds """
+
+    samples = []
+
+    for i in range(0, repeat):
+        started_at = time.perf_counter()
+        action()
+        samples.append(time.perf_counter() - started_at)
+
+    samples.sort()
+
+    return {
+        'unit': 's',
+        'repeat': repeat,
+        'min': samples[0],
+        'p50': samples[len(samples) // 2],
+        'p99': samples[min(int(len(samples) * 0.99), len(samples) - 1)],
+        'max': samples[-1]
+    }
+
+
+def measure_throughput(action: typing.Callable[[], int], repeat: int) -> dict:
+    """ Action returns how many operations it made, result is the best of repetitions """
+
+    best = 0
+
+    for i in range(0, repeat):
+        started_at = time.perf_counter()
+        operations = action()
+        best = max(best, operations / (time.perf_counter() - started_at))
+
+    return {'unit': 'ops/s', 'repeat': repeat, 'per_second': best}
+
+
+def benchmark_scan(sizes: list, repeat: int) -> list:
+    """ Full listing of containers: sparse list and inspection of unhealthy candidates """
+
+    results = []
+
+    for count in sizes:
+        for latency in [0.0, 0.001]:
+            adapter = create_adapter(create_policy(), count, latency)
+
+            def scan():
+                adapter.invalidate_snapshot()
+                adapter.get_snapshot()
+
+            calls_before = adapter.api.calls
+            result = measure(scan, repeat)
+            result['api_calls_per_scan'] = (adapter.api.calls - calls_before) / repeat
+
+            results.append({'name': 'scan', 'params': {'containers': count, 'api_latency': latency}, **result})
+
+    return results
+
+
+def benchmark_map_container(sizes: list, repeat: int) -> list:
+    results = []
+
+    for count in sizes:
+        adapter = create_adapter(create_policy(), count)
+        listed = adapter.api.containers.list(all=True, sparse=True)
+
+        def map_all() -> int:
+            for docker_container in listed:
+                adapter._map_container(docker_container)
+
+            return len(listed)
+
+        results.append({'name': 'map_container', 'params': {'containers': count},
+                        **measure_throughput(map_all, repeat)})
+
+    return results
+
+
+def benchmark_journal(sizes: list, repeat: int) -> list:
+    """ Inserts and policy queries on in-memory and file databases, summary query """
+
+    results = []
+
+    for db in [':memory:', 'file']:
+        for commit_interval in [0, 1]:
+            directory = tempfile.TemporaryDirectory()
+            db_path = db if db == ':memory:' else directory.name + '/journal.sqlite3'
+            policy = create_policy('--db-path', db_path, '--db-commit-interval', str(commit_interval))
+            journal = Journal(policy)
+            containers = create_adapter(policy, max(sizes)).find_all_containers_in_namespace()
+
+            def insert() -> int:
+                for container in containers:
+                    journal.record_restart(container)
+
+                journal.flush()
+                return len(containers)
+
+            def query() -> int:
+                for container in containers:
+                    journal.find_restart_count_in_frame(container)
+                    journal.find_last_restart_time(container)
+                    journal.get_total_restart_count_in_all_frames(container)
+
+                return len(containers) * 3
+
+            params = {'db': db, 'db_commit_interval': commit_interval, 'containers': len(containers)}
+            results.append({'name': 'journal_insert', 'params': params, **measure_throughput(insert, repeat)})
+            results.append({'name': 'journal_query', 'params': params, **measure_throughput(query, repeat)})
+            results.append({'name': 'journal_summary', 'params': params,
+                            **measure(lambda: journal.get_summary(lambda: containers, 50), repeat)})
+
+            journal.close()
+            directory.cleanup()
+
+    return results
+
+
+def benchmark_summary(sizes: list, repeat: int) -> list:
+    """ Rendering of the HTTP summary: without cache, and served from cache """
+
+    results = []
+
+    for count in sizes:
+        policy = create_policy()
+        adapter = create_adapter(policy, count)
+        journal = Journal(create_policy('--db-commit-interval', '0'))
+
+        for container in adapter.find_all_unhealthy_containers_in_namespace():
+            journal.record_restart(container)
+
+        for ttl in [0, 60]:
+            summary = SummaryCache(
+                producer=lambda limit: journal.get_summary(adapter.find_all_containers_in_namespace, limit),
+                revision=lambda: (journal.get_revision(), adapter.get_snapshot_revision()),
+                ttl=ttl
+            )
+
+            results.append({'name': 'summary', 'params': {'containers': count, 'ttl': ttl},
+                            **measure(lambda: summary.get(50), repeat)})
+
+    return results
+
+
+def benchmark_memory(sizes: list) -> list:
+    """ Memory kept by the snapshot and the journal history, per container """
+
+    results = []
+
+    for count in sizes:
+        policy = create_policy('--db-commit-interval', '0')
+        adapter = create_adapter(policy, count)
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        snapshot = adapter.get_snapshot()
+        after_snapshot = tracemalloc.get_traced_memory()[0]
+
+        journal = Journal(policy)
+
+        for container in snapshot.all:
+            journal.record_restart(container)
+
+        after_journal = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        results.append({'name': 'memory', 'params': {'containers': count}, 'unit': 'bytes/container',
+                        'snapshot': (after_snapshot - before) / count,
+                        'journal': (after_journal - after_snapshot) / count})
+
+    return results
+
+
+def compare(results: list, baseline: list, tolerance: float) -> list:
+    """ Results slower (or with lower throughput) than the baseline by more than the tolerance """
+
+    previous = dict(map(lambda result: ((result['name'], json.dumps(result['params'], sort_keys=True)), result),
+                        baseline))
+    regressions = []
+
+    for result in results:
+        before = previous.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+
+        if before is None:
+            continue
+
+        if 'p50' in result and result['p50'] > before['p50'] * (1 + tolerance):
+            regressions.append({'name': result['name'], 'params': result['params'],
+                                'metric': 'p50', 'baseline': before['p50'], 'current': result['p50']})
+
+        if 'per_second' in result and result['per_second'] < before['per_second'] * (1 - tolerance):
+            regressions.append({'name': result['name'], 'params': result['params'],
+                                'metric': 'per_second', 'baseline': before['per_second'],
+                                'current': result['per_second']})
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Repairman benchmarks on synthetic containers')
+    parser.add_argument('--output', help='Path to write the JSON results to, defaults to stdout', default='')
+    parser.add_argument('--baseline', help='Results of a previous run to compare with', default='')
+    parser.add_argument('--tolerance', help='Allowed slowdown against the baseline, eg. 0.25 is 25%%',
+                        default=0.25, type=float)
+    parser.add_argument('--sizes', help='Comma separated numbers of containers', default='100,1000,5000')
+    parser.add_argument('--repeat', help='Repetitions of each measurement', default=5, type=int)
+    parsed = parser.parse_args()
+
+    sizes = list(map(int, parsed.sizes.split(',')))
+    results = benchmark_scan(sizes, parsed.repeat) \
+        + benchmark_map_container(sizes, parsed.repeat) \
+        + benchmark_journal(sizes, parsed.repeat) \
+        + benchmark_summary(sizes, parsed.repeat) \
+        + benchmark_memory(sizes)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'created_at': int(time.time()),
+        'results': results
+    }
+
+    if parsed.baseline:
+        with open(parsed.baseline) as handle:
+            report['regressions'] = compare(results, json.load(handle)['results'], parsed.tolerance)
+
+    if parsed.output:
+        with open(parsed.output, 'w') as handle:
+            json.dump(report, handle, indent=4)
+    else:
+        print(json.dumps(report, indent=4))
+
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
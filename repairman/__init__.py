@@ -5,24 +5,44 @@ __email__ = 'riotkit_org@riseup.net'
 __version__ = '1.0.0'
 
 import argparse
+import json
 import sys
 import traceback
 
 try:
     from lib import Repairman
     from lib.exception import ConfigurationException
+    from lib.simulation import Simulation, Trace
 
 except ImportError:
     from .lib import Repairman
     from .lib.exception import ConfigurationException
+    from .lib.simulation import Simulation, Trace
 
 
-def main():
+def create_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser()
     parser.add_argument('--debug', help='Prints debugging messages', default=False, action="store_true")
     parser.add_argument('--interval',
                         help='How often in seconds check all containers?',
                         default=90)
+    parser.add_argument('--heal-interval',
+                        help='How often in seconds check for unhealthy containers, defaults to --interval',
+                        default=0)
+    parser.add_argument('--monitor-interval',
+                        help='How often in seconds check if repaired containers are back to alive, ' +
+                             'defaults to --interval',
+                        default=0)
+    parser.add_argument('--deduplication-interval',
+                        help='How often in seconds look for duplicated services, defaults to --interval',
+                        default=0)
+    parser.add_argument('--workers',
+                        help='How many containers can be restarted or removed at the same time',
+                        default=8)
+    parser.add_argument('--workers-queue-size',
+                        help='How many containers can wait for a free worker, next ones are postponed ' +
+                             'to a next check',
+                        default=100)
     parser.add_argument('--namespace',
                         help='Docker containers name prefix',
                         default='')
@@ -75,6 +95,16 @@ def main():
     parser.add_argument('--http-prefix',
                         help='HTTP endpoint prefix (security)',
                         default='')
+    parser.add_argument('--http-summary-ttl',
+                        help='Maximum time in seconds to serve the same summary, ' +
+                             'when nothing was changed in the meantime. 0 disables caching',
+                        default=5)
+    parser.add_argument('--http-timeout',
+                        help='Maximum time in seconds to generate the summary, then 503 is returned',
+                        default=10)
+    parser.add_argument('--http-max-concurrency',
+                        help='How many summaries can be generated at the same time',
+                        default=4)
 
     # Notify URL
     parser.add_argument('--notify-url',
@@ -84,14 +114,83 @@ def main():
     parser.add_argument('--notify-level',
                         help='Notification level: DEBUG, INFO, ERROR (org.riotkit.repairman.notify_level)',
                         default='INFO')
+    parser.add_argument('--notify-timeout',
+                        help='Timeout in seconds for a single notification request',
+                        default=5)
+    parser.add_argument('--notify-retries',
+                        help='How many times to retry a notification that could not be sent',
+                        default=3)
+    parser.add_argument('--notify-queue-size',
+                        help='How many notifications can wait to be sent to one URL, next ones are dropped',
+                        default=1000)
+    parser.add_argument('--notify-coalesce-window',
+                        help='Send at most one notification per URL in N seconds, notifications from that ' +
+                             'time are grouped into a digest. 0 disables',
+                        default=30)
+    parser.add_argument('--notify-log-max-bytes',
+                        help='Maximum size of a container log attached to a notification, older part is cut off',
+                        default=2048)
+
+    parser.add_argument('--watch-events',
+                        help='React immediately on "health_status" and "die" events from Docker, ' +
+                             'the periodic check of unhealthy containers becomes only a reconciliation',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('--reconciliation-interval',
+                        help='How often in seconds look for unhealthy containers, when --watch-events is used',
+                        default=600)
+
+    parser.add_argument('--docker-hosts',
+                        help='Comma separated Docker daemons to supervise, optionally named, ' +
+                             'eg. "web-1=tcp://10.0.0.1:2376,unix:///var/run/docker.sock". ' +
+                             'Defaults to the daemon configured by environment (DOCKER_HOST)',
+                        default='')
+    parser.add_argument('--docker-timeout',
+                        help='Timeout in seconds for a request to a Docker daemon',
+                        default=60)
+    parser.add_argument('--docker-driver',
+                        help='"docker-py" (threads) or "asyncio" (coroutines talking directly to --docker-socket)',
+                        choices=['docker-py', 'asyncio'],
+                        default='docker-py')
+    parser.add_argument('--docker-socket',
+                        help='Path to the Docker unix socket, used by --docker-driver=asyncio',
+                        default='/var/run/docker.sock')
+
+    parser.add_argument('--policy-cache-size',
+                        help='How many different container label sets to remember, containers with same labels ' +
+                             'share the parsed and validated policy',
+                        default=1024)
+
+    parser.add_argument('--snapshot-max-age',
+                        help='For how many seconds the list of containers fetched from Docker can be reused ' +
+                             'by checks and the HTTP endpoint',
+                        default=5)
+
+    parser.add_argument('--instrumentation',
+                        help='Measure timings of Docker API calls, journal queries, lock waits and notifications, ' +
+                             'available at /timings',
+                        default=False,
+                        action='store_true')
+    parser.add_argument('--instrumentation-log-interval',
+                        help='Log the timings every N seconds, when --instrumentation is enabled. 0 disables',
+                        default=0)
 
     parser.add_argument('--db-path',
                         help='Can allow to persist database into file, defaults to ":memory:" which ' +
                              'will not keep changes between restarts',
                         default=':memory:')
+    parser.add_argument('--db-commit-interval',
+                        help='Commit journal writes together every N seconds. In case of a crash the events ' +
+                             'from last N seconds can be lost. Use 0 to commit each write immediately',
+                        default=1)
 
     parser.description = 'RiotKit\'s Docker Repair Man'
-    parsed = parser.parse_args()
+
+    return parser
+
+
+def main():
+    parsed = create_parser().parse_args()
 
     try:
         Repairman(params=vars(parsed)).main()
@@ -104,6 +203,46 @@ def main():
         sys.exit(0)
 
 
+def simulate():
+    """ Replays failures of containers on a virtual clock, to see how the heal policy would behave """
+
+    parser = create_parser()
+    parser.description = 'Simulates healing of containers with given policy, without Docker and without waiting'
+    simulation_args = ['trace', 'duration', 'container', 'flapping_period', 'flapping_down_time']
+
+    parser.add_argument('--trace',
+                        help='JSON file with {"containers": {...}, "events": [{"at": 0, "container": "app", ' +
+                             '"state": "failing|crashed|recovered"}]} or a recording of ' +
+                             '"docker events --filter event=health_status --format \'{{json .}}\'". ' +
+                             'Defaults to a flapping container',
+                        default='')
+    parser.add_argument('--duration', help='Simulated time in seconds', default=3600, type=int)
+    parser.add_argument('--container', help='Full name of the flapping container, including the --namespace',
+                        default='app')
+    parser.add_argument('--flapping-period', help='The container fails every N seconds', default=300, type=int)
+    parser.add_argument('--flapping-down-time', help='Each failure takes N seconds, restarts do not help then',
+                        default=120, type=int)
+
+    params = vars(parser.parse_args())
+
+    if params['trace']:
+        trace = Trace.from_file(params['trace'], params['duration'])
+    else:
+        trace = Trace.flapping(params['container'], params['duration'], params['flapping_period'],
+                               params['flapping_down_time'])
+
+    for key in list(params.keys()):
+        if key in simulation_args or key.startswith('http_'):
+            del params[key]
+
+    try:
+        print(json.dumps(Simulation(params, trace).run(), indent=4))
+
+    except ConfigurationException as e:
+        print(str(e))
+        sys.exit(1)
+
+
 if __name__ == "__main__":
     main()
 
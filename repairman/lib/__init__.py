@@ -1,44 +1,126 @@
 
 import tornado.log
-import time
 import logging
-import sys
-import traceback
 import json
+import asyncio
+import docker
 
-from .adapter import Adapter, DockerAdapter
+from .adapter import Adapter, DockerAdapter, MultiHostAdapter, AsyncDockerAdapter
+from .asyncdocker import AsyncDockerClient
 from .journal import Journal
+from .notify import Notify, NotificationDispatcher, NotificationCoalescer
 from .tasks import DeduplicationTask, HealTask, Task, MonitorRepairedTask
 from .entity import ApplicationGlobalPolicy
+from .exception import ConfigurationException
 from .http import HttpServer
+from .summary import SummaryCache
+from . import metrics
+from .instrumentation import instrumentation
+from .watcher import EventsWatcher
+from .scheduler import Scheduler
+from .workers import WorkerPool
+from .delayed import DelayedActionQueue
+from .semaphore import LockingManager
+from .time import Clock, SystemClock
 
 
 class Repairman:
     _policy: ApplicationGlobalPolicy
     _journal: Journal
     _adapter: Adapter
-    _tasks: list  # type: list[Task]
+    _dispatcher: NotificationDispatcher
+    _coalescer: NotificationCoalescer
+    _notify: Notify
+    _scheduler: Scheduler
+    _workers: WorkerPool
+    _delayed: DelayedActionQueue
+    _clock: Clock
+    _loop: asyncio.AbstractEventLoop
+    _heal_task: HealTask
+    _lock_manager: LockingManager
     _http_address: str
     _http_port: int
     _http_prefix: str
+    _http_summary_ttl: int
+    _http_timeout: int
+    _http_max_concurrency: int
 
     def __init__(self, params: dict):
         self._http_address = params['http_address']
         self._http_port = params['http_port']
         self._http_prefix = params['http_prefix']
+        self._http_summary_ttl = int(params['http_summary_ttl'])
+        self._http_timeout = int(params['http_timeout'])
+        self._http_max_concurrency = int(params['http_max_concurrency'])
 
         del params['http_address']
         del params['http_port']
         del params['http_prefix']
+        del params['http_summary_ttl']
+        del params['http_timeout']
+        del params['http_max_concurrency']
 
         self._policy = ApplicationGlobalPolicy(params)
-        self._journal = Journal(self._policy)
-        self._adapter = DockerAdapter(self._policy)
-        self._tasks = [
-            DeduplicationTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy),
-            MonitorRepairedTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy),
-            HealTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy)
-        ]
+        self._clock = SystemClock()
+        self._loop = asyncio.new_event_loop()
+        self._journal = Journal(self._policy, clock=self._clock)
+        self._dispatcher = NotificationDispatcher(queue_size=self._policy.notify_queue_size,
+                                                  timeout=self._policy.notify_timeout,
+                                                  retries=self._policy.notify_retries)
+        self._coalescer = NotificationCoalescer(dispatcher=self._dispatcher,
+                                                window=self._policy.notify_coalesce_window)
+        self._notify = Notify(self._policy, self._coalescer)
+        self._adapter = self._create_adapter()
+        self._workers = WorkerPool(workers=self._policy.workers, queue_size=self._policy.workers_queue_size)
+        self._delayed = DelayedActionQueue(workers=self._workers, clock=self._clock)
+        self._lock_manager = LockingManager(clock=self._clock)
+        self._heal_task = HealTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy,
+                                   workers=self._workers, notify=self._notify, lock_manager=self._lock_manager,
+                                   delayed=self._delayed, clock=self._clock)
+        self._scheduler = Scheduler(clock=self._clock)
+        self._scheduler.add(
+            DeduplicationTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy,
+                              workers=self._workers, notify=self._notify, lock_manager=self._lock_manager),
+            self._policy.deduplication_interval
+        )
+        self._scheduler.add(
+            MonitorRepairedTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy,
+                                workers=self._workers, notify=self._notify, lock_manager=self._lock_manager),
+            self._policy.monitor_interval
+        )
+        self._scheduler.add(self._heal_task, self._policy.heal_interval)
+
+        metrics.registry.register(metrics.Gauge(
+            'repairman_workers', 'Worker pool statistics: workers, active, queued, completed, failed, rejected',
+            lambda: dict(map(lambda item: ((item[0],), item[1]), self._workers.get_stats().items())),
+            ['stat']
+        ))
+        metrics.registry.register(metrics.Gauge(
+            'repairman_notification_dispatcher',
+            'Notification dispatcher statistics: queued, sent, failed, dropped, retried, pending, digests, coalesced',
+            lambda: dict(map(lambda item: ((item[0],), item[1]), self._get_notification_stats().items())),
+            ['stat']
+        ))
+        metrics.registry.register(metrics.Gauge(
+            'repairman_policy_cache', 'Container policies cache statistics: hits, misses, size',
+            lambda: dict(map(lambda item: ((item[0],), item[1]), self._policy.policy_cache.get_stats().items())),
+            ['stat']
+        ))
+        metrics.registry.register(metrics.Gauge(
+            'repairman_locks',
+            'Container locks statistics: acquired, released, contended, expired, foreign_releases, held, ' +
+            'heap_size, oldest_lease_age, average_lease_age',
+            lambda: dict(map(lambda item: ((item[0],), item[1]), self._lock_manager.get_stats().items())),
+            ['stat']
+        ))
+        metrics.registry.register(metrics.Gauge(
+            'repairman_delayed_actions', 'Restarts planned for later', self._delayed.count_pending
+        ))
+        metrics.registry.register(metrics.Gauge(
+            'repairman_task_overruns', 'Runs of a periodic task skipped because the previous run took too long',
+            lambda: dict(map(lambda stats: ((stats['task'],), stats['overruns']), self._scheduler.get_stats())),
+            ['task']
+        ))
 
     def main(self):
         """ Main """
@@ -47,18 +129,70 @@ class Repairman:
         tornado.log.app_log.info('Docker Repairman is starting...')
         tornado.log.app_log.info(json.dumps(self._policy.to_dict()))
 
-        http_server = HttpServer(address=self._http_address, port=self._http_port, server_path_prefix=self._http_prefix)
-        http_server.run(lambda limit:
-                        self._journal.get_summary(
-                            self._adapter.find_all_containers_in_namespace,
-                            last_events_limit=limit
-                        ))
-
-        while True:
-            for task in self._tasks:
-                try:
-                    task.process()
-                except:
-                    traceback.print_exc(file=sys.stdout)
-
-                time.sleep(self._policy.interval)
+        if self._policy.instrumentation:
+            instrumentation.enabled = True
+
+            if self._policy.instrumentation_log_interval > 0:
+                instrumentation.run_log_dump(self._policy.instrumentation_log_interval)
+
+        http_server = HttpServer(address=self._http_address, port=self._http_port, server_path_prefix=self._http_prefix,
+                                 timeout=self._http_timeout, max_concurrency=self._http_max_concurrency,
+                                 loop=self._loop)
+        summary = SummaryCache(
+            producer=lambda limit: {
+                **self._journal.get_summary(
+                    self._adapter.find_all_containers_in_namespace,
+                    last_events_limit=limit
+                ),
+                'workers': self._workers.get_stats(),
+                'notifications': self._get_notification_stats(),
+                'delayed_actions': self._delayed.get_pending(limit),
+                'delayed_actions_count': self._delayed.count_pending()
+            },
+            revision=lambda: (self._journal.get_revision(), self._adapter.get_snapshot_revision()),
+            ttl=self._http_summary_ttl
+        )
+        http_server.run(summary.get)
+
+        self._dispatcher.run()
+        self._lock_manager.run_reaper(60)
+        self._coalescer.run()
+        self._delayed.run()
+
+        if self._policy.watch_events:
+            EventsWatcher(adapter=self._adapter, task=self._heal_task).run()
+
+        try:
+            self._scheduler.run_forever()
+        finally:
+            self._journal.flush()
+
+    def _create_adapter(self) -> Adapter:
+        """ Docker daemon from environment (DOCKER_HOST), or multiple daemons from --docker-hosts """
+
+        if self._policy.docker_driver == 'asyncio':
+            if self._policy.docker_hosts:
+                raise ConfigurationException('--docker-driver=asyncio supports only the local unix socket, ' +
+                                             'please use --docker-socket instead of --docker-hosts')
+
+            # coroutines are executed on the same loop as the HttpServer
+            client = AsyncDockerClient(socket_path=self._policy.docker_socket, timeout=self._policy.docker_timeout)
+            return AsyncDockerAdapter(self._policy, self._notify, client=client, loop=self._loop)
+
+        if not self._policy.docker_hosts:
+            return DockerAdapter(self._policy, self._notify)
+
+        adapters = {}
+
+        for host, url in self._policy.docker_hosts.items():
+            # each daemon has its own connection pool, big enough for all workers restarting containers at once.
+            # API version is not negotiated, so an unavailable daemon does not prevent the start
+            api = docker.DockerClient(base_url=url, timeout=self._policy.docker_timeout,
+                                      max_pool_size=max(self._policy.workers, 1) + 1,
+                                      version=docker.constants.DEFAULT_DOCKER_API_VERSION)
+            adapters[host] = DockerAdapter(self._policy, self._notify, api=api, host=host)
+
+        return MultiHostAdapter(adapters, timeout=self._policy.docker_timeout)
+
+    def _get_notification_stats(self) -> dict:
+        return {**self._dispatcher.get_stats(), **self._coalescer.get_stats()}
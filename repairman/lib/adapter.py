@@ -1,10 +1,22 @@
 
 import abc
+import asyncio
+import concurrent.futures
+import datetime
+import queue
+import re
 import docker
+import docker.errors
+import threading
 import time
+import typing
 import tornado.log
+from docker.models.containers import Container as DockerContainer
 from .entity import Container, ApplicationGlobalPolicy
 from .notify import Notify
+from .asyncdocker import AsyncDockerClient
+from . import metrics
+from .instrumentation import instrumentation
 
 
 class Adapter(metaclass=abc.ABCMeta):
@@ -22,12 +34,22 @@ class Adapter(metaclass=abc.ABCMeta):
     def find_all_unhealthy_containers_in_namespace(self) -> list:
         pass
 
+    @abc.abstractmethod
+    def get_snapshot_revision(self) -> int:
+        """ Changes when the list of containers or their state changes. Does not fetch anything """
+        pass
+
+    @abc.abstractmethod
+    def stream_unhealthy_containers_in_namespace(self) -> typing.Iterator[Container]:
+        """ Blocks and yields containers as soon as they are reported unhealthy """
+        pass
+
     @abc.abstractmethod
     def restart_container(self, container_id: str):
         pass
 
     @abc.abstractmethod
-    def get_log(self, container_id: str, max_lines: int = 10):
+    def get_log(self, container_id: str, max_lines: int = 10, max_bytes: int = 2048) -> str:
         pass
 
     @abc.abstractmethod
@@ -35,63 +57,255 @@ class Adapter(metaclass=abc.ABCMeta):
         pass
 
 
+class ContainerSnapshot:
+    """ Read-only view on containers fetched and mapped at once, shared between tasks and the HTTP summary """
+
+    _all: tuple
+    _in_namespace: tuple
+    _unhealthy_in_namespace: tuple
+    _created_at: float
+
+    def __init__(self, all_containers: list, in_namespace: list, unhealthy_in_namespace: list):
+        self._all = tuple(all_containers)
+        self._in_namespace = tuple(in_namespace)
+        self._unhealthy_in_namespace = tuple(unhealthy_in_namespace)
+        self._created_at = time.monotonic()
+
+    @property
+    def all(self) -> tuple:
+        return self._all
+
+    @property
+    def in_namespace(self) -> tuple:
+        return self._in_namespace
+
+    @property
+    def unhealthy_in_namespace(self) -> tuple:
+        """ Unhealthy containers in namespace, that have enabled auto-healing """
+        return self._unhealthy_in_namespace
+
+    def get_age(self) -> float:
+        return time.monotonic() - self._created_at
+
+    def get_fingerprint(self) -> tuple:
+        return tuple(map(
+            lambda container: (container.identify(), container.is_healthy(), container.get_exit_code()),
+            self._all + self._unhealthy_in_namespace
+        ))
+
+
 class DockerAdapter(Adapter):
+    _LABEL_PREFIX = 'org.riotkit.repairman.'
+
     api: docker.DockerClient
     policy: ApplicationGlobalPolicy
     notify: Notify
-    _invalid_containers = {}
-
-    def __init__(self, app_policy: ApplicationGlobalPolicy):
+    host: str
+    _invalid_containers: dict  # type: dict[str, float]
+    _snapshot: ContainerSnapshot
+    _snapshot_fingerprint: tuple
+    _snapshot_revision: int
+    _snapshot_lock: threading.Lock
+
+    def __init__(self, app_policy: ApplicationGlobalPolicy, notify: Notify, api: docker.DockerClient = None,
+                 host: str = ''):
         self.policy = app_policy
-        self.api = docker.from_env()
-        self.notify = Notify(app_policy)
+        self.api = api if api is not None else docker.from_env()
+        self.notify = notify
+        self.host = host
+        self._invalid_containers = {}
+        self._snapshot = None
+        self._snapshot_fingerprint = ()
+        self._snapshot_revision = 0
+        self._snapshot_lock = threading.Lock()
 
     def remove_container(self, container_id: str):
-        container = self.api.containers.get(container_id)
-        container.stop()
-        container.remove()
+        container = self._get_container(container_id)
+
+        with instrumentation.span('docker.stop', metrics.DOCKER_API_DURATION, {'operation': 'stop'}):
+            container.stop()
+
+        with instrumentation.span('docker.remove', metrics.DOCKER_API_DURATION, {'operation': 'remove'}):
+            container.remove()
+
+        metrics.REMOVALS.inc({'host': self.host, 'container': container_id})
+        self.invalidate_snapshot()
 
     def restart_container(self, container_id: str):
-        container = self.api.containers.get(container_id)
+        container = self._get_container(container_id)
         t = time.time()
-        container.restart()
+
+        with instrumentation.span('docker.restart', metrics.DOCKER_API_DURATION, {'operation': 'restart'}):
+            container.restart()
+
+        metrics.RESTARTS.inc({'host': self.host, 'container': container_id})
+        metrics.RESTART_DURATION.observe(time.time() - t)
+        self.invalidate_snapshot()
         tornado.log.app_log.info('Container was restarted in ' + str(time.time() - t) + 's')
 
-    def get_log(self, container_id: str, max_lines: int = 10):
-        container = self.api.containers.get(container_id)
-        return container.logs(tail=max_lines).decode('utf-8')
+    def get_log(self, container_id: str, max_lines: int = 10, max_bytes: int = 2048) -> str:
+        """ Last lines of the log, but not more than last max_bytes. The log is streamed, not loaded at once """
+
+        container = self._get_container(container_id)
+        log = b''
+        truncated = False
+
+        with instrumentation.span('docker.logs', metrics.DOCKER_API_DURATION, {'operation': 'logs'}):
+            # docker-py follows the log when streaming, unless told not to
+            for chunk in container.logs(tail=max_lines, stream=True, follow=False):
+                log += chunk
+
+                if len(log) > max_bytes:
+                    log = log[-max_bytes:]
+                    truncated = True
+
+        return ('...' if truncated else '') + log.decode('utf-8', errors='replace')
+
+    def _get_container(self, container_id: str):
+        with instrumentation.span('docker.inspect', metrics.DOCKER_API_DURATION, {'operation': 'inspect'}):
+            return self.api.containers.get(container_id)
+
+    def _list_containers(self, **kwargs) -> list:
+        with instrumentation.span('docker.list', metrics.DOCKER_API_DURATION, {'operation': 'list'}):
+            return self.api.containers.list(**kwargs)
 
     def find_all_containers(self) -> list:
-        return self._map_containers(self.api.containers.list())
+        return list(self.get_snapshot().all)
 
     def find_all_containers_in_namespace(self) -> list:
-        return self._map_containers(self._filter_by_prefix(self.api.containers.list()))
+        return list(self.get_snapshot().in_namespace)
 
     def find_all_unhealthy_containers_in_namespace(self) -> list:
-        unhealthy = list(
-            filter(
-                lambda container:
-                    # WHEN is unhealthy (health)
-                    (
-                            "Health" in container.attrs['State']
-                            and container.attrs['State']['Health']['Status'] == "unhealthy"
-                    ) or (  # WHEN is exited by failure
-                            container.status == "exited"
-                            and (
-                                    0 < container.attrs['State']['ExitCode'] < 130
-                                    or container.attrs['State']['ExitCode'] > 200
-                            )
-                            # 130 > exit codes are keyboard interruption, sigkill, sigterm etc.
-                            # lower exit codes are typically failures
-                            # 200+ ex. 255 are generic errors
-                    ),
-                self.api.containers.list())
-        )
+        return list(self.get_snapshot().unhealthy_in_namespace)
 
-        return self._filter_by_enabled(
-            self._map_containers(
-                self._filter_by_prefix(unhealthy)
-            )
+    def get_snapshot(self) -> ContainerSnapshot:
+        """ Returns containers listed not earlier than --snapshot-max-age seconds ago """
+
+        with self._snapshot_lock:
+            if self._snapshot is None or self._snapshot.get_age() > self.policy.snapshot_max_age:
+                with instrumentation.span('docker.snapshot'):
+                    self._snapshot = self._create_snapshot()
+
+                if self._snapshot.get_fingerprint() != self._snapshot_fingerprint:
+                    self._snapshot_fingerprint = self._snapshot.get_fingerprint()
+                    self._snapshot_revision += 1
+
+            return self._snapshot
+
+    def get_snapshot_revision(self) -> int:
+        return self._snapshot_revision
+
+    def invalidate_snapshot(self):
+        with self._snapshot_lock:
+            self._snapshot = None
+
+    def _create_snapshot(self) -> ContainerSnapshot:
+        """ Lists containers without inspecting them, only the candidates for healing are inspected """
+
+        all_containers = []
+        in_namespace = []
+
+        for docker_container in self._list_containers(sparse=True):
+            container = self._map_container(docker_container)
+
+            if container is None:
+                continue
+
+            all_containers.append(container)
+
+            if self._get_name(docker_container).startswith(self.policy.namespace):
+                in_namespace.append(container)
+
+        return ContainerSnapshot(all_containers, in_namespace, self._find_unhealthy_in_namespace())
+
+    def _find_unhealthy_in_namespace(self) -> list:
+        candidates = {}
+
+        for filters in [{'health': 'unhealthy'}, {'status': 'exited'}]:
+            for docker_container in self._list_containers(all=True, sparse=True,
+                                                          filters={**filters, **self._create_namespace_filters()}):
+                if self._get_name(docker_container).startswith(self.policy.namespace):
+                    candidates[docker_container.id] = docker_container
+
+        unhealthy = list(filter(self._is_unhealthy, self._inspect_all(list(candidates.keys()))))
+
+        return self._filter_by_enabled(self._map_containers(unhealthy))
+
+    def _inspect_all(self, container_ids: list) -> list:
+        """ Inspected containers, the ones removed in the meantime are skipped """
+
+        inspected = []
+
+        for container_id in container_ids:
+            try:
+                inspected.append(self._get_container(container_id))
+            except docker.errors.NotFound:
+                continue
+
+        return inspected
+
+    def _create_namespace_filters(self) -> dict:
+        """ Filters for Docker API to not list containers that would be anyway rejected """
+
+        filters = {}
+
+        if self.policy.namespace:
+            # the name is matched by a regexp against names with a leading slash, eg. "/project_app_1"
+            filters['name'] = '^/' + re.escape(self.policy.namespace)
+
+        if not self.policy.enable_autoheal:
+            # the healing needs to be explicitly enabled by a label
+            filters['label'] = self._LABEL_PREFIX + 'enable_autoheal'
+
+        return filters
+
+    def stream_unhealthy_containers_in_namespace(self) -> typing.Iterator[Container]:
+        """ Subscribes to "health_status" and "die" events, the stream ends when the connection to dockerd is lost """
+
+        filters = {'type': 'container', 'event': ['health_status', 'die']}
+
+        if not self.policy.enable_autoheal:
+            filters['label'] = self._LABEL_PREFIX + 'enable_autoheal'
+
+        for event in self._stream_events(filters):
+            name = str(event.get('Actor', {}).get('Attributes', {}).get('name', ''))
+
+            if event.get('Action') not in ['health_status: unhealthy', 'die']:
+                continue
+
+            if not name.startswith(self.policy.namespace):
+                continue
+
+            try:
+                docker_container = self._get_container(event['id'])
+            except docker.errors.NotFound:
+                # container could be removed just after it died, eg. started with --rm
+                continue
+
+            if not self._is_unhealthy(docker_container):
+                continue
+
+            for container in self._filter_by_enabled(self._map_containers([docker_container])):
+                tornado.log.app_log.debug('Got "' + event['Action'] + '" event for "' + name + '"')
+                yield container
+
+    def _stream_events(self, filters: dict) -> typing.Iterator[dict]:
+        return self.api.events(decode=True, filters=filters)
+
+    @staticmethod
+    def _is_unhealthy(docker_container) -> bool:
+        # WHEN is unhealthy (health)
+        if "Health" in docker_container.attrs['State'] \
+                and docker_container.attrs['State']['Health']['Status'] == "unhealthy":
+            return True
+
+        # WHEN is exited by failure
+        # 130 > exit codes are keyboard interruption, sigkill, sigterm etc.
+        # lower exit codes are typically failures
+        # 200+ ex. 255 are generic errors
+        return docker_container.status == "exited" and (
+            0 < docker_container.attrs['State']['ExitCode'] < 130
+            or docker_container.attrs['State']['ExitCode'] > 200
         )
 
     def _map_containers(self, containers: list):
@@ -100,32 +314,39 @@ class DockerAdapter(Adapter):
         return list(filter(lambda x: x is not None, map(self._map_container, containers)))
 
     def _map_container(self, docker_container):
+        """ Maps both inspected and sparse (listed only) container """
+
         container = None
+        name = self._get_name(docker_container)
+        # same as Container.identify(), containers of different daemons may have same names
+        identity = self.host + '/' + name if self.host else name
 
         try:
             container = Container(
-                str(docker_container.name),
+                name,
                 str(docker_container.status).lower(),
-                int(docker_container.attrs['State']['ExitCode']),
-                str(docker_container.attrs['Created']),
+                self._get_exit_code(docker_container),
+                self._get_created_at(docker_container),
                 self.policy.create_service_policy(
                     self.create_policy_params_from_docker_container_tags(
-                        labels=docker_container.attrs['Config']['Labels']
+                        labels=self._get_labels(docker_container)
                     )
-                )
+                ),
+                self.host
             )
             container.policy.validate()
 
         except Exception as e:
+            metrics.CONFIGURATION_ERRORS.inc({'container': identity})
+
             # do not repeat the same notification twice or more too often
-            if str(docker_container.name) in self._invalid_containers \
-                    and self._invalid_containers[str(docker_container.name)] > time.time():
+            if identity in self._invalid_containers and self._invalid_containers[identity] > time.time():
                 return None
 
-            self._invalid_containers[str(docker_container.name)] = time.time() + 600
+            self._invalid_containers[identity] = time.time() + 600
 
-            tornado.log.app_log.error(str(docker_container.name) + ': ' + str(e))
-            tornado.log.app_log.error(str(docker_container.name) + ': Cannot monitor container due to ' +
+            tornado.log.app_log.error(identity + ': ' + str(e))
+            tornado.log.app_log.error(identity + ': Cannot monitor container due to ' +
                                       'configuration error. Please check container labels')
 
             if container:
@@ -137,11 +358,38 @@ class DockerAdapter(Adapter):
 
         return container
 
-    def _filter_by_prefix(self, containers: list) -> list:
-        return list(filter(
-            lambda docker_container: docker_container.name.startswith(self.policy.namespace),
-            containers
-        ))
+    @staticmethod
+    def _get_created_at(docker_container) -> str:
+        """ Listed containers have a unix timestamp, inspected ones an ISO 8601 date """
+
+        created_at = docker_container.attrs['Created']
+
+        if isinstance(created_at, (int, float)):
+            return datetime.datetime.fromtimestamp(created_at, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        return str(created_at)
+
+    @staticmethod
+    def _get_name(docker_container) -> str:
+        if docker_container.name is not None:
+            return str(docker_container.name)
+
+        return str(docker_container.attrs['Names'][0]).lstrip('/')
+
+    @staticmethod
+    def _get_labels(docker_container) -> dict:
+        if 'Config' in docker_container.attrs:
+            return docker_container.attrs['Config']['Labels'] or {}
+
+        return docker_container.attrs.get('Labels') or {}
+
+    @staticmethod
+    def _get_exit_code(docker_container) -> int:
+        # sparse containers have only a state name, the exit code is known only after inspection
+        if not isinstance(docker_container.attrs['State'], dict):
+            return 0
+
+        return int(docker_container.attrs['State']['ExitCode'])
 
     def _filter_by_enabled(self, containers: list) -> list:
         """ Filters by enabled, only mapped containers """
@@ -152,14 +400,241 @@ class DockerAdapter(Adapter):
         ))
 
     def create_policy_params_from_docker_container_tags(self, labels: dict):
-        prefix = 'org.riotkit.repairman.'
         params = {}
 
         for key, value_type in self.policy._get_types().items():
-            label_to_search_for = prefix + key.replace('-', '_')
+            label_to_search_for = self._LABEL_PREFIX + key.replace('-', '_')
 
             if label_to_search_for in labels:
                 params[key] = labels[label_to_search_for]
 
         return params
 
+
+class AsyncDockerContainer(DockerContainer):
+    """ docker-py container model, which actions are executed by coroutines of the AsyncDockerAdapter """
+
+    _adapter: 'AsyncDockerAdapter'
+
+    def __init__(self, attrs: dict, adapter: 'AsyncDockerAdapter'):
+        super().__init__(attrs=attrs)
+        self._adapter = adapter
+
+    def restart(self, **kwargs):
+        self._adapter.wait(self._adapter.client.restart(self.id))
+
+    def stop(self, **kwargs):
+        self._adapter.wait(self._adapter.client.stop(self.id))
+
+    def remove(self, **kwargs):
+        self._adapter.wait(self._adapter.client.remove(self.id))
+
+    def logs(self, tail: typing.Union[int, str] = 'all', stream: bool = False, **kwargs):
+        chunks = self._adapter.iterate(
+            self._adapter.client.logs(self.id, tail, bool(self.attrs.get('Config', {}).get('Tty')))
+        )
+
+        return chunks if stream else b''.join(chunks)
+
+
+class AsyncDockerAdapter(DockerAdapter):
+    """ Talks to the Docker Engine API over the unix socket with coroutines, running on the HttpServer loop.
+        The Adapter methods wait for the coroutines, so they can be still called from the workers.
+        Restarts are still driven by the workers, each one waits for its own restart coroutine.
+    """
+
+    client: AsyncDockerClient
+    _loop: asyncio.AbstractEventLoop
+
+    def __init__(self, app_policy: ApplicationGlobalPolicy, notify: Notify, client: AsyncDockerClient,
+                 loop: asyncio.AbstractEventLoop):
+        super().__init__(app_policy, notify, api=client)
+        self.client = client
+        self._loop = loop
+
+    def wait(self, coroutine: typing.Awaitable):
+        """ Executes the coroutine on the loop, blocks the calling thread until it is finished """
+
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def iterate(self, generator: typing.AsyncIterator) -> typing.Iterator:
+        """ Consumes the async generator on the loop, item by item, so the loop does not produce faster than needed """
+
+        finished = object()
+
+        async def next_item():
+            try:
+                return await generator.__anext__()
+            except StopAsyncIteration:
+                return finished
+
+        try:
+            while True:
+                item = self.wait(next_item())
+
+                if item is finished:
+                    return
+
+                yield item
+        finally:
+            asyncio.run_coroutine_threadsafe(generator.aclose(), self._loop)
+
+    def _list_containers(self, **kwargs) -> list:
+        with instrumentation.span('docker.list', metrics.DOCKER_API_DURATION, {'operation': 'list'}):
+            listed = self.wait(self.client.list_containers(all=kwargs.get('all', False),
+                                                           filters=kwargs.get('filters')))
+
+        return list(map(lambda attrs: AsyncDockerContainer(attrs, self), listed))
+
+    def _get_container(self, container_id: str):
+        with instrumentation.span('docker.inspect', metrics.DOCKER_API_DURATION, {'operation': 'inspect'}):
+            return AsyncDockerContainer(self.wait(self.client.inspect_container(container_id)), self)
+
+    def _inspect_all(self, container_ids: list) -> list:
+        """ All candidates are inspected at once, limited only by the connection pool of the client """
+
+        async def inspect_all():
+            return await asyncio.gather(*map(self.client.inspect_container, container_ids), return_exceptions=True)
+
+        with instrumentation.span('docker.inspect', metrics.DOCKER_API_DURATION, {'operation': 'inspect'}):
+            results = self.wait(inspect_all())
+
+        inspected = []
+
+        for result in results:
+            if isinstance(result, docker.errors.NotFound):
+                continue
+
+            if isinstance(result, BaseException):
+                raise result
+
+            inspected.append(AsyncDockerContainer(result, self))
+
+        return inspected
+
+    def _stream_events(self, filters: dict) -> typing.Iterator[dict]:
+        return self.iterate(self.client.events(filters))
+
+
+class MultiHostAdapter(Adapter):
+    """ Supervises containers of multiple Docker daemons. Each daemon is scanned in its own thread,
+        a slow or unavailable daemon does not delay the others. Containers are identified as "host/name"
+    """
+
+    _RECONNECT_DELAY = 5
+
+    adapters: dict  # type: dict[str, DockerAdapter]
+    _timeout: int
+    _executor: concurrent.futures.ThreadPoolExecutor
+    _scans: dict  # type: dict[str, concurrent.futures.Future]
+    _snapshots: dict  # type: dict[str, ContainerSnapshot]
+    _lock: threading.Lock
+
+    def __init__(self, adapters: dict, timeout: int):
+        self.adapters = adapters
+        self._timeout = timeout
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(adapters))
+        self._scans = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    def find_all_containers(self) -> list:
+        return self._collect(lambda snapshot: snapshot.all)
+
+    def find_all_containers_in_namespace(self) -> list:
+        return self._collect(lambda snapshot: snapshot.in_namespace)
+
+    def find_all_unhealthy_containers_in_namespace(self) -> list:
+        return self._collect(lambda snapshot: snapshot.unhealthy_in_namespace)
+
+    def get_snapshot_revision(self) -> int:
+        return sum(map(lambda adapter: adapter.get_snapshot_revision(), self.adapters.values()))
+
+    def stream_unhealthy_containers_in_namespace(self) -> typing.Iterator[Container]:
+        """ Merges events of all daemons, each daemon is reconnected separately """
+
+        containers = queue.Queue()
+
+        for host, adapter in self.adapters.items():
+            thread = threading.Thread(target=self._forward_events, args=(host, adapter, containers))
+            thread.setDaemon(True)
+            thread.start()
+
+        while True:
+            yield containers.get()
+
+    def restart_container(self, container_id: str):
+        host, name = self._split(container_id)
+        self.adapters[host].restart_container(name)
+
+    def get_log(self, container_id: str, max_lines: int = 10, max_bytes: int = 2048) -> str:
+        host, name = self._split(container_id)
+        return self.adapters[host].get_log(name, max_lines, max_bytes)
+
+    def remove_container(self, container_id: str):
+        host, name = self._split(container_id)
+        self.adapters[host].remove_container(name)
+
+    def _collect(self, select: typing.Callable[[ContainerSnapshot], tuple]) -> list:
+        containers = []
+
+        for snapshot in self._get_snapshots().values():
+            containers += select(snapshot)
+
+        return containers
+
+    def _get_snapshots(self) -> dict:
+        """ Scans all daemons at once. A daemon which does not respond in time is represented by its last snapshot,
+            a daemon which failed is skipped until it is available again.
+            A daemon still busy with a scan started by a previous call is not waited for, its last snapshot is used
+        """
+
+        scans = {}
+
+        with self._lock:
+            for host, adapter in self.adapters.items():
+                # do not queue a next scan of a daemon, which did not finish the previous one
+                if host not in self._scans or self._scans[host].done():
+                    self._scans[host] = self._executor.submit(adapter.get_snapshot)
+                    scans[host] = self._scans[host]
+
+        done, not_done = concurrent.futures.wait(scans.values(), timeout=self._timeout)
+
+        with self._lock:
+            for host, scan in scans.items():
+                if scan in not_done:
+                    tornado.log.app_log.warn('Docker daemon "' + host + '" did not respond in ' +
+                                             str(self._timeout) + 's, using its previous state')
+                    continue
+
+                try:
+                    self._snapshots[host] = scan.result()
+
+                except Exception as e:
+                    self._snapshots.pop(host, None)
+                    tornado.log.app_log.error('Cannot list containers of Docker daemon "' + host + '": ' + str(e))
+
+            return dict(self._snapshots)
+
+    def _forward_events(self, host: str, adapter: DockerAdapter, containers: queue.Queue):
+        while True:
+            try:
+                for container in adapter.stream_unhealthy_containers_in_namespace():
+                    containers.put(container)
+
+                tornado.log.app_log.warn('Events stream of Docker daemon "' + host + '" ended, reconnecting')
+
+            except Exception as e:
+                tornado.log.app_log.error('Events stream of Docker daemon "' + host + '" failed: ' + str(e))
+
+            time.sleep(self._RECONNECT_DELAY)
+
+    def _split(self, container_id: str) -> tuple:
+        """ "tcp://10.0.0.1:2376/iwa_app" -> ("tcp://10.0.0.1:2376", "iwa_app"), names cannot contain a slash """
+
+        host, name = container_id.rsplit('/', 1)
+
+        if host not in self.adapters:
+            raise KeyError('Unknown Docker daemon "' + host + '"')
+
+        return host, name
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import typing
+import urllib.parse
+import docker.constants
+import docker.errors
+
+
+class Response:
+    method: str
+    status: int
+    headers: dict
+    reader: asyncio.StreamReader
+
+    def __init__(self, method: str, status: int, headers: dict, reader: asyncio.StreamReader):
+        self.method = method
+        self.status = status
+        self.headers = headers
+        self.reader = reader
+
+    @property
+    def has_body(self) -> bool:
+        """ eg. restart, stop and remove are answered with "204 No Content" without any length """
+
+        return self.method != 'HEAD' and self.status not in (204, 304) and not 100 <= self.status < 200
+
+    @property
+    def is_chunked(self) -> bool:
+        return self.headers.get('transfer-encoding', '').lower() == 'chunked'
+
+    @property
+    def is_closed_after_body(self) -> bool:
+        return self.headers.get('connection', '').lower() == 'close'
+
+    @property
+    def keeps_alive(self) -> bool:
+        return not self.is_closed_after_body
+
+
+class AsyncDockerClient:
+    """ Docker Engine API client speaking HTTP/1.1 directly over the unix socket.
+        Connections are kept alive and reused, waiting for Docker costs a coroutine instead of a thread.
+    """
+
+    _socket_path: str
+    _timeout: int
+    _max_connections: int
+    _version: str
+    _idle: list  # type: list[tuple[asyncio.StreamReader, asyncio.StreamWriter]]
+    _semaphore: asyncio.Semaphore
+
+    def __init__(self, socket_path: str, timeout: int, max_connections: int = 32,
+                 version: str = docker.constants.DEFAULT_DOCKER_API_VERSION):
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._max_connections = max_connections
+        self._version = version
+        self._idle = []
+        self._semaphore = None
+
+    async def close(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            writer.close()
+
+            # Python 3.7+
+            if hasattr(writer, 'wait_closed'):
+                await writer.wait_closed()
+
+    async def list_containers(self, all: bool = False, filters: dict = None) -> list:
+        return await self._request_json('GET', '/containers/json', {
+            'all': int(all), 'filters': self._encode_filters(filters)
+        })
+
+    async def inspect_container(self, container_id: str) -> dict:
+        return await self._request_json('GET', '/containers/' + urllib.parse.quote(container_id) + '/json')
+
+    async def restart(self, container_id: str, stop_timeout: int = 10):
+        await self._request_json('POST', '/containers/' + urllib.parse.quote(container_id) + '/restart',
+                                 {'t': stop_timeout}, timeout=self._timeout + stop_timeout)
+
+    async def stop(self, container_id: str, stop_timeout: int = 10):
+        await self._request_json('POST', '/containers/' + urllib.parse.quote(container_id) + '/stop',
+                                 {'t': stop_timeout}, timeout=self._timeout + stop_timeout)
+
+    async def remove(self, container_id: str):
+        await self._request_json('DELETE', '/containers/' + urllib.parse.quote(container_id))
+
+    async def logs(self, container_id: str, tail: typing.Union[int, str], tty: bool) -> typing.AsyncIterator[bytes]:
+        """ Yields the log as it comes, without keeping whole frames in memory """
+
+        stream = self._stream('GET', '/containers/' + urllib.parse.quote(container_id) + '/logs',
+                              {'stdout': 1, 'stderr': 1, 'tail': tail})
+
+        if tty:
+            async for chunk in stream:
+                yield chunk
+            return
+
+        async for chunk in self._demultiplex(stream):
+            yield chunk
+
+    async def events(self, filters: dict = None) -> typing.AsyncIterator[dict]:
+        buffer = b''
+
+        async for chunk in self._stream('GET', '/events', {'filters': self._encode_filters(filters)}, timeout=None):
+            buffer += chunk
+
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+
+                if line.strip():
+                    yield json.loads(line.decode('utf-8'))
+
+    async def _request_json(self, method: str, path: str, params: dict = None, timeout: int = None):
+        body = b''
+
+        async for chunk in self._stream(method, path, params, timeout=timeout or self._timeout):
+            body += chunk
+
+        return json.loads(body.decode('utf-8')) if body.strip() else None
+
+    async def _stream(self, method: str, path: str, params: dict = None,
+                      timeout: typing.Union[int, None] = 0) -> typing.AsyncIterator[bytes]:
+        """ Sends a request and yields the response body. The connection is reused when whole body was read """
+
+        if timeout == 0:
+            timeout = self._timeout
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_connections)
+
+        async with self._semaphore:
+            reader, writer = await asyncio.wait_for(self._connect(), self._timeout)
+            completed = False
+
+            try:
+                response = await asyncio.wait_for(self._send(reader, writer, method, path, params), timeout)
+
+                if response.status >= 400:
+                    body = b''
+
+                    async for chunk in self._read_body(response, timeout):
+                        body += chunk
+
+                    raise self._create_error(response.status, body)
+
+                async for chunk in self._read_body(response, timeout):
+                    yield chunk
+
+                completed = response.keeps_alive
+
+            finally:
+                if completed:
+                    self._idle.append((reader, writer))
+                else:
+                    writer.close()
+
+    async def _connect(self) -> tuple:
+        while self._idle:
+            reader, writer = self._idle.pop()
+
+            if not writer.transport.is_closing() and not reader.at_eof():
+                return reader, writer
+
+        return await asyncio.open_unix_connection(self._socket_path)
+
+    async def _send(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                    params: dict) -> Response:
+        query = urllib.parse.urlencode(dict(filter(lambda item: item[1] is not None, (params or {}).items())))
+        url = '/v' + self._version + path + ('?' + query if query else '')
+
+        writer.write((method + ' ' + url + ' HTTP/1.1\r\n' +
+                      'Host: docker\r\n' +
+                      'Content-Length: 0\r\n' +
+                      'Connection: keep-alive\r\n\r\n').encode('utf-8'))
+        await writer.drain()
+
+        status_line = await reader.readline()
+
+        if not status_line:
+            raise ConnectionError('Docker closed the connection')
+
+        headers = {}
+
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+
+            if not line:
+                break
+
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+        return Response(method, int(status_line.split()[1]), headers, reader)
+
+    @staticmethod
+    async def _read_body(response: Response, timeout: typing.Union[int, None]) -> typing.AsyncIterator[bytes]:
+        reader = response.reader
+
+        if not response.has_body:
+            return
+
+        if response.is_chunked:
+            while True:
+                size = int((await asyncio.wait_for(reader.readline(), timeout)).split(b';')[0].strip(), 16)
+
+                if size == 0:
+                    # trailers end with an empty line
+                    while (await asyncio.wait_for(reader.readline(), timeout)).strip():
+                        pass
+
+                    return
+
+                # a single chunk can be huge, eg. a long log line
+                while size > 0:
+                    chunk = await asyncio.wait_for(reader.readexactly(min(size, 65536)), timeout)
+                    size -= len(chunk)
+                    yield chunk
+
+                await asyncio.wait_for(reader.readexactly(2), timeout)
+
+        elif 'content-length' in response.headers:
+            remaining = int(response.headers['content-length'])
+
+            while remaining > 0:
+                chunk = await asyncio.wait_for(reader.read(min(remaining, 65536)), timeout)
+
+                if not chunk:
+                    raise ConnectionError('Docker closed the connection before sending whole response')
+
+                remaining -= len(chunk)
+                yield chunk
+
+        elif response.is_closed_after_body:
+            while True:
+                chunk = await asyncio.wait_for(reader.read(65536), timeout)
+
+                if not chunk:
+                    return
+
+                yield chunk
+
+    @staticmethod
+    async def _demultiplex(stream: typing.AsyncIterator[bytes]) -> typing.AsyncIterator[bytes]:
+        """ Strips 8 bytes headers of stdout/stderr frames: [stream, 0, 0, 0, size (4 bytes, big endian)] """
+
+        header = b''
+        remaining = 0
+
+        async for chunk in stream:
+            while chunk:
+                if remaining > 0:
+                    payload = chunk[:remaining]
+                    chunk = chunk[len(payload):]
+                    remaining -= len(payload)
+
+                    yield payload
+                    continue
+
+                missing = 8 - len(header)
+                header, chunk = header + chunk[:missing], chunk[missing:]
+
+                if len(header) == 8:
+                    remaining = int.from_bytes(header[4:8], 'big')
+                    header = b''
+
+    @staticmethod
+    def _encode_filters(filters: typing.Union[dict, None]) -> typing.Union[str, None]:
+        if not filters:
+            return None
+
+        return json.dumps(dict(map(
+            lambda item: (item[0], item[1] if isinstance(item[1], list) else [item[1]]),
+            filters.items()
+        )))
+
+    @staticmethod
+    def _create_error(status: int, body: bytes) -> docker.errors.APIError:
+        try:
+            message = json.loads(body.decode('utf-8')).get('message', '')
+        except ValueError:
+            message = body.decode('utf-8', errors='replace')
+
+        if status == 404:
+            return docker.errors.NotFound(message)
+
+        return docker.errors.APIError(str(status) + ': ' + message)
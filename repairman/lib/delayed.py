@@ -0,0 +1,84 @@
+
+import heapq
+import itertools
+import threading
+import typing
+import tornado.log
+from .exception import WorkerPoolFull
+from .workers import WorkerPool
+from .time import Clock, system_clock
+
+
+class DelayedActionQueue:
+    """ Keeps actions planned for the future on a heap, due actions are passed to the WorkerPool.
+        Waiting actions do not occupy any thread.
+    """
+
+    _RETRY_WHEN_WORKERS_FULL = 1
+
+    _heap: list  # type: list[tuple]
+    _condition: threading.Condition
+    _workers: WorkerPool
+    _sequence: typing.Iterator[int]
+    _thread: threading.Thread
+    _clock: Clock
+
+    def __init__(self, workers: WorkerPool, clock: Clock = system_clock):
+        self._heap = []
+        self._condition = threading.Condition()
+        self._workers = workers
+        self._sequence = itertools.count()
+        self._clock = clock
+
+    def run(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def schedule(self, delay: float, key: str, action: typing.Callable):
+        """ Plans the action to be executed after a delay (in seconds). Key is a description, eg. container name """
+
+        with self._condition:
+            # sequence keeps the order of actions planned for the same time and avoids comparing the callables
+            heapq.heappush(self._heap, (self._clock.monotonic() + delay, next(self._sequence), key, action))
+            self._condition.notify()
+
+    def get_pending(self, limit: int = None) -> list:
+        """ Actions that are waiting, the nearest first """
+
+        with self._condition:
+            pending = heapq.nsmallest(limit if limit is not None else len(self._heap), self._heap)
+
+        now = self._clock.monotonic()
+
+        return list(map(lambda item: {'key': item[2], 'due_in': max(item[0] - now, 0)}, pending))
+
+    def count_pending(self) -> int:
+        with self._condition:
+            return len(self._heap)
+
+    def run_due(self) -> typing.Union[float, None]:
+        """ Submits all due actions, returns seconds to the next action """
+
+        with self._condition:
+            while self._heap and self._heap[0][0] <= self._clock.monotonic():
+                due_at, sequence, key, action = heapq.heappop(self._heap)
+
+                try:
+                    self._workers.submit(action)
+
+                except WorkerPoolFull:
+                    tornado.log.app_log.warn('No free workers to execute a delayed action for "' + key + '"')
+                    heapq.heappush(self._heap, (self._clock.monotonic() + self._RETRY_WHEN_WORKERS_FULL,
+                                                sequence, key, action))
+                    break
+
+            if not self._heap:
+                return None
+
+            return max(self._heap[0][0] - self._clock.monotonic(), 0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait(self.run_due())
@@ -1,4 +1,7 @@
 
+import collections
+import threading
+import typing
 from .exception import ConfigurationException
 
 
@@ -7,6 +10,7 @@ class Policy:
 
     _parent_policy: None  # type: ApplicationGlobalPolicy
     _params: dict
+    _validated: bool = False
     _types = {
         'seconds_between_restarts': int,
         'max_restarts_in_frame': int,
@@ -72,7 +76,7 @@ class Policy:
         return self._params['notify_level']
 
     def to_dict(self) -> dict:
-        return self._params
+        return dict(self._params)
 
     def _get_types(self) -> dict:
         return self._types
@@ -88,6 +92,10 @@ class Policy:
         return str(value)
 
     def validate(self):
+        # the policy is immutable, so it is enough to validate a shared instance once
+        if self._validated:
+            return
+
         if self._parent_policy:
             max_history = self._parent_policy.max_historic_entries
 
@@ -111,6 +119,46 @@ class Policy:
                                          ' least "' + str(proposed_min_frame_size) + '". ' +
                                          'Got "' + str(self.frame_size_in_seconds) + '"')
 
+        self._validated = True
+
+
+class PolicyCache:
+    """ Least recently used service policies. Containers having same labels share one immutable Policy """
+
+    _max_size: int
+    _policies: collections.OrderedDict
+    _stats: dict
+    _lock: threading.Lock
+
+    def __init__(self, max_size: int):
+        self._max_size = max_size
+        self._policies = collections.OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, create: typing.Callable[[], Policy]) -> Policy:
+        with self._lock:
+            if key in self._policies:
+                self._policies.move_to_end(key)
+                self._stats['hits'] += 1
+                return self._policies[key]
+
+            self._stats['misses'] += 1
+
+        policy = create()
+
+        with self._lock:
+            self._policies[key] = policy
+
+            while len(self._policies) > self._max_size:
+                self._policies.popitem(last=False)
+
+        return policy
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'size': len(self._policies)}
+
 
 class ApplicationGlobalPolicy(Policy):
     """ Policy/Settings for whole application. Defaults for each container.  """
@@ -119,12 +167,45 @@ class ApplicationGlobalPolicy(Policy):
         'debug': bool,
         'namespace': str,
         'max_historic_entries': int,
-        'db_path': str
+        'db_path': str,
+        'watch_events': bool,
+        'reconciliation_interval': int,
+        'snapshot_max_age': int,
+        'heal_interval': int,
+        'monitor_interval': int,
+        'deduplication_interval': int,
+        'workers': int,
+        'workers_queue_size': int,
+        'db_commit_interval': int,
+        'instrumentation': bool,
+        'instrumentation_log_interval': int,
+        'notify_timeout': int,
+        'notify_retries': int,
+        'notify_queue_size': int,
+        'notify_coalesce_window': int,
+        'notify_log_max_bytes': int,
+        'policy_cache_size': int,
+        'docker_hosts': str,
+        'docker_timeout': int,
+        'docker_driver': str,
+        'docker_socket': str
     }
 
+    _policy_cache: PolicyCache
+
     def __init__(self, params: dict):
         super().__init__(params)
         self.validate()
+        self._policy_cache = PolicyCache(self._params.get('policy_cache_size', 0))
+
+    def validate(self):
+        # zero workers would never heal anything, and a queue of zero size would be unlimited
+        for key in ['workers', 'workers_queue_size']:
+            if key in self._params and self._params[key] <= 0:
+                raise ConfigurationException(key.replace('_', '-') + ' should be positive, got "' +
+                                             str(self._params[key]) + '"')
+
+        super().validate()
 
     @property
     def debug(self) -> bool:
@@ -146,11 +227,114 @@ class ApplicationGlobalPolicy(Policy):
     def db_path(self) -> str:
         return self._params['db_path']
 
+    @property
+    def db_commit_interval(self) -> int:
+        return self._params['db_commit_interval']
+
+    @property
+    def notify_timeout(self) -> int:
+        return self._params['notify_timeout']
+
+    @property
+    def notify_retries(self) -> int:
+        return self._params['notify_retries']
+
+    @property
+    def notify_queue_size(self) -> int:
+        return self._params['notify_queue_size']
+
+    @property
+    def notify_coalesce_window(self) -> int:
+        return self._params['notify_coalesce_window']
+
+    @property
+    def notify_log_max_bytes(self) -> int:
+        return self._params['notify_log_max_bytes']
+
+    @property
+    def docker_hosts(self) -> dict:
+        """ "web-1=tcp://10.0.0.1:2376,tcp://10.0.0.2:2376" -> {"web-1": "tcp://10.0.0.1:2376", ...} """
+
+        hosts = {}
+
+        for entry in filter(None, map(str.strip, self._params['docker_hosts'].split(','))):
+            name, url = entry.split('=', 1) if '=' in entry else (entry, entry)
+            hosts[name.strip()] = url.strip()
+
+        return hosts
+
+    @property
+    def docker_timeout(self) -> int:
+        return self._params['docker_timeout']
+
+    @property
+    def docker_driver(self) -> str:
+        return self._params['docker_driver']
+
+    @property
+    def docker_socket(self) -> str:
+        return self._params['docker_socket']
+
+    @property
+    def instrumentation(self) -> bool:
+        return self._params['instrumentation']
+
+    @property
+    def instrumentation_log_interval(self) -> int:
+        return self._params['instrumentation_log_interval']
+
+    @property
+    def watch_events(self) -> bool:
+        return self._params['watch_events']
+
+    @property
+    def reconciliation_interval(self) -> int:
+        return self._params['reconciliation_interval']
+
+    @property
+    def snapshot_max_age(self) -> int:
+        return self._params['snapshot_max_age']
+
+    @property
+    def heal_interval(self) -> int:
+        """ When watching events, then the periodic check is only a reconciliation """
+
+        if self.watch_events:
+            return self.reconciliation_interval
+
+        return self._params['heal_interval'] or self.interval
+
+    @property
+    def monitor_interval(self) -> int:
+        return self._params['monitor_interval'] or self.interval
+
+    @property
+    def deduplication_interval(self) -> int:
+        return self._params['deduplication_interval'] or self.interval
+
+    @property
+    def workers(self) -> int:
+        return self._params['workers']
+
+    @property
+    def workers_queue_size(self) -> int:
+        return self._params['workers_queue_size']
+
+    @property
+    def policy_cache(self) -> PolicyCache:
+        return self._policy_cache
+
     def create_service_policy(self, modified_params: dict) -> Policy:
         """ Create a regular Policy object for container mixing default values from ApplicationGlobalPolicy
-            and applying modifications from container labels/environment or from other source
+            and applying modifications from container labels/environment or from other source.
+            The global policy is immutable, so same modifications always result in the same Policy
         """
 
+        key = tuple(sorted(map(lambda item: (item[0], str(item[1])), modified_params.items())))
+
+        return self._policy_cache.get(key, lambda: self._create_service_policy(modified_params))
+
+    def _create_service_policy(self, modified_params: dict) -> Policy:
         new_params = {}
 
         for key, value in self._params.items():
@@ -178,19 +362,33 @@ class Container:
     _exit_code: int
     _created_at: str
     _policy: Policy
+    _host: str
 
-    def __init__(self, name: str, status: str, exit_code: int, created_at: str, policy: Policy):
+    def __init__(self, name: str, status: str, exit_code: int, created_at: str, policy: Policy, host: str = ''):
         self._name = name
         self._status = status
         self._exit_code = exit_code
         self._created_at = created_at
         self._policy = policy
+        self._host = host
 
     def get_name(self) -> str:
         return self._name
 
+    def get_host(self) -> str:
+        """ Name of the Docker daemon, empty when only one daemon is supervised """
+        return self._host
+
+    def get_exit_code(self) -> int:
+        return self._exit_code
+
     def identify(self) -> str:
-        return self.get_name()
+        """ Unique between all supervised Docker daemons, eg. "web-1/iwa_app" """
+
+        if self._host:
+            return self._host + '/' + self._name
+
+        return self._name
 
     def is_healthy(self):
         return self._status in ['healthy', 'running']
@@ -8,6 +8,10 @@ class ContainerIsLocked(ProcessingException):
     pass
 
 
+class WorkerPoolFull(ProcessingException):
+    pass
+
+
 class ConfigurationException(Exception):
     pass
 
@@ -1,14 +1,21 @@
-
 import tornado.ioloop
 import tornado.web
+import concurrent.futures
 import json
-import typing
 import threading
 import asyncio
+from .summary import SummaryCache, RenderedSummary
+from . import metrics
+from .instrumentation import instrumentation
 
 
 class MainHandler(tornado.web.RequestHandler):  # pragma: no cover
-    callback: typing.Callable
+    """ Serves summary from cache immediately, or renders it in the executor without blocking the IOLoop """
+
+    summary: SummaryCache
+    executor: concurrent.futures.ThreadPoolExecutor
+    semaphore: asyncio.Semaphore
+    timeout: int
 
     def _get_limit(self) -> int:
         limit = int(self.get_query_argument('limit', '20'))
@@ -18,14 +25,62 @@ class MainHandler(tornado.web.RequestHandler):  # pragma: no cover
 
         return limit
 
+    async def get(self):
+        limit = self._get_limit()
+        summary = MainHandler.summary.find_fresh(limit)
+
+        if not summary:
+            try:
+                summary = await self._render(limit)
+
+            except asyncio.TimeoutError:
+                summary = RenderedSummary(503, json.dumps({
+                    'error': 'Summary was not generated in ' + str(MainHandler.timeout) + 's'
+                }).encode('utf-8'))
+
+        self.set_status(summary.status)
+        self.add_header('Content-Type', 'application/json')
+        self.write(summary.body)
+
+    async def _render(self, limit: int) -> RenderedSummary:
+        """ At most --http-max-concurrency summaries are rendered at once, the rest waits up to --http-timeout """
+
+        loop = asyncio.get_event_loop()
+        deadline = loop.time() + MainHandler.timeout
+
+        await asyncio.wait_for(MainHandler.semaphore.acquire(), MainHandler.timeout)
+
+        future = MainHandler.executor.submit(MainHandler.summary.get, limit)
+
+        # the slot is freed when the rendering really ends, even if the client is not waiting anymore
+        future.add_done_callback(lambda f: loop.call_soon_threadsafe(MainHandler.semaphore.release))
+
+        return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0))
+
+    def data_received(self, chunk):
+        pass
+
+
+class MetricsHandler(tornado.web.RequestHandler):  # pragma: no cover
+    """ Prometheus text exposition format, rendered from memory """
+
     def get(self):
-        result = MainHandler.callback(self._get_limit())
+        self.add_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(metrics.registry.render())
 
-        self.set_status(500 if not result['global_status'] else 200)
+    def data_received(self, chunk):
+        pass
+
+
+class TimingsHandler(tornado.web.RequestHandler):  # pragma: no cover
+    """ Timings of hot-path operations collected when --instrumentation is enabled """
+
+    def get(self):
         self.add_header('Content-Type', 'application/json')
-        self.write(
-            json.dumps(result, sort_keys=True, indent=4, separators=(',', ': '))
-        )
+        self.write(json.dumps({
+            'enabled': instrumentation.enabled,
+            'operations': instrumentation.get_stats()
+        }, sort_keys=True, indent=4, separators=(',', ': ')))
 
     def data_received(self, chunk):
         pass
@@ -35,24 +90,38 @@ class HttpServer:  # pragma: no cover
     _port: int
     _path_prefix: str
     _address: str
+    _timeout: int
+    _max_concurrency: int
+    _loop: asyncio.AbstractEventLoop
     _thread: threading.Thread
 
-    def __init__(self, address: str, port: int, server_path_prefix: str):
+    def __init__(self, address: str, port: int, server_path_prefix: str, timeout: int, max_concurrency: int,
+                 loop: asyncio.AbstractEventLoop):
         self._port = port
         self._address = address
         self._path_prefix = server_path_prefix
+        self._timeout = timeout
+        self._max_concurrency = max_concurrency
+        self._loop = loop
 
-    def run(self, callback: typing.Callable):
-        self._thread = threading.Thread(target=lambda: self._run(callback))
+    def run(self, summary: SummaryCache):
+        self._thread = threading.Thread(target=lambda: self._run(summary))
         self._thread.setDaemon(True)
         self._thread.start()
 
-    def _run(self, callback: typing.Callable):
-        MainHandler.callback = callback
-
-        loop = asyncio.new_event_loop()
+    def _run(self, summary: SummaryCache):
+        loop = self._loop
         asyncio.set_event_loop(loop)
 
-        srv = tornado.web.Application([(r"" + self._path_prefix + "/", MainHandler)])
+        MainHandler.summary = summary
+        MainHandler.timeout = self._timeout
+        MainHandler.executor = concurrent.futures.ThreadPoolExecutor(max_workers=self._max_concurrency)
+        MainHandler.semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        srv = tornado.web.Application([
+            (r"" + self._path_prefix + "/", MainHandler),
+            (r"" + self._path_prefix + "/metrics", MetricsHandler),
+            (r"" + self._path_prefix + "/timings", TimingsHandler)
+        ])
         srv.listen(self._port, self._address)
         loop.run_forever()
@@ -0,0 +1,133 @@
+
+import collections
+import json
+import threading
+import time
+import typing
+import tornado.log
+
+
+class OperationStats:
+    """ Aggregated timings of a single operation, percentiles are calculated from the recent samples """
+
+    _MAX_SAMPLES = 1024
+
+    count: int
+    total: float
+    max: float
+    _samples: collections.deque
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples = collections.deque(maxlen=self._MAX_SAMPLES)
+
+    def record(self, duration: float):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self._samples.append(duration)
+
+    def to_dict(self) -> dict:
+        samples = sorted(self._samples)
+
+        return {
+            'count': self.count,
+            'total': self.total,
+            'p50': self._percentile(samples, 0.50),
+            'p99': self._percentile(samples, 0.99),
+            'max': self.max
+        }
+
+    @staticmethod
+    def _percentile(samples: list, percentile: float) -> float:
+        if not samples:
+            return 0.0
+
+        return samples[min(int(len(samples) * percentile), len(samples) - 1)]
+
+
+class Span:
+    """ Measures the time of a "with" block, optionally observes it also in a metrics histogram """
+
+    _instrumentation: 'Instrumentation'
+    _operation: str
+    _histogram: typing.Any
+    _labels: typing.Union[dict, None]
+    _started_at: float
+
+    def __init__(self, instrumentation: 'Instrumentation', operation: str, histogram=None, labels: dict = None):
+        self._instrumentation = instrumentation
+        self._operation = operation
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._started_at = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.monotonic() - self._started_at
+
+        if self._histogram is not None:
+            self._histogram.observe(duration, self._labels)
+
+        if self._instrumentation.enabled:
+            self._instrumentation.record(self._operation, duration)
+
+
+class NoopSpan:
+    """ Used when the instrumentation is disabled and there is no histogram to feed """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+class Instrumentation:
+    """ Collects timings of hot-path operations, eg. Docker API calls, journal queries, waiting for locks """
+
+    _NOOP_SPAN = NoopSpan()
+
+    enabled: bool
+    _operations: dict  # type: dict[str, OperationStats]
+    _lock: threading.Lock
+    _thread: threading.Thread
+
+    def __init__(self):
+        self.enabled = False
+        self._operations = {}
+        self._lock = threading.Lock()
+
+    def span(self, operation: str, histogram=None, labels: dict = None):
+        if not self.enabled and histogram is None:
+            return self._NOOP_SPAN
+
+        return Span(self, operation, histogram, labels)
+
+    def record(self, operation: str, duration: float):
+        with self._lock:
+            if operation not in self._operations:
+                self._operations[operation] = OperationStats()
+
+            self._operations[operation].record(duration)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return dict(map(lambda item: (item[0], item[1].to_dict()), self._operations.items()))
+
+    def run_log_dump(self, interval: int):
+        self._thread = threading.Thread(target=lambda: self._dump_periodically(interval))
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _dump_periodically(self, interval: int):
+        while True:
+            time.sleep(interval)
+            tornado.log.app_log.info('Timings: ' + json.dumps(self.get_stats(), sort_keys=True))
+
+
+instrumentation = Instrumentation()
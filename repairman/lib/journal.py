@@ -2,6 +2,10 @@
 
 from .entity import Container
 from .entity import ApplicationGlobalPolicy
+from . import metrics
+from .instrumentation import instrumentation
+from .time import Clock, system_clock
+import collections
 import sqlite3
 import threading
 import typing
@@ -15,122 +19,190 @@ class Journal:
     _EVENT_TYPE_MAX_RESTARTS = 'restart.max-reached'
     _EVENT_TYPE_DNT = 'do-not-touch-anymore'
 
+    _SCHEMA_VERSION = 2
+
+    # each container takes 3 variables in the query, SQLite allows 999 by default
+    _SUMMARY_BATCH_SIZE = 300
+
     db: sqlite3.Connection
     cur: sqlite3.Cursor
     app_policy: ApplicationGlobalPolicy
     lock: threading.Lock
-
-    def __init__(self, policy: ApplicationGlobalPolicy):
+    _uncommitted: bool
+    _revision: int
+    _committer: threading.Thread
+    _closing: threading.Event
+    _histories: dict  # type: dict[str, ContainerHistory]
+    _histories_lock: threading.Lock
+    _clock: Clock
+
+    def __init__(self, policy: ApplicationGlobalPolicy, clock: Clock = system_clock):
+        self._clock = clock
         self.db = sqlite3.connect(policy.db_path, check_same_thread=False)
         self.app_policy = policy
         self.cur = self.db.cursor()
         self.lock = threading.Lock()
+        self._uncommitted = False
+        self._revision = 0
+        self._histories = {}
+        self._histories_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._committer = None
+
+        if policy.db_path != ':memory:':
+            # readers do not block the writer, and the file is synced only on checkpoints instead of each commit
+            self.__query('PRAGMA journal_mode=WAL')
+            self.__query('PRAGMA synchronous=NORMAL')
+
         self._migrate()
+        self.flush()
+        self._load_histories()
 
-    def _find_events(self, container_name: str, event_type: str, time_modifier_to_start_from: str,
-                     archived: bool = False) -> list:
+        if policy.db_commit_interval > 0:
+            self._committer = threading.Thread(target=self._commit_periodically)
+            self._committer.setDaemon(True)
+            self._committer.start()
 
-        archived_str = ''
+    def get_revision(self) -> int:
+        """ Changes after each write """
+        return self._revision
 
-        if not archived:
-            archived_str = 'AND archived is null'
+    def flush(self):
+        """ Commits all writes made since last commit in one transaction """
 
-        result = self._fetch_all(
-            '''
-                SELECT datetime(event_date, 'localtime'), datetime(datetime("now", ?), 'localtime'), journal.*
-                FROM journal 
-                WHERE 
-                    event_type = ?
-                    AND datetime(event_date, 'localtime') >= datetime(datetime("now", ?), 'localtime')
-                    AND container_name = ?
-                    ''' + archived_str + '''
-            ''',
-            [
-                time_modifier_to_start_from,
-                event_type,
-                time_modifier_to_start_from,
-                container_name
-            ]
-        )
+        self._acquire_lock()
 
-        tornado.log.app_log.debug('_find_events(' + container_name + ', ' + event_type + ', ' +
-                                  time_modifier_to_start_from + ')')
-        tornado.log.app_log.debug(str(result))
+        try:
+            if self._uncommitted:
+                self.db.commit()
+                self._uncommitted = False
+        finally:
+            self.lock.release()
 
-        return result
+    def close(self):
+        """ Stops the periodic commits, commits what is left and closes the database """
 
-    def get_total_restart_count_in_all_frames(self, container: Container) -> int:
-        result = self._fetch_one(
-            '''
-                SELECT COUNT(id)
-                FROM journal
-                WHERE 
-                    container_name = ? AND event_type = ?
-            ''',
-            [
-                container.get_name(), self._EVENT_TYPE_RESTART
-            ]
-        )
+        if self._closing.is_set():
+            return
 
-        return int(result[0])
+        self._closing.set()
+
+        if self._committer:
+            self._committer.join()
+
+        self.flush()
+        self.db.close()
+
+    def _commit_periodically(self):
+        while not self._closing.wait(self.app_policy.db_commit_interval):
+            self.flush()
+
+    def get_total_restart_count_in_all_frames(self, container: Container) -> int:
+        return self._get_history(container).count_restarts()
 
     def find_restart_count_in_frame(self, container: Container) -> int:
-        return len(self._find_events(container.get_name(), self._EVENT_TYPE_RESTART,
-                   '-' + str(container.policy.frame_size_in_seconds) + ' seconds'))
+        return self._get_history(container).count_restarts_since(
+            int(self._clock.time()) - container.policy.frame_size_in_seconds)
 
     def find_reached_max_restarts_in_previous_frame(self, container: Container) -> bool:
-        return len(self._find_events(container.get_name(), self._EVENT_TYPE_MAX_RESTARTS,
-                   '-' + str(container.policy.frame_size_in_seconds * 2) + ' seconds', archived=True)) > 0
+        return self._get_history(container).has_reached_max_restarts_since(
+            int(self._clock.time()) - container.policy.frame_size_in_seconds * 2)
 
     def find_last_restart_time(self, container: Container) -> int:
-        result = self._fetch_one(
+        return self._get_history(container).get_last_restart_time()
+
+    def forget_histories_except(self, containers: list):
+        """ Removes in-memory histories of containers that are gone. The database keeps their events,
+            the history is loaded again when the container comes back
+        """
+
+        listed = set(map(lambda container: container.identify(), containers))
+
+        with self._histories_lock:
+            for name in list(self._histories.keys()):
+                if name not in listed:
+                    del self._histories[name]
+
+    def _get_history(self, container: Container) -> 'ContainerHistory':
+        with self._histories_lock:
+            if container.identify() not in self._histories:
+                self._histories[container.identify()] = self._load_history(container.identify())
+
+            return self._histories[container.identify()]
+
+    def _load_history(self, container_name: str) -> 'ContainerHistory':
+        history = ContainerHistory(self.app_policy.max_historic_entries + 1)
+        rows = self._fetch_all('SELECT event_type, event_ts, archived FROM journal WHERE container_name = ? ' +
+                               'ORDER BY id', [container_name])
+
+        for event_type, event_ts, archived in rows:
+            history.append(event_type, int(event_ts), bool(archived))
+
+        return history
+
+    def _load_histories(self):
+        """ Rebuilds in-memory histories from the database, which is only a persistence for them """
+
+        rows = self._fetch_all('SELECT container_name, event_type, event_ts, archived FROM journal ORDER BY id')
+
+        for container_name, event_type, event_ts, archived in rows:
+            if container_name not in self._histories:
+                self._histories[container_name] = ContainerHistory(self.app_policy.max_historic_entries + 1)
+
+            self._histories[container_name].append(event_type, int(event_ts), bool(archived))
+
+    def _migrate(self):
+        """ Creates or upgrades the schema, the version is kept in "user_version" of the database file """
+
+        version = int(self._fetch_one('PRAGMA user_version')[0])
+
+        if version >= self._SCHEMA_VERSION:
+            return
+
+        self._exec(
+            '''
+                CREATE TABLE IF NOT EXISTS journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    container_name TEXT, 
+                    event_type TEXT, 
+                    event_date TEXT, 
+                    message TEXT,
+                    archived BOOLEAN
+                );
             '''
-                SELECT strftime("%s", event_date)
-                FROM journal
-                WHERE
-                    event_type = ?
-                    AND container_name = ?
-                ORDER BY id DESC
-                LIMIT 0, 1
-            ''',
-            [self._EVENT_TYPE_RESTART, container.get_name()]
         )
 
-        if not result:
-            return 0
+        # version 1: unix timestamps instead of comparing dates formatted as text, indexed per container
+        columns = list(map(lambda row: row[1], self._fetch_all('PRAGMA table_info(journal)')))
 
-        return int(result[0])
+        if 'event_ts' not in columns:
+            self._exec('ALTER TABLE journal ADD COLUMN event_ts INTEGER')
+            self._exec('UPDATE journal SET event_ts = CAST(strftime("%s", event_date) AS INTEGER)')
 
-    def _migrate(self):
-        try:
-            self._exec(
-                '''
-                    CREATE TABLE journal (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        container_name TEXT, 
-                        event_type TEXT, 
-                        event_date TEXT, 
-                        message TEXT,
-                        archived BOOLEAN
-                    );
-                '''
-            )
-        except sqlite3.OperationalError:
-            # the table can already exist in case, when the database file is persistable
-            pass
+        self._exec(
+            '''
+                CREATE INDEX IF NOT EXISTS journal_container_event_ts
+                ON journal (container_name, event_type, event_ts)
+            '''
+        )
+
+        # version 2: rotation looks up newest events of a container
+        self._exec('CREATE INDEX IF NOT EXISTS journal_container_id ON journal (container_name, id)')
+
+        self._exec('PRAGMA user_version = ' + str(self._SCHEMA_VERSION))
 
     def _rotate_events(self, container: Container):
         self._exec(
             '''
                 DELETE FROM journal WHERE container_name = ?
-                AND id not in (
+                AND id <= (
                     SELECT id FROM journal WHERE container_name = ?
-                    ORDER BY id DESC LIMIT 0, ?
+                    ORDER BY id DESC LIMIT 1 OFFSET ?
                 )
             ''',
             [
-                container.get_name(),
-                container.get_name(),
+                container.identify(),
+                container.identify(),
                 self.app_policy.max_historic_entries
             ]
         )
@@ -147,13 +219,14 @@ class Journal:
 
     def _find_failing(self, containers: list) -> list:
         failing = []
+        containers = list(filter(lambda c: c.policy.max_restarts_in_frame != 0, containers))
+        frames = {}
 
-        for container in containers:
-            if container.policy.max_restarts_in_frame == 0:
-                continue
+        for offset in range(0, len(containers), self._SUMMARY_BATCH_SIZE):
+            frames.update(self._find_frame_statistics(containers[offset:offset + self._SUMMARY_BATCH_SIZE]))
 
-            restart_count_in_frame = self.find_restart_count_in_frame(container)
-            reached_max_restarts_in_previous_frame = self.find_reached_max_restarts_in_previous_frame(container)
+        for container in containers:
+            restart_count_in_frame, reached_max_restarts_in_previous_frame = frames[container.identify()]
 
             # first condition: now already reached max restarts in frame
             # second condition: still failing, whole previous frame failed, in current frame we have at least
@@ -162,14 +235,61 @@ class Journal:
             if restart_count_in_frame > container.policy.max_restarts_in_frame \
                     or (restart_count_in_frame > 0 and reached_max_restarts_in_previous_frame):
                 failing.append({
-                    'id': container.get_name(),
-                    'ident': container.get_name() + '=False',
+                    'id': container.identify(),
+                    'ident': container.identify() + '=False',
                     'restarts_in_current_frame': restart_count_in_frame,
                     'reached_max_in_previous_frame': reached_max_restarts_in_previous_frame
                 })
 
         return failing
 
+    def _find_frame_statistics(self, containers: list) -> dict:
+        """ For each container: count of restarts in current frame and if the max restarts were reached
+            in the previous frame. One grouped query for all containers, each container has its own frame size
+        """
+
+        if not containers:
+            return {}
+
+        now = int(self._clock.time())
+        frames = []
+
+        for container in containers:
+            frames += [
+                container.identify(),
+                now - container.policy.frame_size_in_seconds,
+                now - container.policy.frame_size_in_seconds * 2
+            ]
+
+        rows = self._fetch_all(
+            '''
+                WITH frames (container_name, frame_start, previous_frame_start) AS (
+                    VALUES ''' + ', '.join(['(?, ?, ?)'] * len(containers)) + '''
+                )
+                SELECT
+                    frames.container_name,
+                    COALESCE(SUM(
+                        journal.event_type = ? AND journal.archived IS NULL
+                        AND journal.event_ts >= frames.frame_start
+                    ), 0),
+                    COALESCE(MAX(journal.event_type = ?), 0)
+                FROM frames
+                LEFT JOIN journal
+                    ON journal.container_name = frames.container_name
+                    AND journal.event_type IN (?, ?)
+                    AND journal.event_ts >= frames.previous_frame_start
+                GROUP BY frames.container_name
+            ''',
+            frames + [
+                self._EVENT_TYPE_RESTART,
+                self._EVENT_TYPE_MAX_RESTARTS,
+                self._EVENT_TYPE_RESTART,
+                self._EVENT_TYPE_MAX_RESTARTS
+            ]
+        )
+
+        return dict(map(lambda row: (row[0], (int(row[1]), bool(row[2]))), rows))
+
     def _find_last_events(self, limit: int = 20):
         events = self._fetch_all(
             '''
@@ -195,35 +315,27 @@ class Journal:
         ))
 
     def find_is_marked_as_not_touch(self, container: Container):
-        events = self._fetch_one(
-            '''
-                SELECT COUNT(id)
-                FROM journal
-                WHERE 
-                    container_name = ? AND event_type = ?
-            ''',
-            [
-                container.get_name(), self._EVENT_TYPE_DNT
-            ]
-        )
-
-        return int(events[0]) > 0
+        return self._get_history(container).is_marked_as_not_touch()
 
     def clear_all_container_history(self, container: Container):
         self._exec(
             '''
                 DELETE FROM journal WHERE container_name = ?
             ''',
-            [container.get_name()]
+            [container.identify()]
         )
 
+        with self._histories_lock:
+            self._histories.pop(container.identify(), None)
+
     def _mark_all_events_as_archived(self, container: Container):
         self._exec(
             '''
                 UPDATE journal SET archived = 1 WHERE container_name = ?
             ''',
-            [container.get_name()]
+            [container.identify()]
         )
+        self._get_history(container).archive()
 
     def record_max_restarts_reached_and_waited(self, container: Container):
         self._mark_all_events_as_archived(container)
@@ -244,18 +356,29 @@ class Journal:
         self._record_event(container, self._EVENT_TYPE_RESTART, 'Container was restarted')
 
     def _record_event(self, container: Container, event_type: str, message: str):
+        now = int(self._clock.time())
+        # taken before the insert, a history loaded from the database after it would contain the event twice
+        history = self._get_history(container)
+
         self._rotate_events(container)
         self._exec(
             '''
-                INSERT INTO journal (container_name, event_type, event_date, message)
-                VALUES (?, ?, datetime('now'), ?);
+                INSERT INTO journal (container_name, event_type, event_date, event_ts, message)
+                VALUES (?, ?, datetime(?, 'unixepoch'), ?, ?);
             ''',
             [
-                container.get_name(),
+                container.identify(),
                 event_type,
+                now,
+                now,
                 message
             ]
         )
+        history.append(event_type, now)
+
+    def _acquire_lock(self):
+        with instrumentation.span('journal.lock_wait'):
+            self.lock.acquire()
 
     def __query(self, sql: str, params=None) -> sqlite3.Cursor:
         if params is None:
@@ -265,31 +388,127 @@ class Journal:
 
         # tornado.log.app_log.debug(sql)
 
-        self.db.commit()
-
         return exec_sql
 
     def _exec(self, sql: str, params=None) -> None:
-        self.lock.acquire()
+        """ Writes are committed in groups every --db-commit-interval seconds, or immediately when it is 0 """
+
+        self._acquire_lock()
         try:
-            self.__query(sql, params)
+            with instrumentation.span('journal.exec', metrics.JOURNAL_QUERY_DURATION, {'operation': 'exec'}):
+                self.__query(sql, params)
+
+            self._revision += 1
+
+            if self.app_policy.db_commit_interval > 0:
+                self._uncommitted = True
+            else:
+                self.db.commit()
         finally:
             self.lock.release()
 
     def _fetch_one(self, sql: str, params=None):
-        self.lock.acquire()
+        self._acquire_lock()
 
         try:
-            result = self.__query(sql, params).fetchone()
+            with instrumentation.span('journal.fetch_one', metrics.JOURNAL_QUERY_DURATION, {'operation': 'fetch_one'}):
+                result = self.__query(sql, params).fetchone()
         finally:
             self.lock.release()
 
         return result
 
     def _fetch_all(self, sql: str, params=None):
-        self.lock.acquire()
+        self._acquire_lock()
 
-        result = self.__query(sql, params).fetchall()
-        self.lock.release()
+        try:
+            with instrumentation.span('journal.fetch_all', metrics.JOURNAL_QUERY_DURATION, {'operation': 'fetch_all'}):
+                result = self.__query(sql, params).fetchall()
+        finally:
+            self.lock.release()
 
         return result
+
+
+class ContainerHistory:
+    """ Recent events of a single container kept in memory, mirrors the rows that survive the rotation in journal table.
+        Counters are updated on write, so the healing decisions do not need to query the database.
+    """
+
+    _events: collections.deque  # type: collections.deque[list]
+    _max_events: int
+    _restarts: collections.deque  # type: collections.deque[int]
+    _not_archived_restarts: collections.deque  # type: collections.deque[int]
+    _max_restarts_reached: collections.deque  # type: collections.deque[int]
+    _do_not_touch_count: int
+    _lock: threading.Lock
+
+    def __init__(self, max_events: int):
+        self._events = collections.deque()
+        self._max_events = max_events
+        self._restarts = collections.deque()
+        self._not_archived_restarts = collections.deque()
+        self._max_restarts_reached = collections.deque()
+        self._do_not_touch_count = 0
+        self._lock = threading.Lock()
+
+    def append(self, event_type: str, event_ts: int, archived: bool = False):
+        with self._lock:
+            if len(self._events) >= self._max_events:
+                self._forget_oldest()
+
+            self._events.append([event_type, event_ts, archived])
+
+            if event_type == Journal._EVENT_TYPE_RESTART:
+                self._restarts.append(event_ts)
+
+                if not archived:
+                    self._not_archived_restarts.append(event_ts)
+
+            elif event_type == Journal._EVENT_TYPE_MAX_RESTARTS:
+                self._max_restarts_reached.append(event_ts)
+
+            elif event_type == Journal._EVENT_TYPE_DNT:
+                self._do_not_touch_count += 1
+
+    def archive(self):
+        with self._lock:
+            for event in self._events:
+                event[2] = True
+
+            self._not_archived_restarts.clear()
+
+    def count_restarts(self) -> int:
+        return len(self._restarts)
+
+    def count_restarts_since(self, since_ts: int) -> int:
+        """ Not archived restarts, there are at most --max-historic-entries of them """
+
+        with self._lock:
+            return len(list(filter(lambda event_ts: event_ts >= since_ts, self._not_archived_restarts)))
+
+    def has_reached_max_restarts_since(self, since_ts: int) -> bool:
+        with self._lock:
+            return any(map(lambda event_ts: event_ts >= since_ts, self._max_restarts_reached))
+
+    def get_last_restart_time(self) -> int:
+        with self._lock:
+            return max(self._restarts) if self._restarts else 0
+
+    def is_marked_as_not_touch(self) -> bool:
+        return self._do_not_touch_count > 0
+
+    def _forget_oldest(self):
+        event_type, event_ts, archived = self._events.popleft()
+
+        if event_type == Journal._EVENT_TYPE_RESTART:
+            self._restarts.popleft()
+
+            if not archived:
+                self._not_archived_restarts.popleft()
+
+        elif event_type == Journal._EVENT_TYPE_MAX_RESTARTS:
+            self._max_restarts_reached.popleft()
+
+        elif event_type == Journal._EVENT_TYPE_DNT:
+            self._do_not_touch_count -= 1
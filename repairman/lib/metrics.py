@@ -0,0 +1,201 @@
+
+import bisect
+import contextlib
+import threading
+import time
+import typing
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: str = '') -> str:
+    labels = list(map(
+        lambda pair: pair[0] + '="' + str(pair[1]).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"',
+        zip(label_names, label_values)
+    ))
+
+    if extra:
+        labels.append(extra)
+
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """ Base of a metric with labels, rendered in Prometheus text exposition format """
+
+    _type = 'untyped'
+
+    name: str
+    description: str
+    label_names: tuple
+    _lock: threading.Lock
+
+    def __init__(self, name: str, description: str, label_names: list = None):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names or [])
+        self._lock = threading.Lock()
+
+    def render(self) -> list:
+        return ['# HELP ' + self.name + ' ' + self.description, '# TYPE ' + self.name + ' ' + self._type] + \
+               self._render_samples()
+
+    def _render_samples(self) -> list:
+        return []
+
+    def _get_label_values(self, labels: typing.Union[dict, None]) -> tuple:
+        labels = labels or {}
+        return tuple(map(lambda name: labels.get(name, ''), self.label_names))
+
+
+class Counter(Metric):
+    _type = 'counter'
+    _values: dict
+
+    def __init__(self, name: str, description: str, label_names: list = None):
+        super().__init__(name, description, label_names)
+        self._values = {}
+
+    def inc(self, labels: dict = None, value: float = 1):
+        key = self._get_label_values(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def _render_samples(self) -> list:
+        with self._lock:
+            values = dict(self._values)
+
+        return list(map(
+            lambda item: self.name + _format_labels(self.label_names, item[0]) + ' ' + _format_value(item[1]),
+            sorted(values.items())
+        ))
+
+
+class Gauge(Metric):
+    """ Value is read at the moment of rendering.
+        The callback returns a value, or a dict of label values tuple => value
+    """
+
+    _type = 'gauge'
+    _callback: typing.Callable
+
+    def __init__(self, name: str, description: str, callback: typing.Callable, label_names: list = None):
+        super().__init__(name, description, label_names)
+        self._callback = callback
+
+    def _render_samples(self) -> list:
+        values = self._callback()
+
+        if not isinstance(values, dict):
+            values = {(): values}
+
+        return list(map(
+            lambda item: self.name + _format_labels(self.label_names, item[0]) + ' ' + _format_value(item[1]),
+            sorted(values.items())
+        ))
+
+
+class Histogram(Metric):
+    _type = 'histogram'
+    _DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    buckets: tuple
+    _values: dict  # type: dict[tuple, list]
+
+    def __init__(self, name: str, description: str, label_names: list = None, buckets: tuple = _DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+
+    def observe(self, value: float, labels: dict = None):
+        key = self._get_label_values(labels)
+
+        with self._lock:
+            if key not in self._values:
+                # counts per bucket (the last one is +Inf), sum, count
+                self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+            counts = self._values[key]
+            counts[0][bisect.bisect_left(self.buckets, value)] += 1
+            counts[1] += value
+            counts[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, labels: dict = None):
+        started_at = time.monotonic()
+
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started_at, labels)
+
+    def _render_samples(self) -> list:
+        with self._lock:
+            values = dict(map(lambda item: (item[0], [list(item[1][0]), item[1][1], item[1][2]]),
+                              self._values.items()))
+
+        lines = []
+
+        for label_values, (counts, total, count) in sorted(values.items()):
+            cumulative = 0
+
+            for bound, bucket_count in zip(list(map(_format_value, self.buckets)) + ['+Inf'], counts):
+                cumulative += bucket_count
+                bucket_labels = _format_labels(self.label_names, label_values, 'le="' + bound + '"')
+                lines.append(self.name + '_bucket' + bucket_labels + ' ' + str(cumulative))
+
+            lines.append(self.name + '_sum' + _format_labels(self.label_names, label_values) + ' ' + repr(total))
+            lines.append(self.name + '_count' + _format_labels(self.label_names, label_values) + ' ' + str(count))
+
+        return lines
+
+
+class Registry:
+    _metrics: list  # type: list[Metric]
+    _lock: threading.Lock
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            self._metrics = list(filter(lambda registered: registered.name != metric.name, self._metrics)) + [metric]
+
+        return metric
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in list(self._metrics):
+            lines += metric.render()
+
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+RESTARTS = registry.register(Counter(
+    'repairman_container_restarts_total', 'Containers restarted by Repairman', ['host', 'container']))
+REMOVALS = registry.register(Counter(
+    'repairman_container_removals_total', 'Duplicated containers removed by Repairman', ['host', 'container']))
+NOTIFICATIONS = registry.register(Counter(
+    'repairman_notifications_total', 'Notifications sent about a container', ['container']))
+CONFIGURATION_ERRORS = registry.register(Counter(
+    'repairman_configuration_errors_total', 'Containers that could not be monitored due to invalid labels',
+    ['container']))
+
+SCAN_DURATION = registry.register(Histogram(
+    'repairman_scan_duration_seconds', 'Time of a single run of a periodic task', ['task']))
+DOCKER_API_DURATION = registry.register(Histogram(
+    'repairman_docker_api_duration_seconds', 'Latency of calls to the Docker API', ['operation']))
+JOURNAL_QUERY_DURATION = registry.register(Histogram(
+    'repairman_journal_query_duration_seconds', 'Latency of journal database queries', ['operation'],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)))
+RESTART_DURATION = registry.register(Histogram(
+    'repairman_restart_duration_seconds', 'Time of a container restart', buckets=(0.5, 1, 2.5, 5, 10, 15, 30, 60, 120)))
+NOTIFICATION_DURATION = registry.register(Histogram(
+    'repairman_notification_post_duration_seconds', 'Latency of a notification webhook POST'))
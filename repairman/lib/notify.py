@@ -2,10 +2,285 @@
 import requests
 import tornado.log
 import traceback
+import threading
+import queue
+import time
 import json
 import sys
+import typing
 from .entity import Container
 from .entity import ApplicationGlobalPolicy
+from . import metrics
+from .instrumentation import instrumentation
+from .time import Clock, system_clock
+
+
+class NotificationDispatcher:
+    """ Posts notifications in background threads, so the healing does not wait for the chat server.
+        Each URL has its own queue and thread, an unreachable server does not delay notifications to other ones.
+        Keeps one keep-alive session per URL, retries connection errors and 5xx with an exponential backoff.
+    """
+
+    _BACKOFF_BASE = 0.5
+
+    _queues: dict  # type: dict[str, queue.Queue]
+    _queue_size: int
+    _timeout: int
+    _retries: int
+    _sessions: dict  # type: dict[str, requests.Session]
+    _stats: dict
+    _lock: threading.Lock
+    _threads: dict  # type: dict[str, threading.Thread]
+    _running: bool
+
+    def __init__(self, queue_size: int, timeout: int, retries: int):
+        self._queues = {}
+        self._queue_size = queue_size
+        self._timeout = timeout
+        self._retries = retries
+        self._sessions = {}
+        self._stats = {'sent': 0, 'failed': 0, 'dropped': 0, 'retried': 0}
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._running = False
+
+    def run(self):
+        with self._lock:
+            self._running = True
+
+            for url in self._queues.keys():
+                self._start_thread(url)
+
+    def dispatch(self, url: str, text: str) -> bool:
+        """ Returns False when the notification was dropped because of too many notifications waiting for the URL """
+
+        try:
+            self._get_queue(url).put_nowait(text)
+            return True
+
+        except queue.Full:
+            self._increment('dropped')
+            tornado.log.app_log.warn('Dropping a notification to "' + url + '", the queue is full')
+            return False
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, 'queued': sum(map(lambda waiting: waiting.qsize(), self._queues.values()))}
+
+    def _get_queue(self, url: str) -> queue.Queue:
+        with self._lock:
+            if url not in self._queues:
+                self._queues[url] = queue.Queue(maxsize=self._queue_size)
+
+                if self._running:
+                    self._start_thread(url)
+
+            return self._queues[url]
+
+    def _start_thread(self, url: str):
+        """ Needs to be called under the lock """
+
+        self._threads[url] = threading.Thread(target=self._run, args=(url, self._queues[url]))
+        self._threads[url].setDaemon(True)
+        self._threads[url].start()
+
+    def _run(self, url: str, waiting: queue.Queue):
+        while True:
+            self._post(url, waiting.get())
+
+    def _post(self, url: str, text: str):
+        for attempt in range(0, self._retries + 1):
+            if attempt > 0:
+                self._increment('retried')
+                time.sleep(self._BACKOFF_BASE * (2 ** (attempt - 1)))
+
+            try:
+                with instrumentation.span('notify.post', metrics.NOTIFICATION_DURATION):
+                    response = self._get_session(url).post(url, data=json.dumps({'text': text}),
+                                                           timeout=self._timeout)
+                    response.raise_for_status()
+
+                self._increment('sent')
+                return
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                tornado.log.app_log.warn('Unable to post a notification to "' + url + '" ' +
+                                         '(attempt ' + str(attempt + 1) + '). ' + str(e))
+
+            except requests.exceptions.HTTPError as e:
+                tornado.log.app_log.warn('Unable to post a notification to "' + url + '" ' +
+                                         '(attempt ' + str(attempt + 1) + '). ' + str(e))
+
+                # a client error, eg. an invalid webhook, will not pass by trying again
+                if e.response is not None and e.response.status_code < 500:
+                    break
+
+            except Exception as e:
+                tornado.log.app_log.error('Unable to post a notification to "' + url + '". ' + str(e))
+                break
+
+        self._increment('failed')
+
+    def _get_session(self, url: str) -> requests.Session:
+        # each URL is posted to only from its own thread
+        if url not in self._sessions:
+            self._sessions[url] = requests.Session()
+
+        return self._sessions[url]
+
+    def _increment(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+
+class LazyLog:
+    """ Container log fetched on first use only, then shared by all notifications of one healing attempt """
+
+    _fetch: typing.Callable[[], str]
+    _log: str
+    _lock: threading.Lock
+
+    def __init__(self, fetch: typing.Callable[[], str]):
+        self._fetch = fetch
+        self._log = None
+        self._lock = threading.Lock()
+
+    def get(self) -> str:
+        with self._lock:
+            if self._log is None:
+                self._log = self._fetch()
+
+            return self._log
+
+
+class PendingNotification:
+    headline: str
+    priority: int
+    container_name: str
+    text: str
+    log: LazyLog
+
+    def __init__(self, headline: str, priority: int, container_name: str, text: str, log: LazyLog = None):
+        self.headline = headline
+        self.priority = priority
+        self.container_name = container_name
+        self.text = text
+        self.log = log
+
+    def get_text(self, with_log: bool = True) -> str:
+        """ The log is fetched only there, when the notification is really sent on its own """
+
+        if not with_log or not self.log or not self.log.get():
+            return self.text
+
+        return self.text + "\n\n```\n" + self.log.get() + "\n```"
+
+
+class NotificationCoalescer:
+    """ Limits notifications to one message per URL in a window.
+        When it is quiet the notification is sent immediately, next ones are grouped into a digest.
+    """
+
+    _window: int
+    _dispatcher: NotificationDispatcher
+    _pending: dict  # type: dict[str, list[PendingNotification]]
+    _last_sent: dict  # type: dict[str, float]
+    _stats: dict
+    _condition: threading.Condition
+    _thread: threading.Thread
+    _clock: Clock
+
+    def __init__(self, dispatcher: NotificationDispatcher, window: int, clock: Clock = system_clock):
+        self._dispatcher = dispatcher
+        self._window = window
+        self._clock = clock
+        self._pending = {}
+        self._last_sent = {}
+        self._stats = {'digests': 0, 'coalesced': 0}
+        self._condition = threading.Condition()
+
+    def run(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def add(self, url: str, notification: PendingNotification):
+        with self._condition:
+            if url in self._pending:
+                self._pending[url].append(notification)
+                return
+
+            if self._window <= 0 or self._clock.monotonic() - self._last_sent.get(url, -self._window) >= self._window:
+                self._dispatch(url, notification.get_text())
+                return
+
+            self._pending[url] = [notification]
+            self._condition.notify()
+
+    def flush_due(self) -> float:
+        """ Sends digests, which waited long enough. Returns seconds till the next digest is due """
+
+        with self._condition:
+            now = self._clock.monotonic()
+            next_in = None
+
+            for url in list(self._pending.keys()):
+                due_in = self._last_sent[url] + self._window - now
+
+                if due_in > 0:
+                    next_in = due_in if next_in is None else min(next_in, due_in)
+                    continue
+
+                self._send_pending(url, self._pending.pop(url))
+
+            return next_in
+
+    def get_stats(self) -> dict:
+        with self._condition:
+            return {**self._stats, 'pending': sum(map(len, self._pending.values()))}
+
+    def _run(self):
+        while True:
+            next_in = self.flush_due()
+
+            with self._condition:
+                self._condition.wait(timeout=next_in)
+
+    def _send_pending(self, url: str, notifications: list):
+        """ Notifications held back by the window are sent without logs, the log may be outdated already """
+
+        if len(notifications) == 1:
+            self._dispatch(url, notifications[0].get_text(with_log=False))
+            return
+
+        self._stats['digests'] += 1
+        self._stats['coalesced'] += len(notifications)
+        self._dispatch(url, self._create_digest(notifications))
+
+    def _create_digest(self, notifications: list) -> str:
+        """ Groups containers by event, the most important events go first. Logs are not included """
+
+        groups = {}
+
+        for notification in notifications:
+            key = (notification.priority, notification.headline)
+            groups.setdefault(key, {})
+
+            if notification.container_name:
+                groups[key][notification.container_name] = groups[key].get(notification.container_name, 0) + 1
+
+        lines = ['**' + str(len(notifications)) + ' notifications in last ' + str(self._window) + 's:**']
+
+        for (priority, headline), containers in sorted(groups.items(), key=lambda item: item[0][0]):
+            names = map(lambda item: item[0] + (' (x' + str(item[1]) + ')' if item[1] > 1 else ''),
+                        containers.items())
+            lines.append(headline + (': ' + ', '.join(names) if containers else ''))
+
+        return "\n".join(lines)
+
+    def _dispatch(self, url: str, text: str):
+        self._last_sent[url] = self._clock.monotonic()
+        self._dispatcher.dispatch(url, text)
 
 
 class Notify:
@@ -20,23 +295,25 @@ class Notify:
     }
 
     app_policy: ApplicationGlobalPolicy
+    coalescer: NotificationCoalescer
 
-    def __init__(self, app_policy: ApplicationGlobalPolicy):
+    def __init__(self, app_policy: ApplicationGlobalPolicy, coalescer: NotificationCoalescer):
         self.app_policy = app_policy
+        self.coalescer = coalescer
 
     def container_was_removed(self, container: Container):
         self._send(container, '[:warning:] Container was removed', self._DEBUG)
 
-    def container_was_restarted(self, container: Container, log: str):
+    def container_was_restarted(self, container: Container, log: LazyLog):
         self._send(container, '[:warning:] Container was restarted', self._DEBUG, log)
 
     def container_is_back_to_alive(self, container: Container):
         self._send(container, '[:sunglasses:] Container is healthy now', self._INFO)
 
-    def max_restarts_reached(self, container: Container, log: str):
+    def max_restarts_reached(self, container: Container, log: LazyLog):
         self._send(container, '[:exclamation:] Max restarts reached, will wait longer till next try', self._ERROR, log)
 
-    def multiple_failures_happened(self, container: Container, log: str):
+    def multiple_failures_happened(self, container: Container, log: LazyLog):
         self._send(container, '[:exclamation:] Multiple restart failures happened', self._INFO, log)
 
     def not_touching_anymore(self, container: Container):
@@ -52,28 +329,25 @@ class Notify:
         if not self.app_policy.notify_url:
             return
 
+        headline = '[:exclamation:] At least one container has invalid configuration'
         self._send_plain(self.app_policy.notify_url,
-                         '[:exclamation:] At least one container has invalid configuration: ' + message)
+                         PendingNotification(headline, self._ERROR, '', headline + ': ' + message))
 
-    def _send(self, container: Container, message: str, priority: int, log: str = ''):
+    def _send(self, container: Container, message: str, priority: int, log: LazyLog = None):
         if self._resolve_priority(container.policy.notify_level) < priority:
             return
 
         if not container.policy.notify_url:
             return
 
-        formatted_log = ''
-
-        if log:
-            formatted_log = "\n\n```\n" + log + "\n```"
-
-        self._send_plain(container.policy.notify_url, '**' + container.get_name() + ':** ' + message + formatted_log)
+        metrics.NOTIFICATIONS.inc({'container': container.identify()})
+        self._send_plain(container.policy.notify_url, PendingNotification(
+            message, priority, container.identify(), '**' + container.identify() + ':** ' + message, log
+        ))
 
-    def _send_plain(self, url: str, text: str):
+    def _send_plain(self, url: str, notification: PendingNotification):
         try:
-            requests.post(url, data=json.dumps({
-                'text': text
-            }))
+            self.coalescer.add(url, notification)
         except Exception as e:
             traceback.print_exc(file=sys.stdout)
             tornado.log.app_log.warn('Unable to post a notification to "' + url + '". ' + str(e))
@@ -0,0 +1,123 @@
+
+import threading
+import traceback
+import sys
+import tornado.log
+from .exception import ConfigurationException
+from .tasks import Task
+from .time import Clock, system_clock
+from . import metrics
+from .instrumentation import instrumentation
+
+
+class ScheduledTask:
+    """ Timing and statistics of a Task executed periodically by the Scheduler """
+
+    task: Task
+    period: int
+    runs: int
+    overruns: int
+    last_duration: float
+    last_drift: float
+    max_drift: float
+
+    def __init__(self, task: Task, period: int):
+        self.task = task
+        self.period = period
+        self.runs = 0
+        self.overruns = 0
+        self.last_duration = 0.0
+        self.last_drift = 0.0
+        self.max_drift = 0.0
+
+    def get_name(self) -> str:
+        return self.task.__class__.__name__
+
+    def to_dict(self) -> dict:
+        return {
+            'task': self.get_name(),
+            'period': self.period,
+            'runs': self.runs,
+            'overruns': self.overruns,
+            'last_duration': self.last_duration,
+            'last_drift': self.last_drift,
+            'max_drift': self.max_drift
+        }
+
+
+class Scheduler:
+    """ Runs each Task in its own thread at a fixed rate, so a slow Task does not delay the others """
+
+    _scheduled: list  # type: list[ScheduledTask]
+    _threads: list  # type: list[threading.Thread]
+    _clock: Clock
+
+    def __init__(self, clock: Clock = system_clock):
+        self._scheduled = []
+        self._threads = []
+        self._clock = clock
+
+    def add(self, task: Task, period: int):
+        if period <= 0:
+            raise ConfigurationException('Interval of ' + task.__class__.__name__ + ' has to be greater than 0, ' +
+                                         'got ' + str(period))
+
+        self._scheduled.append(ScheduledTask(task, period))
+
+    def run(self):
+        for scheduled in self._scheduled:
+            thread = threading.Thread(target=lambda s=scheduled: self._run_task(s))
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def run_forever(self):
+        self.run()
+
+        # join with a timeout, so the main thread can still receive a KeyboardInterrupt
+        while True:
+            for thread in self._threads:
+                thread.join(1)
+
+    def get_stats(self) -> list:
+        return list(map(lambda scheduled: scheduled.to_dict(), self._scheduled))
+
+    def _run_task(self, scheduled: ScheduledTask):
+        next_run = self._clock.monotonic()
+
+        while True:
+            next_run = self._run_once(scheduled, next_run)
+
+    def _run_once(self, scheduled: ScheduledTask, next_run: float) -> float:
+        """ Waits until next_run, executes the task and returns when it should be executed next time """
+
+        delay = next_run - self._clock.monotonic()
+
+        if delay > 0:
+            self._clock.sleep(delay)
+
+        started_at = self._clock.monotonic()
+        scheduled.last_drift = started_at - next_run
+        scheduled.max_drift = max(scheduled.max_drift, scheduled.last_drift)
+
+        try:
+            with instrumentation.span('task.' + scheduled.get_name(), metrics.SCAN_DURATION,
+                                      {'task': scheduled.get_name()}):
+                scheduled.task.process()
+        except:
+            traceback.print_exc(file=sys.stdout)
+
+        scheduled.runs += 1
+        scheduled.last_duration = self._clock.monotonic() - started_at
+        next_run += scheduled.period
+
+        # the task took longer than its period, skip the runs that were missed instead of catching them up
+        if self._clock.monotonic() > next_run:
+            missed = int((self._clock.monotonic() - next_run) // scheduled.period) + 1
+            scheduled.overruns += missed
+            next_run += missed * scheduled.period
+
+            tornado.log.app_log.warn(scheduled.get_name() + ' took ' + str(scheduled.last_duration) + 's, ' +
+                                     'longer than its period of ' + str(scheduled.period) + 's')
+
+        return next_run
@@ -1,26 +1,214 @@
-
+import heapq
+import threading
 import time
+import uuid
+import tornado.log
 from .entity import Container
 from .exception import ContainerIsLocked
+from .time import Clock, system_clock
+
+
+class Lease:
+    """ Exclusive right to process a container, valid until expires_at (monotonic time) """
+
+    key: str
+    token: str
+    acquired_at: float
+    expires_at: float
+
+    def __init__(self, key: str, token: str, acquired_at: float, expires_at: float):
+        self.key = key
+        self.token = token
+        self.acquired_at = acquired_at
+        self.expires_at = expires_at
 
 
 class LockingManager:
-    _locks = {}
+    """ Leases on containers shared between all tasks and workers.
+        Containers are spread between stripes, so threads working on different containers rarely wait for each other.
+        Expired leases are reaped from a heap, not only when someone tries to acquire the same container.
+        Entries of released or extended leases are left in the heap, it is compacted when they are the majority.
+    """
+
+    _STRIPES = 16
     _max_lock_lifetime = 3600
 
-    def acquire(self, container: Container):
-        is_locked = container.identify() in self._locks
+    _stripe_locks: list  # type: list[threading.Lock]
+    _leases: list  # type: list[dict[str, Lease]]
+    _expiry_heap: list  # type: list[tuple]
+    _expiry_lock: threading.Lock
+    _stale_entries: int
+    _stats: dict
+    _stats_lock: threading.Lock
+    _clock: Clock
+    _reaper: threading.Thread
+
+    def __init__(self, max_lock_lifetime: int = None, clock: Clock = system_clock):
+        self._stripe_locks = [threading.Lock() for _ in range(0, self._STRIPES)]
+        self._leases = [{} for _ in range(0, self._STRIPES)]
+        self._expiry_heap = []
+        self._expiry_lock = threading.Lock()
+        self._stale_entries = 0
+        self._stats = {'acquired': 0, 'released': 0, 'contended': 0, 'expired': 0, 'foreign_releases': 0}
+        self._stats_lock = threading.Lock()
+        self._clock = clock
+
+        if max_lock_lifetime is not None:
+            self._max_lock_lifetime = max_lock_lifetime
+
+    def run_reaper(self, interval: int):
+        self._reaper = threading.Thread(target=self._reap_periodically, args=(interval,))
+        self._reaper.setDaemon(True)
+        self._reaper.start()
+
+    def acquire(self, container: Container) -> str:
+        """ Returns a token, which identifies the owner of the lease """
+
+        key = container.identify()
+        stripe = self._get_stripe(key)
+        now = self._clock.monotonic()
+
+        with self._stripe_locks[stripe]:
+            lease = self._leases[stripe].get(key)
+
+            if lease and lease.expires_at > now:
+                self._increment('contended')
+                raise ContainerIsLocked('"' + str(key) + '" already locked')
+
+            if lease:
+                self._expire(lease)
+                self._mark_stale()
+
+            lease = Lease(key, uuid.uuid4().hex, now, now + self._max_lock_lifetime)
+            self._leases[stripe][key] = lease
+
+        self._push(lease)
+        self._increment('acquired')
+        return lease.token
+
+    def extend(self, container: Container, token: str, seconds: float) -> bool:
+        """ Keeps the lease for given seconds longer than usual, eg. while its action waits to be executed later.
+            Returns False, when the token does not own the lease anymore
+        """
+
+        key = container.identify()
+        stripe = self._get_stripe(key)
+
+        with self._stripe_locks[stripe]:
+            lease = self._leases[stripe].get(key)
+
+            if lease is None or lease.token != token:
+                return False
+
+            lease.expires_at = max(lease.expires_at, self._clock.monotonic() + seconds + self._max_lock_lifetime)
+
+        self._mark_stale()
+        self._push(lease)
+        return True
+
+    def release(self, container: Container, token: str = None) -> bool:
+        """ Releases the lease. With a token only the owner can release it, eg. not after it expired and was taken """
+
+        key = container.identify()
+        stripe = self._get_stripe(key)
+
+        with self._stripe_locks[stripe]:
+            lease = self._leases[stripe].get(key)
+
+            if lease is None:
+                return False
+
+            if token is not None and lease.token != token:
+                self._increment('foreign_releases')
+                return False
+
+            del self._leases[stripe][key]
+
+        self._mark_stale()
+        self._increment('released')
+        return True
+
+    def reap_expired(self) -> int:
+        """ Removes leases that were not released in time, returns how many """
+
+        reaped = 0
+        now = self._clock.monotonic()
+
+        while True:
+            with self._expiry_lock:
+                if not self._expiry_heap or self._expiry_heap[0][0] > now:
+                    return reaped
+
+                expires_at, token, key = heapq.heappop(self._expiry_heap)
+
+            stripe = self._get_stripe(key)
+
+            with self._stripe_locks[stripe]:
+                lease = self._leases[stripe].get(key)
+
+                # the lease could be released, extended or acquired again in the meantime
+                if lease and lease.token == token and lease.expires_at <= now:
+                    del self._leases[stripe][key]
+                    self._expire(lease)
+                    reaped += 1
+                    continue
+
+            with self._expiry_lock:
+                self._stale_entries = max(self._stale_entries - 1, 0)
+
+    def get_stats(self) -> dict:
+        now = self._clock.monotonic()
+        ages = []
+
+        for stripe in range(0, self._STRIPES):
+            with self._stripe_locks[stripe]:
+                ages += map(lambda lease: now - lease.acquired_at, self._leases[stripe].values())
+
+        with self._stats_lock:
+            return {
+                **self._stats,
+                'held': len(ages),
+                'heap_size': len(self._expiry_heap),
+                'oldest_lease_age': max(ages) if ages else 0,
+                'average_lease_age': sum(ages) / len(ages) if ages else 0
+            }
+
+    def _get_stripe(self, key) -> int:
+        return hash(key) % self._STRIPES
+
+    def _push(self, lease: Lease):
+        with self._expiry_lock:
+            heapq.heappush(self._expiry_heap, (lease.expires_at, lease.token, lease.key))
+
+    def _mark_stale(self):
+        """ Counts a heap entry, which does not describe a held lease anymore. Compacts the heap when needed """
+
+        with self._expiry_lock:
+            self._stale_entries += 1
+
+            if self._stale_entries * 2 <= len(self._expiry_heap):
+                return
+
+            self._expiry_heap = list(filter(self._is_current, self._expiry_heap))
+            heapq.heapify(self._expiry_heap)
+            self._stale_entries = 0
+
+    def _is_current(self, entry: tuple) -> bool:
+        expires_at, token, key = entry
+        lease = self._leases[self._get_stripe(key)].get(key)
 
-        if is_locked and time.time() >= self._locks[container.identify()]:
-            self.release(container)
+        return lease is not None and lease.token == token and lease.expires_at == expires_at
 
-        if is_locked:
-            raise ContainerIsLocked('"' + container.identify() + '" already locked')
+    def _expire(self, lease: Lease):
+        self._increment('expired')
+        tornado.log.app_log.warn('Lock on "' + str(lease.key) + '" expired after ' +
+                                 str(lease.expires_at - lease.acquired_at) + 's')
 
-        self._locks[container.identify()] = time.time() + self._max_lock_lifetime
+    def _increment(self, stat: str):
+        with self._stats_lock:
+            self._stats[stat] += 1
 
-    def release(self, container: Container):
-        try:
-            del self._locks[container.identify()]
-        except KeyError:
-            pass
+    def _reap_periodically(self, interval: int):
+        while True:
+            time.sleep(interval)
+            self.reap_expired()
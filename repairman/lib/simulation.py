@@ -0,0 +1,336 @@
+import collections
+import json
+import time
+import typing
+import tornado.log
+from .delayed import DelayedActionQueue
+from .entity import ApplicationGlobalPolicy
+from .exception import ConfigurationException
+from .journal import Journal
+from .notify import Notify, NotificationCoalescer, NotificationDispatcher, PendingNotification
+from .semaphore import LockingManager
+from .synthetic import SyntheticAdapter, SyntheticDockerApi
+from .tasks import HealTask, MonitorRepairedTask
+from .time import Clock, VirtualClock
+from .workers import WorkerPool
+
+
+class TraceEvent:
+    """ Change of a container state in the given second of the simulation.
+        failing: unhealthy, restarts do not help (eg. a dependency is down)
+        crashed: unhealthy, a restart helps
+        recovered: healthy again without a restart
+    """
+
+    STATES = {'failing': (True, True), 'crashed': (True, False), 'recovered': (False, False)}
+
+    at: float
+    container: str
+    state: str
+
+    def __init__(self, at: float, container: str, state: str):
+        if state not in self.STATES:
+            raise ConfigurationException('Unknown state "' + str(state) + '" of "' + str(container) + '", ' +
+                                         'expected one of: ' + ', '.join(self.STATES.keys()))
+
+        self.at = float(at)
+        self.container = container
+        self.state = state
+
+
+class Trace:
+    """ Script of container failures to replay in a simulation """
+
+    duration: int
+    containers: dict  # type: dict[str, dict]
+    events: list  # type: list[TraceEvent]
+
+    def __init__(self, duration: int, containers: dict, events: list):
+        self.duration = duration
+        self.containers = dict(containers)
+        self.events = sorted(events, key=lambda event: event.at)
+
+        for event in self.events:
+            self.containers.setdefault(event.container, {})
+
+    @staticmethod
+    def from_dict(data: dict, duration: int) -> 'Trace':
+        """ {"duration": 3600, "containers": {"name": {labels}}, "events": [{"at": 0, "container": "name",
+            "state": "failing"}]}
+        """
+
+        return Trace(
+            duration=int(data.get('duration', duration)),
+            containers=data.get('containers', {}),
+            events=list(map(lambda event: TraceEvent(event['at'], event['container'], event['state']),
+                            data.get('events', [])))
+        )
+
+    @staticmethod
+    def from_docker_events(lines: typing.Iterable[str], duration: int) -> 'Trace':
+        """ Recorded with: docker events --filter event=health_status --format '{{json .}}'
+            An unhealthy container is treated as failing until Docker reported it healthy again
+        """
+
+        events = []
+        started_at = None
+
+        for line in lines:
+            if not line.strip():
+                continue
+
+            event = json.loads(line)
+            status = event.get('status', event.get('Action', ''))
+
+            if not status.startswith('health_status'):
+                continue
+
+            happened_at = event.get('timeNano', event.get('time', 0) * 1e9) / 1e9
+            started_at = happened_at if started_at is None else started_at
+
+            events.append(TraceEvent(
+                at=happened_at - started_at,
+                container=event.get('Actor', {}).get('Attributes', {}).get('name', event.get('id', '')),
+                state='failing' if status.endswith('unhealthy') else 'recovered'
+            ))
+
+        return Trace(duration=duration, containers={}, events=events)
+
+    @staticmethod
+    def from_file(path: str, duration: int) -> 'Trace':
+        with open(path) as handle:
+            content = handle.read()
+
+        try:
+            data = json.loads(content)
+        except ValueError:
+            data = None
+
+        if isinstance(data, dict) and 'events' in data:
+            return Trace.from_dict(data, duration)
+
+        return Trace.from_docker_events(content.splitlines(), duration)
+
+    @staticmethod
+    def flapping(container: str, duration: int, period: int, down_time: int) -> 'Trace':
+        """ The container fails at the beginning of each period and recovers by itself after down_time """
+
+        events = []
+
+        for started_at in range(0, duration, period):
+            events.append(TraceEvent(started_at, container, 'failing'))
+            events.append(TraceEvent(started_at + down_time, container, 'recovered'))
+
+        return Trace(duration=duration, containers={container: {}}, events=events)
+
+
+class RecordingDispatcher(NotificationDispatcher):
+    """ Remembers the messages with the simulated time, instead of posting them """
+
+    _clock: Clock
+    sent: list  # type: list[tuple[float, str, str]]
+
+    def __init__(self, clock: Clock):
+        super().__init__(queue_size=1, timeout=0, retries=0)
+        self._clock = clock
+        self.sent = []
+
+    def dispatch(self, url: str, text: str) -> bool:
+        self.sent.append((self._clock.monotonic(), url, text))
+        return True
+
+
+class RecordingCoalescer(NotificationCoalescer):
+    """ Coalesces on the simulated time, remembers each notification before it is grouped into a digest """
+
+    recorded: list  # type: list[PendingNotification]
+
+    def __init__(self, dispatcher: RecordingDispatcher, window: int, clock: Clock):
+        super().__init__(dispatcher=dispatcher, window=window, clock=clock)
+        self.recorded = []
+
+    def add(self, url: str, notification: PendingNotification):
+        self.recorded.append(notification)
+        super().add(url, notification)
+
+
+class Simulation:
+    """ Replays a trace against the real HealTask, MonitorRepairedTask, Journal and policies on a virtual clock.
+        Nothing waits for real time, an hour of failures is simulated in a fraction of a second.
+    """
+
+    _SIMULATED_URL = 'simulation://notifications'
+
+    _trace: Trace
+    _policy: ApplicationGlobalPolicy
+    _clock: VirtualClock
+    _api: SyntheticDockerApi
+    _adapter: SyntheticAdapter
+    _journal: Journal
+    _workers: WorkerPool
+    _delayed: DelayedActionQueue
+    _dispatcher: RecordingDispatcher
+    _coalescer: RecordingCoalescer
+    _heal_task: HealTask
+    _monitor_task: MonitorRepairedTask
+    _containers: dict  # type: dict[str, dict]
+
+    def __init__(self, params: dict, trace: Trace):
+        """ params: same as for the Repairman, the journal is always kept in memory """
+
+        self._trace = trace
+        self._policy = ApplicationGlobalPolicy({
+            **params,
+            'db_path': ':memory:',
+            'db_commit_interval': 0,
+            'watch_events': False,
+            'enable_autoheal': True,
+            'notify_url': params.get('notify_url') or self._SIMULATED_URL
+        })
+        self._clock = VirtualClock()
+        self._api = SyntheticDockerApi(count=0)
+
+        for name, labels in trace.containers.items():
+            self._api.add(name, labels=labels)
+
+            # names in traces are full names, the same as the names recorded from Docker
+            if not name.startswith(self._policy.namespace):
+                tornado.log.app_log.warn('"' + name + '" is outside of the namespace "' + self._policy.namespace +
+                                         '", it will not be healed')
+
+        self._dispatcher = RecordingDispatcher(self._clock)
+        self._coalescer = RecordingCoalescer(self._dispatcher, window=self._policy.notify_coalesce_window,
+                                             clock=self._clock)
+        notify = Notify(self._policy, self._coalescer)
+
+        self._adapter = SyntheticAdapter(self._policy, notify, self._api)
+        self._journal = Journal(self._policy, clock=self._clock)
+        self._workers = WorkerPool(workers=0, queue_size=self._policy.workers_queue_size)
+        self._delayed = DelayedActionQueue(workers=self._workers, clock=self._clock)
+        lock_manager = LockingManager(clock=self._clock)
+
+        self._heal_task = HealTask(adapter=self._adapter, journal=self._journal, app_policy=self._policy,
+                                   workers=self._workers, notify=notify, lock_manager=lock_manager,
+                                   delayed=self._delayed, clock=self._clock)
+        self._monitor_task = MonitorRepairedTask(adapter=self._adapter, journal=self._journal,
+                                                 app_policy=self._policy, workers=self._workers, notify=notify,
+                                                 lock_manager=lock_manager)
+        self._containers = {}
+
+    def run(self) -> dict:
+        started_at = time.perf_counter()
+        events = collections.deque(self._trace.events)
+        entities = dict(map(lambda container: (container.get_name(), container),
+                            self._adapter.find_all_containers()))
+
+        for name in self._trace.containers.keys():
+            self._containers[name] = {'first_failure_at': None, 'gave_up_at': None, 'restarted_at': [],
+                                      'unhealthy_seconds': 0.0, 'restarts': 0, 'unhealthy_since': None}
+
+        now = 0.0
+        next_heal = 0.0
+        next_monitor = 0.0
+
+        while True:
+            while events and events[0].at <= now:
+                self._apply(events.popleft(), now)
+
+            # the snapshot cache works on real time, in a simulation each check has to see the current state
+            if now >= next_monitor:
+                self._adapter.invalidate_snapshot()
+                self._monitor_task.process()
+                next_monitor += self._policy.monitor_interval
+
+            if now >= next_heal:
+                self._adapter.invalidate_snapshot()
+                self._heal_task.process()
+                next_heal += self._policy.heal_interval
+
+            next_delayed_in = self._run_actions()
+            next_digest_in = self._coalescer.flush_due()
+            self._observe(now, entities)
+
+            following = min([next_heal, next_monitor] + ([events[0].at] if events else []) +
+                            ([now + next_delayed_in] if next_delayed_in is not None else []) +
+                            ([now + next_digest_in] if next_digest_in is not None else []))
+
+            if following > self._trace.duration:
+                break
+
+            self._clock.advance(following - now)
+            now = following
+
+        self._observe(float(self._trace.duration), entities)
+        report = self._create_report(time.perf_counter() - started_at)
+        self._journal.close()
+
+        return report
+
+    def _apply(self, event: TraceEvent, now: float):
+        unhealthy, failing = TraceEvent.STATES[event.state]
+        state = self._containers[event.container]
+
+        self._api.set_state(event.container, unhealthy=unhealthy, failing=failing)
+
+        if unhealthy and state['first_failure_at'] is None:
+            state['first_failure_at'] = now
+
+    def _run_actions(self) -> typing.Union[float, None]:
+        """ Executes everything that is due in this thread. Returns seconds to the next delayed action """
+
+        while True:
+            next_in = self._delayed.run_due()
+
+            if not self._workers.run_pending():
+                return next_in
+
+    def _observe(self, now: float, entities: dict):
+        restarts = self._api.get_restarts()
+
+        for name, state in self._containers.items():
+            if state['unhealthy_since'] is not None:
+                state['unhealthy_seconds'] += now - state['unhealthy_since']
+
+            state['unhealthy_since'] = now if self._api.is_unhealthy(name) else None
+
+            if restarts[name] > state['restarts']:
+                state['restarted_at'] += [now] * (restarts[name] - state['restarts'])
+                state['restarts'] = restarts[name]
+
+            if state['gave_up_at'] is None and name in entities \
+                    and self._journal.find_is_marked_as_not_touch(entities[name]):
+                state['gave_up_at'] = now
+
+    def _create_report(self, wall_seconds: float) -> dict:
+        notifications = {}
+        containers = {}
+
+        for notification in self._coalescer.recorded:
+            notifications.setdefault(notification.container_name, collections.Counter())[notification.headline] += 1
+
+        for name, state in self._containers.items():
+            time_to_give_up = None
+
+            if state['gave_up_at'] is not None and state['first_failure_at'] is not None:
+                time_to_give_up = state['gave_up_at'] - state['first_failure_at']
+
+            containers[name] = {
+                'restarts': state['restarts'],
+                'restarted_at': state['restarted_at'],
+                'first_failure_at': state['first_failure_at'],
+                'gave_up_at': state['gave_up_at'],
+                'time_to_give_up': time_to_give_up,
+                'unhealthy_seconds': state['unhealthy_seconds'],
+                'healthy_at_end': not self._api.is_unhealthy(name),
+                'notifications': dict(notifications.get(name, {}))
+            }
+
+        return {
+            'simulated_seconds': self._trace.duration,
+            'wall_seconds': wall_seconds,
+            'restarts': sum(map(lambda container: container['restarts'], containers.values())),
+            'notifications': len(self._coalescer.recorded),
+            'notification_messages': len(self._dispatcher.sent),
+            'notification_digests_pending': self._coalescer.get_stats()['pending'],
+            'containers': containers
+        }
@@ -0,0 +1,86 @@
+
+import json
+import threading
+import time
+import typing
+
+
+class RenderedSummary:
+    """ Summary already serialized for the HTTP response """
+
+    status: int
+    body: bytes
+
+    def __init__(self, status: int, body: bytes):
+        self.status = status
+        self.body = body
+
+
+class SummaryCache:
+    """ Keeps rendered summaries until the TTL expires or until the journal or the containers list changes.
+        Checking the cache does not touch Docker nor the database.
+    """
+
+    _MAX_ENTRIES = 16
+
+    _producer: typing.Callable[[int], dict]
+    _revision: typing.Callable[[], tuple]
+    _ttl: int
+    _entries: dict  # type: dict[int, tuple]
+    _lock: threading.Lock
+
+    def __init__(self, producer: typing.Callable[[int], dict], revision: typing.Callable[[], tuple], ttl: int):
+        """
+        :param producer: Creates summary for given limit of last events
+        :param revision: Returns revisions of sources, when any revision changes then the cache is outdated
+        :param ttl: Maximum time in seconds to serve the summary from cache, 0 disables the cache
+        """
+
+        self._producer = producer
+        self._revision = revision
+        self._ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, limit: int) -> RenderedSummary:
+        cached = self.find_fresh(limit)
+
+        if cached:
+            return cached
+
+        # only one thread renders the summary, the others will get it from the cache
+        with self._lock:
+            cached = self.find_fresh(limit)
+
+            if cached:
+                return cached
+
+            revision = self._revision()
+            rendered = self._render(self._producer(limit))
+
+            if len(self._entries) >= self._MAX_ENTRIES:
+                self._entries.clear()
+
+            self._entries[limit] = (revision, time.monotonic(), rendered)
+
+            return rendered
+
+    def find_fresh(self, limit: int) -> typing.Union[RenderedSummary, None]:
+        entry = self._entries.get(limit)
+
+        if not entry:
+            return None
+
+        revision, created_at, rendered = entry
+
+        if time.monotonic() - created_at >= self._ttl or revision != self._revision():
+            return None
+
+        return rendered
+
+    @staticmethod
+    def _render(result: dict) -> RenderedSummary:
+        return RenderedSummary(
+            500 if not result['global_status'] else 200,
+            json.dumps(result, sort_keys=True, indent=4, separators=(',', ': ')).encode('utf-8')
+        )
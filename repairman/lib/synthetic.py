@@ -0,0 +1,221 @@
+import itertools
+import random
+import re
+import threading
+import time
+import typing
+import docker.errors
+from docker.models.containers import Container as DockerContainer
+from .adapter import DockerAdapter
+from .entity import ApplicationGlobalPolicy
+from .notify import Notify
+
+
+class SyntheticContainer(DockerContainer):
+    """ docker-py container model, which actions change the state kept by the SyntheticDockerApi """
+
+    _api: 'SyntheticDockerApi'
+
+    def __init__(self, attrs: dict, api: 'SyntheticDockerApi'):
+        super().__init__(attrs=attrs)
+        self._api = api
+
+    def restart(self, **kwargs):
+        self._api.restart(self.id)
+
+    def stop(self, **kwargs):
+        self._api.call()
+
+    def remove(self, **kwargs):
+        self._api.remove(self.id)
+
+    def logs(self, tail: int = 10, stream: bool = False, **kwargs):
+        lines = list(map(lambda number: ('Synthetic log line ' + str(number) + "\n").encode('utf-8'),
+                         range(0, tail)))
+
+        return iter(lines) if stream else b''.join(lines)
+
+
+class SyntheticContainerCollection:
+    """ Subset of docker.models.containers.ContainerCollection used by the DockerAdapter """
+
+    _api: 'SyntheticDockerApi'
+
+    def __init__(self, api: 'SyntheticDockerApi'):
+        self._api = api
+
+    def list(self, all: bool = False, sparse: bool = False, filters: dict = None) -> list:
+        return self._api.list(all, sparse, filters or {})
+
+    def get(self, container_id: str) -> SyntheticContainer:
+        return self._api.get(container_id)
+
+
+class SyntheticDockerApi:
+    """ In-process stand-in for docker.DockerClient. Generates containers with given distribution of labels,
+        health and exit codes, each API call takes given latency (in seconds)
+    """
+
+    containers: SyntheticContainerCollection
+    _states: dict  # type: dict[str, dict]
+    _ids_by_name: dict  # type: dict[str, str]
+    _sequence: typing.Iterator[int]
+    _latency: float
+    _random: random.Random
+    _failure_probability: float
+    _lock: threading.Lock
+    calls: int
+
+    def __init__(self, count: int = 1000, namespace: str = '', unhealthy_ratio: float = 0.05,
+                 exited_ratio: float = 0.02, labelled_ratio: float = 0.5, label_sets: int = 10,
+                 latency: float = 0.0, failure_probability: float = 0.0, seed: int = 1):
+        """ failure_probability: chance that a container is still failing after a restart """
+
+        self.containers = SyntheticContainerCollection(self)
+        self._states = {}
+        self._ids_by_name = {}
+        self._sequence = itertools.count(1)
+        self._latency = latency
+        self._random = random.Random(seed)
+        self._failure_probability = failure_probability
+        self._lock = threading.Lock()
+        self.calls = 0
+
+        for number in range(0, count):
+            health = self._random.random()
+            labels = {}
+
+            if self._random.random() < labelled_ratio:
+                variant = self._random.randrange(0, label_sets)
+                labels = {
+                    'org.riotkit.repairman.max_restarts_in_frame': str(1 + variant % 3),
+                    'org.riotkit.repairman.seconds_between_restarts': str(5 + variant % 10)
+                }
+
+            self.add(
+                name=namespace + 'service_' + str(number),
+                unhealthy=health < unhealthy_ratio,
+                exit_code=1 if unhealthy_ratio <= health < unhealthy_ratio + exited_ratio else 0,
+                labels=labels
+            )
+
+    def add(self, name: str, unhealthy: bool = False, exit_code: int = 0, labels: dict = None):
+        container_id = format(next(self._sequence), '064x')
+
+        self._states[container_id] = {
+            'id': container_id,
+            'name': name,
+            'status': 'exited' if exit_code else 'running',
+            'exit_code': exit_code,
+            'unhealthy': unhealthy,
+            'failing': False,
+            'labels': labels or {},
+            'restarts': 0
+        }
+        self._ids_by_name[name] = container_id
+
+    def call(self):
+        with self._lock:
+            self.calls += 1
+
+        if self._latency > 0:
+            time.sleep(self._latency)
+
+    def list(self, all: bool, sparse: bool, filters: dict) -> list:
+        self.call()
+
+        with self._lock:
+            states = list(filter(lambda state: self._matches(state, all, filters), self._states.values()))
+
+        return list(map(lambda state: self._create_model(state, sparse), states))
+
+    def get(self, container_id: str) -> SyntheticContainer:
+        self.call()
+
+        return self._create_model(self._find(container_id), sparse=False)
+
+    def events(self, decode: bool = True, filters: dict = None) -> typing.Iterator[dict]:
+        return iter([])
+
+    def restart(self, container_id: str):
+        self.call()
+
+        with self._lock:
+            state = self._find(container_id)
+            still_failing = self._random.random() < self._failure_probability
+
+            state['restarts'] += 1
+            state['status'] = 'running'
+            state['exit_code'] = 0
+            state['unhealthy'] = still_failing or state['failing']
+
+    def set_state(self, name: str, unhealthy: bool, failing: bool = False):
+        """ failing: restarts do not help until the state is changed again, eg. while a dependency is down """
+
+        with self._lock:
+            state = self._find(name)
+            state['unhealthy'] = unhealthy
+            state['failing'] = failing
+
+    def remove(self, container_id: str):
+        self.call()
+
+        with self._lock:
+            state = self._find(container_id)
+            del self._states[state['id']]
+            del self._ids_by_name[state['name']]
+
+    def is_unhealthy(self, name: str) -> bool:
+        with self._lock:
+            state = self._find(name)
+            return state['unhealthy'] or state['status'] != 'running'
+
+    def get_restarts(self) -> dict:
+        with self._lock:
+            return dict(map(lambda state: (state['name'], state['restarts']), self._states.values()))
+
+    def _find(self, container_id: str) -> dict:
+        state = self._states.get(self._ids_by_name.get(container_id, container_id))
+
+        if state:
+            return state
+
+        raise docker.errors.NotFound('No such container: ' + container_id)
+
+    @staticmethod
+    def _matches(state: dict, all: bool, filters: dict) -> bool:
+        if not all and state['status'] != 'running':
+            return False
+
+        if filters.get('health') == 'unhealthy' and not state['unhealthy']:
+            return False
+
+        if 'status' in filters and filters['status'] != state['status']:
+            return False
+
+        if 'name' in filters and not re.search(filters['name'], '/' + state['name']):
+            return False
+
+        return 'label' not in filters or filters['label'] in state['labels']
+
+    def _create_model(self, state: dict, sparse: bool) -> SyntheticContainer:
+        if sparse:
+            return SyntheticContainer({
+                'Id': state['id'], 'Names': ['/' + state['name']], 'State': state['status'],
+                'Created': 1555000000, 'Labels': state['labels']
+            }, self)
+
+        health = {'Health': {'Status': 'unhealthy' if state['unhealthy'] else 'healthy'}}
+
+        return SyntheticContainer({
+            'Id': state['id'], 'Name': '/' + state['name'], 'Created': '2019-04-11T16:26:40',
+            'State': {'Status': state['status'], 'ExitCode': state['exit_code'], **health},
+            'Config': {'Labels': state['labels'], 'Tty': False}
+        }, self)
+
+
+class SyntheticAdapter(DockerAdapter):
+    """ DockerAdapter working on generated containers, for benchmarks and simulations """
+
+    def __init__(self, app_policy: ApplicationGlobalPolicy, notify: Notify, api: SyntheticDockerApi):
+        super().__init__(app_policy, notify, api=api)
@@ -2,36 +2,77 @@
 from .adapter import Adapter
 from .journal import Journal
 from .entity import Container
-from .exception import ContainerIsLocked
+from .exception import ContainerIsLocked, WorkerPoolFull
 from .semaphore import LockingManager
-from .notify import Notify
+from .notify import Notify, LazyLog
+from .workers import WorkerPool
+from .delayed import DelayedActionQueue
 from .entity import ApplicationGlobalPolicy
-from .time import Time as time
-import threading
+from .time import Clock, system_clock
 import tornado.log
 import abc
+import re
+import typing
 import traceback
 import sys
 
 
 class Task(metaclass=abc.ABCMeta):
+    _KEEP_LOCKED = 'keep_locked'
+
     _lock_manager: LockingManager
     _notify: Notify
 
     _adapter: Adapter
     _journal: Journal
-    _threads = []
+    _app_policy: ApplicationGlobalPolicy
+    _workers: WorkerPool
 
-    def __init__(self, adapter: Adapter, journal: Journal, app_policy: ApplicationGlobalPolicy):
+    def __init__(self, adapter: Adapter, journal: Journal, app_policy: ApplicationGlobalPolicy,
+                 workers: WorkerPool, notify: Notify, lock_manager: LockingManager):
         self._adapter = adapter
         self._journal = journal
-        self._lock_manager = LockingManager()
-        self._notify = Notify(app_policy)
+        self._app_policy = app_policy
+        self._workers = workers
+        self._lock_manager = lock_manager
+        self._notify = notify
 
     @abc.abstractmethod
     def process(self):
         pass
 
+    def _submit_locked(self, container: Container, action: typing.Callable[[str], typing.Any]):
+        """ Executes the action in a worker, while the container is locked. Does nothing if already locked.
+            The action receives the token of the lease
+        """
+
+        try:
+            token = self._lock_manager.acquire(container)
+        except ContainerIsLocked:
+            return
+
+        try:
+            self._workers.submit(lambda: self._execute_and_release(container, action, token))
+
+        except WorkerPoolFull as e:
+            self._lock_manager.release(container, token)
+            tornado.log.app_log.warn('Postponing "' + container.identify() + '": ' + str(e))
+
+        except:
+            self._lock_manager.release(container, token)
+            traceback.print_exc(file=sys.stdout)
+
+    def _execute_and_release(self, container: Container, action: typing.Callable[[str], typing.Any], token: str):
+        """ The action can return _KEEP_LOCKED, when it passes the container further eg. to the DelayedActionQueue """
+
+        keep_locked = False
+
+        try:
+            keep_locked = action(token) == self._KEEP_LOCKED
+        finally:
+            if not keep_locked:
+                self._lock_manager.release(container, token)
+
 
 class MonitorRepairedTask(Task):
     def process(self):
@@ -45,53 +86,58 @@ class MonitorRepairedTask(Task):
                 self._journal.clear_all_container_history(container)
                 self._notify.container_is_back_to_alive(container)
 
+        # histories of removed containers would be kept in memory forever
+        self._journal.forget_histories_except(all_in_network)
 
-class DeduplicationTask(Task):
-    def process(self):
-        all_in_network = self._adapter.find_all_containers_in_namespace()
-        all_containers = self._adapter.find_all_containers()
-        mapped = {}
 
-        for container in all_containers:
-            mapped[container.get_name()] = container
+class DeduplicationTask(Task):
+    # watchtower renames the old container to "<12 characters of its id>_<name>"
+    _DUPLICATE_NAME = re.compile('^([0-9a-f]{12})_(.+)$')
 
-        for container in all_in_network:
-            name = container.get_name()
-            name_length_with_duplication_prefix = len(name) + 13
+    def process(self):
+        duplicates_by_name = self._index_by_original_name(self._adapter.find_all_containers())
 
+        for container in self._adapter.find_all_containers_in_namespace():
             if not container.policy.enable_cleaning_duplicated_services:
                 continue
 
-            for other_name, other_container in mapped.items():
-                # at first validate first part
-                split = other_name.split('_')
-
-                if len(split[0]) != 12:
-                    continue
-
-                if other_name.endswith('_' + name) and len(other_name) == name_length_with_duplication_prefix:
-                    try:
-                        self._lock_manager.acquire(container)
-                        thread = threading.Thread(
-                            target=lambda:
-                                self._process_container(other_container, container)
-                                or self._lock_manager.release(container)
-                        )
-                        thread.setDaemon(True)
-                        self._threads.append(thread)
-                        thread.start()
-                    except ContainerIsLocked:
-                        pass
-                    except:
-                        self._lock_manager.release(container)
-                        traceback.print_exc(file=sys.stdout)
+            duplicates = duplicates_by_name.get((container.get_host(), container.get_name()))
+
+            if duplicates:
+                self._submit_locked(
+                    container,
+                    lambda token, duplicates=duplicates, original=container:
+                    self._process_duplicates(duplicates, original)
+                )
+
+    def _index_by_original_name(self, containers: list) -> dict:
+        """ Duplicated containers grouped by host and name of the container they duplicate """
+
+        index = {}
+
+        for container in containers:
+            match = self._DUPLICATE_NAME.match(container.get_name())
+
+            if match:
+                index.setdefault((container.get_host(), match.group(2)), []).append(container)
+
+        return index
+
+    def _process_duplicates(self, duplicates: list, container: Container):
+        """ Executes IN A WORKER """
+
+        for duplicated in duplicates:
+            try:
+                self._process_container(duplicated, container)
+            except:
+                traceback.print_exc(file=sys.stdout)
 
     def _process_container(self, duplicated: Container, container: Container):
-        """ Threaded method """
-        tornado.log.app_log.warn('Stopping and removing container "' + duplicated.get_name() + '", it\'s a ' +
-                                 'duplication of "' + container.get_name() + '"')
+        """ Executes IN A WORKER """
+        tornado.log.app_log.warn('Stopping and removing container "' + duplicated.identify() + '", it\'s a ' +
+                                 'duplication of "' + container.identify() + '"')
 
-        self._adapter.remove_container(duplicated.get_name())
+        self._adapter.remove_container(duplicated.identify())
         self._notify.container_was_removed(duplicated)
 
 
@@ -101,55 +147,82 @@ class HealTask(Task):
     _POLICY_DO_NOT_TOUCH = 'dnt'
     _POLICY_LONGER_WAIT = 'long_wait'
 
+    _delayed: DelayedActionQueue
+    _clock: Clock
+
+    def __init__(self, adapter: Adapter, journal: Journal, app_policy: ApplicationGlobalPolicy,
+                 workers: WorkerPool, notify: Notify, lock_manager: LockingManager, delayed: DelayedActionQueue,
+                 clock: Clock = system_clock):
+        super().__init__(adapter, journal, app_policy, workers, notify, lock_manager)
+        self._delayed = delayed
+        self._clock = clock
+
     def process(self):
-        unhealthy = self._adapter.find_all_unhealthy_containers_in_namespace()
+        for container in self._adapter.find_all_unhealthy_containers_in_namespace():
+            self.heal(container)
 
-        for container in unhealthy:
-            try:
-                self._lock_manager.acquire(container)
-                thread = threading.Thread(
-                    target=lambda: self._process_container(container) or self._lock_manager.release(container)
-                )
-                thread.setDaemon(True)
-                self._threads.append(thread)
-                thread.start()
+    def heal(self, container: Container):
+        """ Starts healing of the container in the background, unless it is already in progress """
 
-            except ContainerIsLocked:
-                pass
-            except:
-                traceback.print_exc(file=sys.stdout)
+        self._submit_locked(container, lambda token: self._process_container(container, token))
 
-    def _process_container(self, container: Container):
-        """ Process method for a container, executes IN A THREAD """
+    def _process_container(self, container: Container, token: str):
+        """ Process method for a container, executes IN A WORKER """
 
-        tornado.log.app_log.debug('Preparing to restart container "' + container.get_name() + '"')
+        tornado.log.app_log.debug('Preparing to restart container "' + container.identify() + '"')
         policy = self._find_out_what_to_do_with_container(container)
+        log = self._create_lazy_log(container)
 
         if policy == self._POLICY_DO_NOT_TOUCH:
             if self._journal.record_do_not_touch(container):
                 self._notify.not_touching_anymore(container)
 
-            tornado.log.app_log.info('Will not be touching "' + container.get_name() + '" anymore')
+            tornado.log.app_log.info('Will not be touching "' + container.identify() + '" anymore')
             return
 
         if isinstance(policy, int) or isinstance(policy, float):
-            tornado.log.app_log.warn('Waiting ' + str(policy) + 's for container "' + container.get_name() + '" ' +
+            tornado.log.app_log.warn('Waiting ' + str(policy) + 's for container "' + container.identify() + '" ' +
                                      'before next restart')
-            self._notify.multiple_failures_happened(container, self._adapter.get_log(container.get_name()))
-            time.sleep(policy)
+            self._notify.multiple_failures_happened(container, log)
+
+            return self._postpone_locked(container, token, policy, lambda: self._restart_container(container, log))
 
         if policy == self._POLICY_LONGER_WAIT:
-            tornado.log.app_log.error('Maximum restarts reached for "' + container.get_name() + '". ' +
+            tornado.log.app_log.error('Maximum restarts reached for "' + container.identify() + '". ' +
                                       'Waiting a bit longer (' + str(container.policy.seconds_between_next_frame) + 's)')
-            self._notify.max_restarts_reached(container, self._adapter.get_log(container.get_name()))
-            time.sleep(container.policy.seconds_between_next_frame)
-            self._journal.record_max_restarts_reached_and_waited(container)
+            self._notify.max_restarts_reached(container, log)
+
+            return self._postpone_locked(container, token, container.policy.seconds_between_next_frame,
+                                         lambda: self._restart_container_in_next_frame(container, log))
+
+        self._restart_container(container, log)
+
+    def _postpone_locked(self, container: Container, token: str, delay: float, action: typing.Callable) -> str:
+        """ Plans the action to be executed later in a worker, the container stays locked until then """
 
-        tornado.log.app_log.info('Sending restart signal for "' + container.get_name() + '"')
+        # the lease would expire during a wait longer than its lifetime, and the container could be healed twice
+        if not self._lock_manager.extend(container, token, delay):
+            tornado.log.app_log.warn('Lost the lock on "' + container.identify() + '", not postponing the restart')
+            return None
+
+        self._delayed.schedule(delay, container.identify(),
+                               lambda: self._execute_and_release(container, lambda owned_token: action(), token))
+        return self._KEEP_LOCKED
+
+    def _restart_container_in_next_frame(self, container: Container, log: LazyLog):
+        self._journal.record_max_restarts_reached_and_waited(container)
+        self._restart_container(container, log)
+
+    def _restart_container(self, container: Container, log: LazyLog):
+        tornado.log.app_log.info('Sending restart signal for "' + container.identify() + '"')
         self._journal.record_restart(container)
-        self._adapter.restart_container(container.get_name())
-        self._notify.container_was_restarted(container, self._adapter.get_log(container.get_name()))
-        tornado.log.app_log.debug('Container "' + container.get_name() + '" was restarted')
+        self._adapter.restart_container(container.identify())
+        self._notify.container_was_restarted(container, log)
+        tornado.log.app_log.debug('Container "' + container.identify() + '" was restarted')
+
+    def _create_lazy_log(self, container: Container) -> LazyLog:
+        return LazyLog(lambda: self._adapter.get_log(container.identify(),
+                                                     max_bytes=self._app_policy.notify_log_max_bytes))
 
     def _find_out_what_to_do_with_container(self, container: Container):
         """ Policy method, decides if we can restart the container NOW or if we wait a little bit """
@@ -162,18 +235,20 @@ class HealTask(Task):
         restart_count = self._journal.find_restart_count_in_frame(container)
         last_restart_time = self._journal.find_last_restart_time(container)
 
-        if last_restart_time > time.time():
+        now = self._clock.time()
+
+        if last_restart_time > now:
             tornado.log.app_log.error('A container is marked that last restart time was in the FUTURE! ' +
                                       'Please check your timezone settings, if everything looks fine ' +
                                       'then report a BUG in Repairman')
 
-        tornado.log.app_log.debug('Container "' + container.get_name() + '" has restart_count=' + str(restart_count) +
+        tornado.log.app_log.debug('Container "' + container.identify() + '" has restart_count=' + str(restart_count) +
                                   ' and last_restart_time=' + str(last_restart_time))
 
         if restart_count >= container.policy.max_restarts_in_frame > 0:
             return self._POLICY_LONGER_WAIT
 
-        if last_restart_time + container.policy.seconds_between_restarts > time.time():
-            return (last_restart_time + container.policy.seconds_between_restarts) - time.time()
+        if last_restart_time + container.policy.seconds_between_restarts > now:
+            return (last_restart_time + container.policy.seconds_between_restarts) - now
 
         return self._POLICY_RESTART
@@ -1,51 +1,110 @@
-
 import time as pyTime
+import abc
 import os
 import subprocess
+import threading
 import tornado.log
 
 
-class Time:
-    _isTZSet = False
+class Clock(metaclass=abc.ABCMeta):
+    """ Source of time. Wall time is stored in the journal, monotonic time is used to measure waits """
+
+    @abc.abstractmethod
+    def time(self) -> float:
+        pass
+
+    @abc.abstractmethod
+    def monotonic(self) -> float:
+        pass
+
+    @abc.abstractmethod
+    def sleep(self, secs: float):
+        pass
+
+
+class SystemClock(Clock):
+    """ Operating system clock, the timezone is discovered only once """
+
+    _tz_lock = threading.Lock()
+    _is_tz_set = False
+
+    def time(self) -> float:
+        self.discover_timezone()
+        return pyTime.time()
+
+    def monotonic(self) -> float:
+        return pyTime.monotonic()
+
+    def sleep(self, secs: float):
+        tornado.log.app_log.debug('Sleeping ' + str(secs) + ' seconds')
+        pyTime.sleep(secs)
 
     @staticmethod
     def discover_timezone():
-        if Time._isTZSet:
+        if SystemClock._is_tz_set:
             return
 
-        if os.path.isfile('/etc/timezone'):
-            handle = open('/etc/timezone', 'rb')
-            os.environ['TZ'] = handle.read().decode('utf-8').strip()
-            pyTime.tzset()
+        with SystemClock._tz_lock:
+            if SystemClock._is_tz_set:
+                return
 
-            handle.close()
-            return
+            # even if the discovery fails, then it should not be repeated on each call
+            SystemClock._is_tz_set = True
+            timezone = SystemClock._read_timezone()
 
-        output = subprocess.check_output('timedatectl|grep "Time zone"', shell=True).decode('utf-8')
+            if timezone:
+                os.environ['TZ'] = timezone
+                pyTime.tzset()
+
+    @staticmethod
+    def _read_timezone() -> str:
+        if os.path.isfile('/etc/timezone'):
+            with open('/etc/timezone', 'rb') as handle:
+                return handle.read().decode('utf-8').strip()
 
         try:
-            os.environ['TZ'] = output.split(': ')[1].split(' ')[0]
-            pyTime.tzset()
+            output = subprocess.check_output('timedatectl|grep "Time zone"', shell=True).decode('utf-8')
+            return output.split(': ')[1].split(' ')[0]
 
-        except KeyError:
-            return
+        except (subprocess.CalledProcessError, IndexError):
+            return ''
 
-    @staticmethod
-    def time():
-        Time.discover_timezone()
-        return pyTime.time()
 
-    @staticmethod
-    def sleep(secs):
-        Time.discover_timezone()
+class VirtualClock(Clock):
+    """ Time that passes only when told to. Sleeping moves the time forward immediately """
 
-        tornado.log.app_log.debug('Sleeping ' + str(secs) + ' seconds')
-        return pyTime.sleep(secs)
+    _now: float
+    _monotonic: float
+    _lock: threading.Lock
+
+    def __init__(self, start: float = 1555000000.0):
+        self._now = start
+        self._monotonic = 0.0
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        with self._lock:
+            return self._now
+
+    def monotonic(self) -> float:
+        with self._lock:
+            return self._monotonic
+
+    def sleep(self, secs: float):
+        self.advance(secs)
+
+    def advance(self, secs: float):
+        with self._lock:
+            self._now += max(secs, 0)
+            self._monotonic += max(secs, 0)
+
+
+system_clock = SystemClock()
 
 
 def sleep(secs):
-    Time.sleep(secs)
+    system_clock.sleep(secs)
 
 
 def time():
-    return Time.time()
+    return system_clock.time()
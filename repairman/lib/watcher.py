@@ -0,0 +1,41 @@
+
+import threading
+import time
+import traceback
+import sys
+import tornado.log
+from .adapter import Adapter
+from .tasks import HealTask
+
+
+class EventsWatcher:
+    """ Passes containers reported by the Docker events stream straight to the HealTask """
+
+    _RECONNECT_DELAY = 5
+
+    _adapter: Adapter
+    _task: HealTask
+    _thread: threading.Thread
+
+    def __init__(self, adapter: Adapter, task: HealTask):
+        self._adapter = adapter
+        self._task = task
+
+    def run(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            tornado.log.app_log.info('Subscribing to the Docker events stream')
+
+            try:
+                for container in self._adapter.stream_unhealthy_containers_in_namespace():
+                    self._task.heal(container)
+
+            except Exception as e:
+                traceback.print_exc(file=sys.stdout)
+                tornado.log.app_log.warn('Docker events stream broke: ' + str(e))
+
+            time.sleep(self._RECONNECT_DELAY)
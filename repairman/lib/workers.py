@@ -0,0 +1,92 @@
+
+import queue
+import threading
+import traceback
+import typing
+import sys
+from .exception import WorkerPoolFull
+
+
+class WorkerPool:
+    """ Executes actions on containers in a limited number of threads with a limited queue of waiting actions """
+
+    _queue: queue.Queue
+    _threads: list  # type: list[threading.Thread]
+    _lock: threading.Lock
+    _active: int
+    _completed: int
+    _failed: int
+    _rejected: int
+
+    def __init__(self, workers: int, queue_size: int):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+
+        for i in range(0, workers):
+            thread = threading.Thread(target=self._work, name='worker-' + str(i))
+            thread.setDaemon(True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, action: typing.Callable):
+        try:
+            self._queue.put_nowait(action)
+
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+
+            raise WorkerPoolFull('Too many actions are waiting for execution (' + str(self._queue.maxsize) + ')')
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': len(self._threads),
+                'active': self._active,
+                'queued': self._queue.qsize(),
+                'completed': self._completed,
+                'failed': self._failed,
+                'rejected': self._rejected
+            }
+
+    def run_pending(self) -> int:
+        """ Executes queued actions in the calling thread, eg. when there are no workers. Returns a count """
+
+        executed = 0
+
+        while True:
+            try:
+                action = self._queue.get_nowait()
+            except queue.Empty:
+                return executed
+
+            self._execute(action)
+            executed += 1
+
+    def _work(self):
+        while True:
+            self._execute(self._queue.get())
+
+    def _execute(self, action: typing.Callable):
+        with self._lock:
+            self._active += 1
+
+        succeeded = False
+
+        try:
+            action()
+            succeeded = True
+        except:
+            traceback.print_exc(file=sys.stdout)
+
+        with self._lock:
+            self._active -= 1
+            self._completed += 1
+
+            if not succeeded:
+                self._failed += 1
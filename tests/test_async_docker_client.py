@@ -0,0 +1,187 @@
+import unittest
+import sys
+import os
+import inspect
+import asyncio
+import json
+import tempfile
+import threading
+import time
+import mock
+import docker.errors
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.asyncdocker import AsyncDockerClient
+    from ..repairman.lib.adapter import AsyncDockerAdapter
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.asyncdocker import AsyncDockerClient
+    from repairman.lib.adapter import AsyncDockerAdapter
+    from test_docker_adapter import create_policy
+
+
+def chunked(*chunks: bytes) -> bytes:
+    return b''.join(map(lambda chunk: format(len(chunk), 'x').encode() + b'\r\n' + chunk + b'\r\n', chunks)) \
+        + b'0\r\n\r\n'
+
+
+def frame(payload: bytes) -> bytes:
+    return b'\x01\x00\x00\x00' + len(payload).to_bytes(4, 'big') + payload
+
+
+class FakeDocker:
+    """ Answers requests on a unix socket, counts the connections """
+
+    def __init__(self, responses: dict):
+        self.responses = responses
+        self.connections = 0
+        self.requests = []
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+
+        while True:
+            request_line = await reader.readline()
+
+            if not request_line:
+                break
+
+            while (await reader.readline()).strip():
+                pass
+
+            self.requests.append(request_line.decode().split()[1])
+            status, body = self.responses[request_line.decode().split()[1].split('?')[0]]
+            headers = b'Content-Type: application/json\r\nTransfer-Encoding: chunked\r\n' if body else b''
+            writer.write(b'HTTP/1.1 ' + status + b'\r\n' + headers + b'\r\n' + body)
+            await writer.drain()
+
+        writer.close()
+
+
+class AsyncDockerClientTest(unittest.TestCase):
+
+    def _run(self, responses: dict, scenario, timeout: int = 5):
+        docker_server = FakeDocker(responses)
+        socket_path = tempfile.mktemp(suffix='.sock')
+        loop = asyncio.new_event_loop()
+
+        async def run():
+            server = await asyncio.start_unix_server(docker_server.handle, path=socket_path)
+
+            client = AsyncDockerClient(socket_path=socket_path, timeout=timeout, version='1.40')
+
+            try:
+                return await scenario(client)
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+                await asyncio.sleep(0.01)
+
+        try:
+            return loop.run_until_complete(run()), docker_server
+        finally:
+            loop.close()
+            os.unlink(socket_path)
+
+    def test_keeps_connection_alive_and_decodes_chunks(self):
+        async def scenario(client: AsyncDockerClient):
+            listed = await client.list_containers(all=True, filters={'health': 'unhealthy'})
+            inspected = await client.inspect_container('iwa_app')
+            log = b''
+
+            async for chunk in client.logs('iwa_app', tail=10, tty=False):
+                log += chunk
+
+            return listed, inspected, log
+
+        (listed, inspected, log), docker_server = self._run({
+            '/v1.40/containers/json': (b'200 OK', chunked(b'[{"Id": "1",', b' "Names": ["/iwa_app"]}]')),
+            '/v1.40/containers/iwa_app/json': (b'200 OK', chunked(json.dumps({'Id': '1'}).encode())),
+            '/v1.40/containers/iwa_app/logs': (b'200 OK', chunked(frame(b'first\n')[0:5],
+                                                                 frame(b'first\n')[5:] + frame(b'second\n')))
+        }, scenario)
+
+        self.assertEqual([{'Id': '1', 'Names': ['/iwa_app']}], listed)
+        self.assertEqual({'Id': '1'}, inspected)
+        self.assertEqual(b'first\nsecond\n', log)
+        self.assertEqual(1, docker_server.connections, 'Expected the connection to be reused')
+        self.assertIn('filters=%7B%22health%22%3A+%5B%22unhealthy%22%5D%7D', docker_server.requests[0])
+
+    def test_no_content_responses_do_not_wait_for_the_connection_to_close(self):
+        """ Docker answers restart and remove with "204 No Content" without a length and keeps the connection """
+
+        async def scenario(client: AsyncDockerClient):
+            await client.restart('iwa_app', stop_timeout=0)
+            await client.remove('iwa_app')
+
+        started_at = time.monotonic()
+        result, docker_server = self._run({
+            '/v1.40/containers/iwa_app/restart': (b'204 No Content', b''),
+            '/v1.40/containers/iwa_app': (b'204 No Content', b'')
+        }, scenario, timeout=2)
+
+        self.assertLess(time.monotonic() - started_at, 1)
+        self.assertEqual(2, len(docker_server.requests))
+        self.assertEqual(1, docker_server.connections, 'Expected the connection to be reused')
+
+    def test_not_found_is_reported_like_in_docker_py(self):
+        async def scenario(client: AsyncDockerClient):
+            await client.inspect_container('iwa_app')
+
+        self.assertRaises(docker.errors.NotFound, lambda: self._run({
+            '/v1.40/containers/iwa_app/json': (b'404 Not Found', chunked(b'{"message": "No such container"}'))
+        }, scenario))
+
+
+class AsyncDockerAdapterTest(unittest.TestCase):
+
+    def test_candidates_are_inspected_at_once(self):
+        """ Each inspection waits until all of them are started, it would never finish when inspected one by one """
+
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever)
+        thread.setDaemon(True)
+        thread.start()
+        started = []
+        all_started = None
+
+        async def list_containers(all: bool = False, filters: dict = None) -> list:
+            if 'health' not in (filters or {}):
+                return []
+
+            return list(map(lambda name: {'Id': name, 'Names': ['/' + name], 'State': 'running', 'Labels': {}},
+                            ['iwa_app', 'iwa_db', 'iwa_removed']))
+
+        async def inspect_container(container_id: str) -> dict:
+            nonlocal all_started
+            # created on the loop, which runs in the other thread
+            all_started = all_started or asyncio.Event()
+            started.append(container_id)
+
+            if len(started) == 3:
+                all_started.set()
+
+            await asyncio.wait_for(all_started.wait(), timeout=2)
+
+            if container_id == 'iwa_removed':
+                raise docker.errors.NotFound('No such container')
+
+            return {'Id': container_id, 'Name': '/' + container_id, 'Created': '2019-04-11T16:26:40',
+                    'State': {'Status': 'running', 'ExitCode': 0, 'Health': {'Status': 'unhealthy'}},
+                    'Config': {'Labels': {}}}
+
+        client = mock.Mock(list_containers=list_containers, inspect_container=inspect_container)
+        adapter = AsyncDockerAdapter(create_policy(), mock.Mock(), client, loop)
+
+        try:
+            unhealthy = adapter.find_all_unhealthy_containers_in_namespace()
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+        self.assertEqual(['iwa_app', 'iwa_db'], sorted(map(lambda container: container.get_name(), unhealthy)))
@@ -0,0 +1,29 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.time import SystemClock
+except ImportError:
+    from repairman.lib.time import SystemClock
+
+
+class SystemClockTest(unittest.TestCase):
+
+    def test_timezone_is_discovered_once(self):
+        """ Failed discovery is not repeated, to not spawn a shell on every call """
+
+        clock = SystemClock()
+
+        with mock.patch.object(SystemClock, '_is_tz_set', False), \
+                mock.patch('os.path.isfile', return_value=False), \
+                mock.patch('subprocess.check_output', return_value=b'') as check_output:
+            clock.time()
+            clock.time()
+
+        check_output.assert_called_once()
@@ -0,0 +1,44 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.tasks import DeduplicationTask
+    from ..repairman.lib.workers import WorkerPool
+    from ..repairman.lib.semaphore import LockingManager
+    from ..repairman.lib.entity import Container
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.tasks import DeduplicationTask
+    from repairman.lib.workers import WorkerPool
+    from repairman.lib.semaphore import LockingManager
+    from repairman.lib.entity import Container
+    from test_docker_adapter import create_policy
+
+
+class DeduplicationTaskTest(unittest.TestCase):
+
+    def test_removes_all_duplicates_in_one_pass(self):
+        policy = create_policy(enable_cleaning_duplicated_services=True)
+        containers = list(map(
+            lambda name: Container(name, 'running', 0, '2019-04-11T16:26:40', policy.create_service_policy({})),
+            ['iwa_app', 'iwa_db', '0123456789ab_iwa_app', 'abcdef012345_iwa_app', 'not-a-hex-id_iwa_db',
+             '0123456789ab_other_app']
+        ))
+        adapter = mock.Mock()
+        adapter.find_all_containers.return_value = containers
+        adapter.find_all_containers_in_namespace.return_value = containers[0:2]
+        workers = WorkerPool(workers=0, queue_size=10)
+        task = DeduplicationTask(adapter=adapter, journal=mock.Mock(), app_policy=policy, workers=workers,
+                                 notify=mock.Mock(), lock_manager=LockingManager())
+
+        task.process()
+        workers.run_pending()
+
+        self.assertEqual([mock.call('0123456789ab_iwa_app'), mock.call('abcdef012345_iwa_app')],
+                         adapter.remove_container.call_args_list)
@@ -0,0 +1,43 @@
+import unittest
+import sys
+import os
+import inspect
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.delayed import DelayedActionQueue
+    from ..repairman.lib.workers import WorkerPool
+except ImportError:
+    from repairman.lib.delayed import DelayedActionQueue
+    from repairman.lib.workers import WorkerPool
+
+
+class DelayedActionQueueTest(unittest.TestCase):
+
+    def test_submits_only_due_actions(self):
+        """ Only actions which time has come are passed to the workers, the rest is waiting without a thread """
+
+        workers = WorkerPool(workers=0, queue_size=10)
+        queue = DelayedActionQueue(workers=workers)
+        queue.schedule(600, 'later', lambda: None)
+        queue.schedule(0, 'now', lambda: None)
+
+        next_in = queue.run_due()
+
+        self.assertEqual(1, workers.get_stats()['queued'])
+        self.assertEqual(['later'], list(map(lambda pending: pending['key'], queue.get_pending())))
+        self.assertTrue(590 < next_in <= 600)
+
+    def test_keeps_action_when_workers_are_full(self):
+        """ Due action is retried later, when there is no place in the WorkerPool """
+
+        workers = WorkerPool(workers=0, queue_size=1)
+        queue = DelayedActionQueue(workers=workers)
+        queue.schedule(0, 'first', lambda: None)
+        queue.schedule(0, 'second', lambda: None)
+
+        queue.run_due()
+
+        self.assertEqual(['second'], list(map(lambda pending: pending['key'], queue.get_pending())))
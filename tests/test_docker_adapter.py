@@ -0,0 +1,158 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+from docker.models.containers import Container as DockerContainer
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.adapter import DockerAdapter
+    from ..repairman.lib.entity import ApplicationGlobalPolicy
+    from ..repairman.lib import metrics
+except ImportError:
+    from repairman.lib.adapter import DockerAdapter
+    from repairman.lib.entity import ApplicationGlobalPolicy
+    from repairman.lib import metrics
+
+
+def create_policy(**params) -> ApplicationGlobalPolicy:
+    return ApplicationGlobalPolicy({
+        'debug': False, 'interval': 90, 'namespace': 'iwa_', 'seconds_between_restarts': 15,
+        'frame_size_in_seconds': 300, 'max_restarts_in_frame': 2, 'seconds_between_next_frame': 600,
+        'max_checks_to_give_up': 50, 'max_historic_entries': 50, 'enable_cleaning_duplicated_services': False,
+        'enable_autoheal': True, 'notify_url': '', 'notify_level': 'INFO', 'db_path': ':memory:',
+        'watch_events': False, 'reconciliation_interval': 600, 'snapshot_max_age': 5, 'policy_cache_size': 2,
+        **params
+    })
+
+
+def create_sparse(container_id: str, name: str, state: str = 'running') -> DockerContainer:
+    return DockerContainer(attrs={'Id': container_id, 'Names': ['/' + name], 'State': state,
+                                  'Created': 1555000000, 'Labels': {}})
+
+
+def create_inspected(container_id: str, name: str, state: dict) -> DockerContainer:
+    return DockerContainer(attrs={'Id': container_id, 'Name': '/' + name, 'State': state,
+                                  'Created': '2019-04-11T16:26:40', 'Config': {'Labels': {}}})
+
+
+class DockerAdapterTest(unittest.TestCase):
+
+    def _create_adapter(self, host: str = '', **params) -> DockerAdapter:
+        with mock.patch('docker.from_env'):
+            return DockerAdapter(create_policy(**params), mock.Mock(), host=host)
+
+    def test_inspects_only_unhealthy_candidates(self):
+        """ Containers are listed sparse, only the ones matching server-side filters are inspected """
+
+        adapter = self._create_adapter()
+        listed = {
+            'all': [create_sparse('1', 'iwa_app'), create_sparse('2', 'iwa_db'), create_sparse('3', 'other')],
+            'unhealthy': [create_sparse('2', 'iwa_db')],
+            'exited': [create_sparse('4', 'iwa_worker', 'exited')]
+        }
+        inspected = {
+            '2': create_inspected('2', 'iwa_db', {'Status': 'running', 'ExitCode': 0,
+                                                  'Health': {'Status': 'unhealthy'}}),
+            '4': create_inspected('4', 'iwa_worker', {'Status': 'exited', 'ExitCode': 1})
+        }
+
+        def list_containers(all=False, sparse=False, filters=None):
+            self.assertTrue(sparse, 'Expected that containers will be not inspected while listing')
+
+            if not filters:
+                return listed['all']
+
+            self.assertEqual('^/iwa_', filters['name'])
+            return listed['unhealthy'] if 'health' in filters else listed['exited']
+
+        adapter.api.containers.list.side_effect = list_containers
+        adapter.api.containers.get.side_effect = lambda container_id: inspected[container_id]
+
+        self.assertEqual(['iwa_app', 'iwa_db', 'other'], [c.get_name() for c in adapter.find_all_containers()])
+        self.assertEqual(['iwa_app', 'iwa_db'], [c.get_name() for c in adapter.find_all_containers_in_namespace()])
+        self.assertEqual(['iwa_db', 'iwa_worker'],
+                         [c.get_name() for c in adapter.find_all_unhealthy_containers_in_namespace()])
+        self.assertEqual(2, adapter.api.containers.get.call_count)
+        self.assertEqual(3, adapter.api.containers.list.call_count, 'Expected the snapshot to be reused')
+
+    def test_heals_only_containers_exited_with_failure(self):
+        """ Stopped containers are in scope too, but not the ones stopped by a signal or exited cleanly """
+
+        adapter = self._create_adapter()
+        exit_codes = {'1': 1, '2': 0, '3': 137, '4': 143, '5': 255}
+        names = {'1': 'iwa_crashed', '2': 'iwa_done', '3': 'iwa_killed', '4': 'iwa_stopped', '5': 'iwa_error'}
+
+        def list_containers(all=False, sparse=False, filters=None):
+            if filters and filters.get('status') == 'exited':
+                self.assertTrue(all, 'Expected stopped containers to be listed')
+                return [create_sparse(container_id, names[container_id], 'exited') for container_id in exit_codes]
+
+            return []
+
+        adapter.api.containers.list.side_effect = list_containers
+        adapter.api.containers.get.side_effect = lambda container_id: create_inspected(
+            container_id, names[container_id], {'Status': 'exited', 'ExitCode': exit_codes[container_id]})
+
+        self.assertEqual(['iwa_crashed', 'iwa_error'],
+                         [c.get_name() for c in adapter.find_all_unhealthy_containers_in_namespace()])
+
+    def test_creation_date_of_listed_and_inspected_containers_has_same_format(self):
+        adapter = self._create_adapter()
+
+        inspected = create_inspected('1', 'iwa_app', {})
+        inspected.attrs['Created'] = '2019-04-11T16:26:40.123456789Z'
+
+        self.assertEqual('2019-04-11T16:26:40Z', adapter._get_created_at(create_sparse('1', 'iwa_app')))
+        self.assertEqual('2019-04-11T16:26:40.123456789Z', adapter._get_created_at(inspected))
+
+    def test_filters_by_label_when_autoheal_is_disabled_globally(self):
+        """ When autoheal is not enabled by default, then only labelled containers can be healed """
+
+        adapter = self._create_adapter(enable_autoheal=False, namespace='')
+
+        self.assertEqual({'label': 'org.riotkit.repairman.enable_autoheal'}, adapter._create_namespace_filters())
+
+    def test_log_is_limited_by_bytes(self):
+        """ A container printing very long lines should not end up in memory or in a notification as a whole """
+
+        adapter = self._create_adapter()
+        adapter.api.containers.get.return_value.logs.return_value = iter([b'a' * 1000, b'b' * 1000, b'\xc5\x82ast'])
+
+        log = adapter.get_log('iwa_app', max_bytes=6)
+
+        self.assertEqual('...błast', log)
+        adapter.api.containers.get.return_value.logs.assert_called_once_with(tail=10, stream=True, follow=False)
+
+    def test_containers_with_same_labels_share_policy(self):
+        adapter = self._create_adapter()
+        labels = {'org.riotkit.repairman.max_restarts_in_frame': '1', 'com.docker.compose.service': 'app'}
+
+        first = adapter._map_container(create_inspected('1', 'iwa_app_1', {'Status': 'running', 'ExitCode': 0}))
+        second = adapter._map_container(create_inspected('2', 'iwa_app_2', {'Status': 'running', 'ExitCode': 0}))
+        labelled = create_inspected('3', 'iwa_db', {'Status': 'running', 'ExitCode': 0})
+        labelled.attrs['Config']['Labels'] = labels
+
+        self.assertIs(first.policy, second.policy)
+        self.assertEqual(1, adapter._map_container(labelled).policy.max_restarts_in_frame)
+        self.assertEqual({'hits': 1, 'misses': 2, 'size': 2}, adapter.policy.policy_cache.get_stats())
+
+    def test_configuration_errors_are_remembered_per_daemon(self):
+        """ Same container name on two daemons is reported for each daemon, but only once per 10 minutes """
+
+        adapters = [self._create_adapter(host='web-1'), self._create_adapter(host='web-2')]
+        invalid = create_inspected('1', 'iwa_invalid', {'Status': 'running', 'ExitCode': 0})
+        invalid.attrs['Config']['Labels'] = {'org.riotkit.repairman.max_restarts_in_frame': 'many'}
+
+        for adapter in adapters + adapters:
+            self.assertIsNone(adapter._map_container(invalid))
+
+        for adapter in adapters:
+            self.assertEqual(1, adapter.notify.any_container_configuration_invalid.call_count)
+
+        self.assertEqual(['web-1/iwa_invalid'], list(adapters[0]._invalid_containers.keys()))
+        self.assertEqual(2, metrics.CONFIGURATION_ERRORS._values[('web-1/iwa_invalid',)])
+        self.assertEqual(2, metrics.CONFIGURATION_ERRORS._values[('web-2/iwa_invalid',)])
@@ -0,0 +1,101 @@
+import unittest
+import sys
+import os
+import inspect
+import threading
+import time
+import docker.errors
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.adapter import DockerAdapter
+    from ..repairman.lib.watcher import EventsWatcher
+    from .test_docker_adapter import create_policy, create_inspected
+except ImportError:
+    from repairman.lib.adapter import DockerAdapter
+    from repairman.lib.watcher import EventsWatcher
+    from test_docker_adapter import create_policy, create_inspected
+
+
+def create_event(container_id: str, name: str, action: str) -> dict:
+    return {'id': container_id, 'Action': action, 'Actor': {'Attributes': {'name': name}}}
+
+
+class EventsWatcherTest(unittest.TestCase):
+
+    def test_adapter_yields_only_unhealthy_containers_in_namespace(self):
+        api = mock.Mock()
+        api.events.return_value = iter([
+            create_event('1', 'iwa_app', 'health_status: unhealthy'),
+            create_event('2', 'iwa_app', 'health_status: healthy'),
+            create_event('3', 'other_app', 'die'),
+            create_event('4', 'iwa_worker', 'die'),
+            create_event('5', 'iwa_cron', 'die'),
+            create_event('6', 'iwa_removed', 'die'),
+            create_event('7', 'iwa_db', 'start')
+        ])
+        inspected = {
+            '1': create_inspected('1', 'iwa_app', {'Status': 'running', 'ExitCode': 0,
+                                                   'Health': {'Status': 'unhealthy'}}),
+            '4': create_inspected('4', 'iwa_worker', {'Status': 'exited', 'ExitCode': 1}),
+            '5': create_inspected('5', 'iwa_cron', {'Status': 'exited', 'ExitCode': 0})
+        }
+
+        def get(container_id: str):
+            if container_id not in inspected:
+                raise docker.errors.NotFound('No such container')
+
+            return inspected[container_id]
+
+        api.containers.get.side_effect = get
+        adapter = DockerAdapter(create_policy(), mock.Mock(), api=api)
+
+        self.assertEqual(['iwa_app', 'iwa_worker'],
+                         [container.get_name() for container in adapter.stream_unhealthy_containers_in_namespace()])
+        self.assertEqual({'type': 'container', 'event': ['health_status', 'die']},
+                         api.events.call_args[1]['filters'])
+
+    def test_adapter_subscribes_only_to_containers_with_enabled_healing(self):
+        api = mock.Mock()
+        api.events.return_value = iter([])
+        adapter = DockerAdapter(create_policy(enable_autoheal=False), mock.Mock(), api=api)
+
+        list(adapter.stream_unhealthy_containers_in_namespace())
+
+        self.assertEqual('org.riotkit.repairman.enable_autoheal', api.events.call_args[1]['filters']['label'])
+
+    def test_heals_reported_containers_and_reconnects_when_the_stream_breaks(self):
+        first, second = mock.Mock(), mock.Mock()
+        never = threading.Event()
+
+        def broken_stream():
+            yield first
+            raise ConnectionError('Connection reset by peer')
+
+        def next_stream():
+            yield second
+            # the connection stays open
+            never.wait()
+
+        adapter = mock.Mock()
+        adapter.stream_unhealthy_containers_in_namespace.side_effect = [broken_stream(), next_stream()]
+        task = mock.Mock()
+
+        watcher = EventsWatcher(adapter, task)
+        watcher._RECONNECT_DELAY = 0
+        watcher.run()
+
+        deadline = time.monotonic() + 5
+
+        while task.heal.call_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual([mock.call(first), mock.call(second)], task.heal.call_args_list)
+        self.assertEqual(2, adapter.stream_unhealthy_containers_in_namespace.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.tasks import HealTask
+    from ..repairman.lib.journal import Journal
+    from ..repairman.lib.workers import WorkerPool
+    from ..repairman.lib.semaphore import LockingManager
+    from ..repairman.lib.delayed import DelayedActionQueue
+    from ..repairman.lib.entity import Container
+    from ..repairman.lib.time import VirtualClock
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.tasks import HealTask
+    from repairman.lib.journal import Journal
+    from repairman.lib.workers import WorkerPool
+    from repairman.lib.semaphore import LockingManager
+    from repairman.lib.delayed import DelayedActionQueue
+    from repairman.lib.entity import Container
+    from repairman.lib.time import VirtualClock
+    from test_docker_adapter import create_policy
+
+
+class HealTaskTest(unittest.TestCase):
+
+    def test_waits_between_restarts_and_longer_after_max_restarts(self):
+        """ The policy decisions are driven by a virtual clock, nothing really sleeps """
+
+        clock = VirtualClock()
+        policy = create_policy(db_commit_interval=0, notify_log_max_bytes=2048)
+        adapter = mock.Mock()
+        workers = WorkerPool(workers=0, queue_size=10)
+        delayed = DelayedActionQueue(workers=workers, clock=clock)
+        task = HealTask(adapter=adapter, journal=Journal(policy, clock=clock), app_policy=policy, workers=workers,
+                        notify=mock.Mock(), lock_manager=LockingManager(clock=clock), delayed=delayed, clock=clock)
+        container = Container('iwa_app', 'unhealthy', 0, '2019-04-11T16:26:40', policy.create_service_policy({}))
+
+        def heal_and_wait(seconds: int):
+            task.heal(container)
+            workers.run_pending()
+            clock.advance(seconds)
+            delayed.run_due()
+            workers.run_pending()
+
+        # first restart immediately, then wait "seconds_between_restarts"
+        heal_and_wait(5)
+        heal_and_wait(9)
+        self.assertEqual(1, adapter.restart_container.call_count)
+        self.assertEqual(1, delayed.count_pending())
+
+        clock.advance(1)
+        delayed.run_due()
+        workers.run_pending()
+        self.assertEqual(2, adapter.restart_container.call_count)
+
+        # "max_restarts_in_frame" reached, waiting "seconds_between_next_frame"
+        heal_and_wait(599)
+        self.assertEqual(2, adapter.restart_container.call_count)
+
+        clock.advance(1)
+        delayed.run_due()
+        workers.run_pending()
+        self.assertEqual(3, adapter.restart_container.call_count)
+        self.assertEqual(0, delayed.count_pending())
+
+    def test_keeps_the_lock_while_waiting_longer_than_lock_lifetime(self):
+        """ The restart waits "seconds_between_next_frame", the lease must not expire in the meantime """
+
+        clock = VirtualClock()
+        policy = create_policy(db_commit_interval=0, notify_log_max_bytes=2048)
+        workers = WorkerPool(workers=0, queue_size=10)
+        delayed = DelayedActionQueue(workers=workers, clock=clock)
+        lock_manager = LockingManager(max_lock_lifetime=60, clock=clock)
+        journal = Journal(policy, clock=clock)
+        task = HealTask(adapter=mock.Mock(), journal=journal, app_policy=policy, workers=workers,
+                        notify=mock.Mock(), lock_manager=lock_manager, delayed=delayed, clock=clock)
+        container = Container('iwa_app', 'unhealthy', 0, '2019-04-11T16:26:40', policy.create_service_policy({}))
+
+        journal.record_restart(container)
+        journal.record_restart(container)
+        task.heal(container)
+        workers.run_pending()
+        self.assertEqual(1, delayed.count_pending())
+
+        clock.advance(300)
+        self.assertEqual(0, lock_manager.reap_expired())
+
+        task.heal(container)
+        self.assertEqual(0, workers.run_pending(), 'Expected the container to be still locked')
+
+        clock.advance(300)
+        delayed.run_due()
+        workers.run_pending()
+        self.assertEqual(0, lock_manager.get_stats()['held'])
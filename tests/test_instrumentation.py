@@ -0,0 +1,40 @@
+import unittest
+import sys
+import os
+import inspect
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.instrumentation import Instrumentation, NoopSpan
+except ImportError:
+    from repairman.lib.instrumentation import Instrumentation, NoopSpan
+
+
+class InstrumentationTest(unittest.TestCase):
+
+    def test_does_not_measure_when_disabled(self):
+        instrumentation = Instrumentation()
+
+        with instrumentation.span('docker.list') as span:
+            pass
+
+        self.assertIsInstance(span, NoopSpan)
+        self.assertEqual({}, instrumentation.get_stats())
+
+    def test_aggregates_timings_per_operation(self):
+        instrumentation = Instrumentation()
+        instrumentation.enabled = True
+
+        for duration in range(1, 101):
+            instrumentation.record('journal.fetch_one', duration / 100)
+
+        with instrumentation.span('docker.list'):
+            pass
+
+        stats = instrumentation.get_stats()
+
+        self.assertEqual({'count': 100, 'total': 50.5, 'p50': 0.51, 'p99': 1.0, 'max': 1.0},
+                         stats['journal.fetch_one'])
+        self.assertEqual(1, stats['docker.list']['count'])
@@ -0,0 +1,195 @@
+import unittest
+import sys
+import os
+import inspect
+import sqlite3
+import tempfile
+import time
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.journal import Journal
+except ImportError:
+    from repairman.lib.journal import Journal
+
+
+def create_container(name: str, frame_size_in_seconds: int = 300):
+    container = mock.Mock()
+    container.configure_mock(**{'get_name': lambda: name, 'identify': lambda: name})
+    container.policy.frame_size_in_seconds = frame_size_in_seconds
+    container.policy.max_restarts_in_frame = 2
+
+    return container
+
+
+def create_policy(db_path: str = ':memory:', db_commit_interval: float = 0):
+    policy = mock.Mock()
+    policy.db_path = db_path
+    policy.max_historic_entries = 50
+    policy.db_commit_interval = db_commit_interval
+
+    return policy
+
+
+class JournalTest(unittest.TestCase):
+
+    def test_counts_restarts_in_frame(self):
+        """ Restarts are counted in the current frame, archived ones are not counted """
+
+        journal = Journal(create_policy())
+        container = create_container('zsp')
+
+        journal.record_restart(container)
+        journal.record_restart(container)
+
+        self.assertEqual(2, journal.find_restart_count_in_frame(container))
+        self.assertFalse(journal.find_reached_max_restarts_in_previous_frame(container))
+
+        journal.record_max_restarts_reached_and_waited(container)
+
+        self.assertEqual(0, journal.find_restart_count_in_frame(container))
+        self.assertEqual(2, journal.get_total_restart_count_in_all_frames(container))
+        self.assertTrue(journal.find_reached_max_restarts_in_previous_frame(container))
+        self.assertGreater(journal.find_last_restart_time(container), 0)
+
+    def test_migrates_database_created_by_previous_version(self):
+        """ Events stored with only a text date are converted to unix timestamps """
+
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = directory + '/journal.sqlite3'
+
+            db = sqlite3.connect(db_path)
+            db.execute('''
+                CREATE TABLE journal (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT, container_name TEXT, event_type TEXT, 
+                    event_date TEXT, message TEXT, archived BOOLEAN
+                )
+            ''')
+            db.execute('''
+                INSERT INTO journal (container_name, event_type, event_date, message)
+                VALUES ('cnt', 'restart', datetime('now', '-60 seconds'), 'Container was restarted'),
+                       ('cnt', 'restart', datetime('now', '-900 seconds'), 'Container was restarted')
+            ''')
+            db.commit()
+            db.close()
+
+            journal = Journal(create_policy(db_path))
+            container = create_container('cnt')
+
+            self.assertEqual(1, journal.find_restart_count_in_frame(container))
+            self.assertEqual(2, journal.get_total_restart_count_in_all_frames(container))
+
+    def test_history_is_restored_from_database(self):
+        """ In-memory history is rebuilt at startup, and is rotated the same way as the database """
+
+        with tempfile.TemporaryDirectory() as directory:
+            policy = create_policy(directory + '/journal.sqlite3')
+            policy.max_historic_entries = 3
+            container = create_container('cnt')
+
+            journal = Journal(policy)
+
+            for i in range(0, 10):
+                journal.record_restart(container)
+
+            journal.record_do_not_touch(container)
+
+            restored = Journal(policy)
+
+            self.assertEqual(3, restored.get_total_restart_count_in_all_frames(container))
+            self.assertEqual(3, restored.find_restart_count_in_frame(container))
+            self.assertTrue(restored.find_is_marked_as_not_touch(container))
+            self.assertEqual(journal.find_last_restart_time(container), restored.find_last_restart_time(container))
+
+    def test_histories_of_removed_containers_are_forgotten(self):
+        """ Only listed containers are kept in memory, a container that comes back gets its history from database """
+
+        journal = Journal(create_policy())
+        containers = list(map(create_container, ['iwa_app', 'iwa_db', 'iwa_removed']))
+
+        for container in containers:
+            journal.record_restart(container)
+
+        journal.record_do_not_touch(containers[2])
+        journal.forget_histories_except(containers[0:2])
+
+        self.assertEqual(['iwa_app', 'iwa_db'], sorted(journal._histories.keys()))
+
+        self.assertEqual(1, journal.get_total_restart_count_in_all_frames(containers[2]))
+        self.assertTrue(journal.find_is_marked_as_not_touch(containers[2]))
+
+        journal.record_restart(containers[2])
+        self.assertEqual(2, journal.get_total_restart_count_in_all_frames(containers[2]))
+
+    def test_writes_are_committed_in_groups(self):
+        """ Other connections see the writes after flush(), or after the commit interval """
+
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = directory + '/journal.sqlite3'
+            container = create_container('cnt')
+
+            def count_committed() -> int:
+                reader = sqlite3.connect(db_path)
+
+                try:
+                    return reader.execute('SELECT count(*) FROM journal').fetchone()[0]
+                finally:
+                    reader.close()
+
+            journal = Journal(create_policy(db_path, db_commit_interval=3600))
+            journal.record_restart(container)
+            journal.record_restart(container)
+
+            self.assertEqual(0, count_committed())
+            self.assertEqual(2, journal.get_total_restart_count_in_all_frames(container))
+
+            journal.flush()
+            self.assertEqual(2, count_committed())
+
+            journal.record_restart(container)
+            journal.close()
+            self.assertEqual(3, count_committed(), 'Expected the rest of writes to be committed on close')
+
+            journal = Journal(create_policy(db_path, db_commit_interval=0.05))
+            journal.record_restart(container)
+            deadline = time.monotonic() + 5
+
+            while count_committed() < 4 and time.monotonic() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(4, count_committed())
+
+            journal.close()
+            self.assertFalse(journal._committer.is_alive())
+
+    def test_summary_lists_constantly_failing_containers(self):
+        """ Containers restarted over the limit in current frame, or again failing after previous frame failed """
+
+        journal = Journal(create_policy())
+        over_limit = create_container('over_limit')
+        failing_again = create_container('failing_again', frame_size_in_seconds=600)
+        healthy = create_container('healthy')
+
+        for i in range(0, 3):
+            journal.record_restart(over_limit)
+
+        journal.record_restart(failing_again)
+        journal.record_max_restarts_reached_and_waited(failing_again)
+        journal.record_restart(failing_again)
+
+        summary = journal.get_summary(lambda: [over_limit, failing_again, healthy], last_events_limit=2)
+
+        self.assertFalse(summary['global_status'])
+        self.assertEqual(2, len(summary['last_events']))
+        self.assertEqual(
+            [
+                {'id': 'over_limit', 'ident': 'over_limit=False', 'restarts_in_current_frame': 3,
+                 'reached_max_in_previous_frame': False},
+                {'id': 'failing_again', 'ident': 'failing_again=False', 'restarts_in_current_frame': 1,
+                 'reached_max_in_previous_frame': True}
+            ],
+            summary['constantly_failing']
+        )
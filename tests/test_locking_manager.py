@@ -10,9 +10,11 @@ sys.path.append(path)
 try:
     from ..repairman.lib.semaphore import LockingManager
     from ..repairman.lib.exception import ContainerIsLocked
+    from ..repairman.lib.time import VirtualClock
 except ImportError:
     from repairman.lib.semaphore import LockingManager
     from repairman.lib.exception import ContainerIsLocked
+    from repairman.lib.time import VirtualClock
 
 
 class ControllerTest(unittest.TestCase):
@@ -46,3 +48,47 @@ class ControllerTest(unittest.TestCase):
         manager.release(container)
 
         self.assertTrue(True)
+
+    def test_expired_lease_is_reaped_and_cannot_be_released_by_previous_owner(self):
+        """ A worker that held the lock for too long should not release a lock taken by someone else """
+
+        container = mock.Mock()
+        container.configure_mock(**{'identify': lambda: 'iwa_app'})
+        clock = VirtualClock()
+
+        manager = LockingManager(max_lock_lifetime=60, clock=clock)
+        first_token = manager.acquire(container)
+        clock.advance(61)
+
+        self.assertEqual(1, manager.reap_expired())
+
+        second_token = manager.acquire(container)
+        self.assertFalse(manager.release(container, first_token))
+        self.assertTrue(manager.release(container, second_token))
+
+        stats = manager.get_stats()
+        self.assertEqual((2, 1, 1, 1, 0), (stats['acquired'], stats['released'], stats['expired'],
+                                           stats['foreign_releases'], stats['held']))
+
+    def test_extended_lease_is_not_reaped_and_released_leases_do_not_pile_up_in_the_heap(self):
+        container = mock.Mock()
+        container.configure_mock(**{'identify': lambda: 'iwa_app'})
+        clock = VirtualClock()
+
+        manager = LockingManager(max_lock_lifetime=60, clock=clock)
+
+        for i in range(0, 1000):
+            manager.release(container, manager.acquire(container))
+
+        self.assertLessEqual(manager.get_stats()['heap_size'], 1)
+
+        token = manager.acquire(container)
+        self.assertFalse(manager.extend(container, 'not-an-owner', 600))
+        self.assertTrue(manager.extend(container, token, 600))
+
+        clock.advance(600)
+        self.assertEqual(0, manager.reap_expired())
+        self.assertRaises(ContainerIsLocked, lambda: manager.acquire(container))
+
+        clock.advance(61)
+        self.assertEqual(1, manager.reap_expired())
@@ -0,0 +1,44 @@
+import unittest
+import sys
+import os
+import inspect
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.metrics import Registry, Counter, Histogram, Gauge
+except ImportError:
+    from repairman.lib.metrics import Registry, Counter, Histogram, Gauge
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_renders_text_exposition_format(self):
+        registry = Registry()
+        counter = registry.register(Counter('restarts_total', 'Restarts', ['container']))
+        histogram = registry.register(Histogram('restart_seconds', 'Restart time', buckets=(1, 5)))
+        registry.register(Gauge('queued', 'Queued actions', lambda: 3))
+
+        counter.inc({'container': 'iwa_"ait"'})
+        counter.inc({'container': 'iwa_"ait"'})
+        histogram.observe(0.5)
+        histogram.observe(3)
+        histogram.observe(10)
+
+        self.assertEqual(
+            '# HELP restarts_total Restarts\n'
+            '# TYPE restarts_total counter\n'
+            'restarts_total{container="iwa_\\"ait\\""} 2\n'
+            '# HELP restart_seconds Restart time\n'
+            '# TYPE restart_seconds histogram\n'
+            'restart_seconds_bucket{le="1"} 1\n'
+            'restart_seconds_bucket{le="5"} 2\n'
+            'restart_seconds_bucket{le="+Inf"} 3\n'
+            'restart_seconds_sum 13.5\n'
+            'restart_seconds_count 3\n'
+            '# HELP queued Queued actions\n'
+            '# TYPE queued gauge\n'
+            'queued 3\n',
+            registry.render()
+        )
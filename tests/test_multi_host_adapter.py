@@ -0,0 +1,71 @@
+import unittest
+import sys
+import os
+import inspect
+import threading
+import time
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.adapter import MultiHostAdapter, ContainerSnapshot
+    from ..repairman.lib.entity import Container
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.adapter import MultiHostAdapter, ContainerSnapshot
+    from repairman.lib.entity import Container
+    from test_docker_adapter import create_policy
+
+
+class MultiHostAdapterTest(unittest.TestCase):
+
+    def test_failing_and_slow_daemons_do_not_affect_others(self):
+        policy = create_policy()
+        container = Container('iwa_app', 'running', 0, '2019-04-11T16:26:40', policy.create_service_policy({}), 'web-1')
+        released = threading.Event()
+
+        healthy, failing, slow = mock.Mock(), mock.Mock(), mock.Mock()
+        healthy.get_snapshot.return_value = ContainerSnapshot([container], [container], [])
+        failing.get_snapshot.side_effect = Exception('Connection refused')
+        slow.get_snapshot.side_effect = lambda: released.wait(5)
+
+        adapter = MultiHostAdapter({'web-1': healthy, 'web-2': failing, 'web-3': slow}, timeout=0.1)
+
+        self.assertEqual(['web-1/iwa_app'], [c.identify() for c in adapter.find_all_containers_in_namespace()])
+        self.assertEqual(['web-1/iwa_app'], [c.identify() for c in adapter.find_all_containers()])
+        self.assertEqual(1, slow.get_snapshot.call_count, 'Expected to not queue scans of a not responding daemon')
+        released.set()
+
+    def test_does_not_wait_again_for_a_daemon_which_still_did_not_respond(self):
+        policy = create_policy()
+        container = Container('iwa_app', 'running', 0, '2019-04-11T16:26:40', policy.create_service_policy({}), 'web-1')
+        released = threading.Event()
+
+        healthy, hung = mock.Mock(), mock.Mock()
+        healthy.get_snapshot.return_value = ContainerSnapshot([container], [container], [])
+        hung.get_snapshot.side_effect = lambda: released.wait(5)
+
+        adapter = MultiHostAdapter({'web-1': healthy, 'web-2': hung}, timeout=0.5)
+        adapter.find_all_containers()
+
+        started_at = time.monotonic()
+
+        for i in range(0, 3):
+            self.assertEqual(['web-1/iwa_app'], [c.identify() for c in adapter.find_all_containers_in_namespace()])
+
+        self.assertLess(time.monotonic() - started_at, 0.5)
+        self.assertEqual(4, healthy.get_snapshot.call_count)
+        released.set()
+
+    def test_routes_actions_to_the_daemon(self):
+        first, second = mock.Mock(), mock.Mock()
+        adapter = MultiHostAdapter({'tcp://10.0.0.1:2376': first, 'web-2': second}, timeout=1)
+
+        adapter.restart_container('tcp://10.0.0.1:2376/iwa_app')
+        adapter.remove_container('web-2/iwa_db')
+
+        first.restart_container.assert_called_once_with('iwa_app')
+        second.remove_container.assert_called_once_with('iwa_db')
+        self.assertRaises(KeyError, lambda: adapter.restart_container('web-3/iwa_app'))
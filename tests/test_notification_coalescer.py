@@ -0,0 +1,65 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.notify import NotificationCoalescer, PendingNotification, LazyLog
+except ImportError:
+    from repairman.lib.notify import NotificationCoalescer, PendingNotification, LazyLog
+
+
+class NotificationCoalescerTest(unittest.TestCase):
+
+    def test_sends_immediately_when_quiet_then_a_digest(self):
+        """ During a restart storm the first notification goes out immediately, next ones are grouped """
+
+        dispatcher = mock.Mock()
+        coalescer = NotificationCoalescer(dispatcher=dispatcher, window=30)
+
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_app', 'iwa_app was restarted'))
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_db', 'iwa_db was restarted'))
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_db', 'iwa_db was restarted'))
+        coalescer.add('http://chat', PendingNotification('Max restarts', 1, 'iwa_app', 'iwa_app max restarts'))
+        coalescer.add('http://other', PendingNotification('Restarted', 3, 'iwa_web', 'iwa_web was restarted'))
+
+        self.assertEqual([mock.call('http://chat', 'iwa_app was restarted'),
+                          mock.call('http://other', 'iwa_web was restarted')], dispatcher.dispatch.call_args_list)
+        self.assertGreater(coalescer.flush_due(), 29)
+
+        coalescer._last_sent['http://chat'] -= 30
+        self.assertIsNone(coalescer.flush_due())
+        self.assertEqual(mock.call('http://chat', "**3 notifications in last 30s:**\n" +
+                                   "Max restarts: iwa_app\n" +
+                                   "Restarted: iwa_db (x2)"), dispatcher.dispatch.call_args)
+        self.assertEqual({'digests': 1, 'coalesced': 3, 'pending': 0}, coalescer.get_stats())
+
+    def test_log_is_fetched_only_for_notification_sent_immediately(self):
+        get_log = mock.Mock(return_value='Segmentation fault')
+        dispatcher = mock.Mock()
+        coalescer = NotificationCoalescer(dispatcher=dispatcher, window=30)
+
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_app', 'first', LazyLog(get_log)))
+        get_log.assert_called_once_with()
+
+        get_log.reset_mock()
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_app', 'second', LazyLog(get_log)))
+        coalescer._last_sent['http://chat'] -= 30
+        coalescer.flush_due()
+
+        get_log.assert_not_called()
+        self.assertEqual([mock.call('http://chat', "first\n\n```\nSegmentation fault\n```"),
+                          mock.call('http://chat', 'second')], dispatcher.dispatch.call_args_list)
+
+    def test_disabled_window_sends_everything(self):
+        dispatcher = mock.Mock()
+        coalescer = NotificationCoalescer(dispatcher=dispatcher, window=0)
+
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_app', 'first'))
+        coalescer.add('http://chat', PendingNotification('Restarted', 3, 'iwa_app', 'second'))
+
+        self.assertEqual(2, dispatcher.dispatch.call_count)
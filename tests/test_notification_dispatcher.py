@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+import inspect
+import threading
+import time
+import mock
+import requests
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.notify import NotificationDispatcher
+except ImportError:
+    from repairman.lib.notify import NotificationDispatcher
+
+
+class NotificationDispatcherTest(unittest.TestCase):
+
+    def test_drops_when_queue_is_full(self):
+        """ The healing never waits for the notifications, too many waiting notifications are dropped """
+
+        dispatcher = NotificationDispatcher(queue_size=1, timeout=5, retries=0)
+
+        self.assertTrue(dispatcher.dispatch('http://localhost', 'first'))
+        self.assertFalse(dispatcher.dispatch('http://localhost', 'second'))
+        self.assertEqual({'sent': 0, 'failed': 0, 'dropped': 1, 'retried': 0, 'queued': 1}, dispatcher.get_stats())
+
+    def test_retries_with_timeout_and_reuses_session(self):
+        dispatcher = NotificationDispatcher(queue_size=10, timeout=3, retries=2)
+        dispatcher._BACKOFF_BASE = 0
+        session = mock.Mock()
+        session.post.side_effect = [requests.exceptions.ConnectionError('Connection refused'), mock.Mock(),
+                                    mock.Mock()]
+
+        with mock.patch('requests.Session', return_value=session) as session_class:
+            dispatcher._post('http://localhost', 'first')
+            dispatcher._post('http://localhost', 'second')
+
+        session_class.assert_called_once()
+        self.assertEqual(3, session.post.call_count)
+        self.assertEqual(3, session.post.call_args[1]['timeout'])
+        self.assertEqual({'sent': 2, 'failed': 0, 'dropped': 0, 'retried': 1, 'queued': 0}, dispatcher.get_stats())
+
+    def test_does_not_retry_client_errors(self):
+        dispatcher = NotificationDispatcher(queue_size=10, timeout=3, retries=2)
+        dispatcher._BACKOFF_BASE = 0
+        response = requests.Response()
+        response.status_code = 404
+        server_error = requests.Response()
+        server_error.status_code = 503
+        session = mock.Mock()
+        session.post.side_effect = [server_error, response, response]
+
+        with mock.patch('requests.Session', return_value=session):
+            dispatcher._post('http://localhost', 'first')
+
+        self.assertEqual(2, session.post.call_count)
+        self.assertEqual({'sent': 0, 'failed': 1, 'dropped': 0, 'retried': 1, 'queued': 0}, dispatcher.get_stats())
+
+    def test_unreachable_server_does_not_delay_other_urls(self):
+        released = threading.Event()
+        posted = threading.Event()
+        dispatcher = NotificationDispatcher(queue_size=10, timeout=3, retries=0)
+
+        def post(url, data, timeout):
+            if 'unreachable' in url:
+                released.wait(5)
+            else:
+                posted.set()
+
+            return mock.Mock()
+
+        session = mock.Mock()
+        session.post.side_effect = post
+
+        with mock.patch('requests.Session', return_value=session):
+            dispatcher.run()
+            dispatcher.dispatch('http://unreachable', 'first')
+            dispatcher.dispatch('http://localhost', 'second')
+
+            started_at = time.monotonic()
+            self.assertTrue(posted.wait(2))
+            self.assertLess(time.monotonic() - started_at, 1)
+            released.set()
@@ -0,0 +1,51 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.notify import Notify, LazyLog
+    from ..repairman.lib.entity import Container
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.notify import Notify, LazyLog
+    from repairman.lib.entity import Container
+    from test_docker_adapter import create_policy
+
+
+class NotifyTest(unittest.TestCase):
+
+    def _create_container(self, **params) -> Container:
+        policy = create_policy(**params)
+        return Container('iwa_app', 'running', 0, '2019-04-11T16:26:40', policy.create_service_policy({}))
+
+    def test_log_is_not_fetched_when_notification_is_filtered_out(self):
+        fetch = mock.Mock(return_value='Segmentation fault')
+        notify = Notify(create_policy(), mock.Mock())
+
+        notify.container_was_restarted(self._create_container(notify_url='http://chat', notify_level='INFO'),
+                                       LazyLog(fetch))
+        notify.max_restarts_reached(self._create_container(notify_url='', notify_level='DEBUG'), LazyLog(fetch))
+
+        fetch.assert_not_called()
+
+    def test_log_is_fetched_once_per_healing(self):
+        fetch = mock.Mock(return_value='Segmentation fault')
+        coalescer = mock.Mock()
+        notify = Notify(create_policy(), coalescer)
+        container = self._create_container(notify_url='http://chat', notify_level='DEBUG')
+        log = LazyLog(fetch)
+
+        notify.multiple_failures_happened(container, log)
+        notify.container_was_restarted(container, log)
+        fetch.assert_not_called()
+
+        texts = list(map(lambda call: call[0][1].get_text(), coalescer.add.call_args_list))
+
+        fetch.assert_called_once_with()
+        self.assertIn('Segmentation fault', texts[0])
+        self.assertIn('Segmentation fault', texts[1])
@@ -0,0 +1,77 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.scheduler import Scheduler
+    from ..repairman.lib.exception import ConfigurationException
+    from ..repairman.lib.time import VirtualClock
+except ImportError:
+    from repairman.lib.scheduler import Scheduler
+    from repairman.lib.exception import ConfigurationException
+    from repairman.lib.time import VirtualClock
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def _create_task(self, clock: VirtualClock, durations: list) -> tuple:
+        """ Task taking given seconds on next runs, returns the task and list of times it was started at """
+
+        started = []
+        task = mock.Mock()
+
+        def process():
+            started.append(clock.monotonic())
+            clock.advance(durations.pop(0))
+
+        task.process.side_effect = process
+
+        return task, started
+
+    def _run(self, scheduler: Scheduler, times: int):
+        scheduled = scheduler._scheduled[0]
+        next_run = scheduler._clock.monotonic()
+
+        for i in range(0, times):
+            next_run = scheduler._run_once(scheduled, next_run)
+
+        return scheduled
+
+    def test_keeps_fixed_cadence_regardless_of_task_duration(self):
+        clock = VirtualClock()
+        scheduler = Scheduler(clock=clock)
+        task, started = self._create_task(clock, [3, 7, 1, 9])
+        scheduler.add(task, 10)
+
+        scheduled = self._run(scheduler, 4)
+
+        self.assertEqual([0, 10, 20, 30], started)
+        self.assertEqual((4, 0, 0), (scheduled.runs, scheduled.overruns, scheduled.max_drift))
+
+    def test_skips_runs_missed_by_a_task_that_took_longer_than_its_period(self):
+        clock = VirtualClock()
+        scheduler = Scheduler(clock=clock)
+        task, started = self._create_task(clock, [25, 1, 1])
+        scheduler.add(task, 10)
+
+        scheduled = self._run(scheduler, 3)
+
+        self.assertEqual([0, 30, 40], started)
+        self.assertEqual(2, scheduled.overruns)
+        self.assertEqual((3, 0, 1), (scheduler.get_stats()[0]['runs'], scheduler.get_stats()[0]['max_drift'],
+                                      scheduler.get_stats()[0]['last_duration']))
+
+    def test_rejects_not_positive_interval(self):
+        scheduler = Scheduler(clock=VirtualClock())
+
+        self.assertRaises(ConfigurationException, lambda: scheduler.add(mock.Mock(), 0))
+        self.assertRaises(ConfigurationException, lambda: scheduler.add(mock.Mock(), -90))
+
+
+if __name__ == '__main__':
+    unittest.main()
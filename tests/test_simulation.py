@@ -0,0 +1,91 @@
+import unittest
+import sys
+import os
+import inspect
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman import create_parser
+    from ..repairman.lib.simulation import Simulation, Trace
+except ImportError:
+    from repairman import create_parser
+    from repairman.lib.simulation import Simulation, Trace
+
+
+def create_params(*argv) -> dict:
+    params = vars(create_parser().parse_args(list(argv)))
+
+    for key in list(params.keys()):
+        if key.startswith('http_'):
+            del params[key]
+
+    return params
+
+
+class SimulationTest(unittest.TestCase):
+
+    def test_gives_up_on_a_container_flapping_for_an_hour(self):
+        """ Each failure takes longer than the heal policy can wait, the whole hour is simulated without sleeping """
+
+        trace = Trace.flapping('app', duration=3600, period=300, down_time=290)
+        report = Simulation(create_params('--max-checks-to-give-up', '10'), trace).run()
+        app = report['containers']['app']
+
+        self.assertLess(report['wall_seconds'], 5)
+        self.assertEqual([0.0, 90.0, 780.0, 810.0, 1500.0, 1530.0, 2220.0, 2250.0, 2940.0, 2970.0],
+                         app['restarted_at'][0:10])
+        self.assertEqual(3060.0, app['gave_up_at'])
+        self.assertEqual(3060.0, app['time_to_give_up'])
+        self.assertEqual(5, app['notifications']['[:exclamation:] Max restarts reached, will wait longer till next try'])
+
+        # after giving up, the container recovered by itself and it is healed again
+        self.assertEqual(1, app['notifications']['[:sunglasses:] Container is healthy now'])
+        self.assertEqual(12, report['restarts'])
+
+    def test_single_crash_is_healed_on_next_check(self):
+        trace = Trace.from_dict({
+            'containers': {'iwa_app': {}, 'iwa_db': {}},
+            'events': [{'at': 100, 'container': 'iwa_app', 'state': 'crashed'}]
+        }, duration=600)
+
+        report = Simulation(create_params('--namespace', 'iwa_', '--interval', '60'), trace).run()
+
+        self.assertEqual([120.0], report['containers']['iwa_app']['restarted_at'])
+        self.assertEqual(20.0, report['containers']['iwa_app']['unhealthy_seconds'])
+        self.assertIsNone(report['containers']['iwa_app']['gave_up_at'])
+        self.assertTrue(report['containers']['iwa_app']['healthy_at_end'])
+        self.assertEqual(0, report['containers']['iwa_db']['restarts'])
+
+    def test_notifications_of_a_restart_storm_are_grouped_into_a_digest(self):
+        trace = Trace.from_dict({
+            'events': list(map(lambda number: {'at': 100, 'container': 'iwa_app_' + str(number), 'state': 'crashed'},
+                               range(0, 5)))
+        }, duration=600)
+
+        report = Simulation(create_params('--namespace', 'iwa_', '--interval', '60', '--notify-level', 'DEBUG',
+                                          '--notify-coalesce-window', '30'), trace).run()
+
+        self.assertEqual(5, report['restarts'])
+        self.assertEqual(5, report['notifications'])
+        self.assertEqual(2, report['notification_messages'], 'Expected the first one and a digest of next ones')
+        self.assertEqual(0, report['notification_digests_pending'])
+
+    def test_reads_recorded_docker_events(self):
+        trace = Trace.from_docker_events([
+            '{"status": "health_status: unhealthy", "id": "abc", "timeNano": 1555000010000000000, ' +
+            '"Actor": {"Attributes": {"name": "iwa_app"}}}',
+            '{"status": "start", "id": "abc", "timeNano": 1555000020000000000}',
+            '',
+            '{"status": "health_status: healthy", "id": "abc", "timeNano": 1555000070000000000, ' +
+            '"Actor": {"Attributes": {"name": "iwa_app"}}}'
+        ], duration=100)
+
+        self.assertEqual([(0.0, 'iwa_app', 'failing'), (60.0, 'iwa_app', 'recovered')],
+                         list(map(lambda event: (event.at, event.container, event.state), trace.events)))
+        self.assertEqual({'iwa_app': {}}, trace.containers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+import sys
+import os
+import inspect
+import json
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.summary import SummaryCache
+except ImportError:
+    from repairman.lib.summary import SummaryCache
+
+
+class SummaryCacheTest(unittest.TestCase):
+
+    def test_serves_rendered_summary_until_revision_changes(self):
+        """ Summary is not produced again, until the journal or containers change """
+
+        calls = []
+        revision = [1, 1]
+
+        def produce(limit: int) -> dict:
+            calls.append(limit)
+            return {'global_status': len(calls) == 1, 'limit': limit}
+
+        cache = SummaryCache(producer=produce, revision=lambda: tuple(revision), ttl=60)
+
+        first = cache.get(20)
+        self.assertIs(first, cache.get(20))
+        self.assertEqual(200, first.status)
+        self.assertEqual({'global_status': True, 'limit': 20}, json.loads(first.body.decode('utf-8')))
+
+        revision[1] = 2
+        second = cache.get(20)
+
+        self.assertEqual(500, second.status)
+        self.assertEqual([20, 20], calls)
+
+    def test_zero_ttl_disables_cache(self):
+        calls = []
+        cache = SummaryCache(producer=lambda limit: calls.append(limit) or {'global_status': True},
+                             revision=lambda: (1, 1), ttl=0)
+
+        cache.get(5)
+        cache.get(5)
+
+        self.assertEqual([5, 5], calls)
@@ -0,0 +1,33 @@
+import unittest
+import sys
+import os
+import inspect
+import mock
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.synthetic import SyntheticAdapter, SyntheticDockerApi
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.synthetic import SyntheticAdapter, SyntheticDockerApi
+    from test_docker_adapter import create_policy
+
+
+class SyntheticAdapterTest(unittest.TestCase):
+
+    def test_generates_unhealthy_containers_and_heals_them_on_restart(self):
+        api = SyntheticDockerApi(count=200, namespace='iwa_', unhealthy_ratio=0.1, exited_ratio=0.05)
+        adapter = SyntheticAdapter(create_policy(), mock.Mock(), api)
+
+        unhealthy = adapter.find_all_unhealthy_containers_in_namespace()
+        self.assertTrue(10 < len(unhealthy) < 60, 'Expected about 15% of unhealthy containers')
+        self.assertEqual(200, len(adapter.find_all_containers_in_namespace()) + len(
+            list(filter(lambda container: container.get_exit_code(), unhealthy))))
+
+        for container in unhealthy:
+            adapter.restart_container(container.get_name())
+
+        self.assertEqual([], adapter.find_all_unhealthy_containers_in_namespace())
+        self.assertEqual(len(unhealthy), sum(api.get_restarts().values()))
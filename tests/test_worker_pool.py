@@ -0,0 +1,68 @@
+import unittest
+import sys
+import os
+import inspect
+import threading
+
+path = os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))) + '/../'
+sys.path.append(path)
+
+try:
+    from ..repairman.lib.workers import WorkerPool
+    from ..repairman.lib.exception import WorkerPoolFull, ConfigurationException
+    from .test_docker_adapter import create_policy
+except ImportError:
+    from repairman.lib.workers import WorkerPool
+    from repairman.lib.exception import WorkerPoolFull, ConfigurationException
+    from test_docker_adapter import create_policy
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def test_rejects_when_queue_is_full(self):
+        """ Actions over the queue size are rejected instead of starting an unlimited number of threads """
+
+        pool = WorkerPool(workers=0, queue_size=2)
+        pool.submit(lambda: None)
+        pool.submit(lambda: None)
+
+        self.assertRaises(WorkerPoolFull, lambda: pool.submit(lambda: None))
+        self.assertEqual({'workers': 0, 'active': 0, 'queued': 2, 'completed': 0, 'failed': 0, 'rejected': 1},
+                         pool.get_stats())
+
+    def test_counts_completed_and_failed_actions(self):
+        """ Failing action does not kill the worker """
+
+        pool = WorkerPool(workers=1, queue_size=10)
+        done = threading.Event()
+
+        def fail():
+            raise Exception('Solidarity is our weapon')
+
+        pool.submit(fail)
+        pool.submit(lambda: None)
+        pool.submit(done.set)
+
+        self.assertTrue(done.wait(5))
+
+        # the counters are increased just after the action is finished
+        for i in range(0, 100):
+            if pool.get_stats()['completed'] == 3:
+                break
+
+            threading.Event().wait(0.01)
+
+        self.assertEqual(3, pool.get_stats()['completed'])
+        self.assertEqual(1, pool.get_stats()['failed'])
+
+    def test_policy_rejects_not_positive_number_of_workers(self):
+        self.assertRaises(ConfigurationException, lambda: create_policy(workers=0, workers_queue_size=10))
+        self.assertRaises(ConfigurationException, lambda: create_policy(workers=-1, workers_queue_size=10))
+        self.assertEqual(1, create_policy(workers=1, workers_queue_size=10).workers)
+
+    def test_policy_rejects_not_positive_queue_size(self):
+        """ Queue of zero size would accept an unlimited number of actions """
+
+        self.assertRaises(ConfigurationException, lambda: create_policy(workers=4, workers_queue_size=0))
+        self.assertRaises(ConfigurationException, lambda: create_policy(workers=4, workers_queue_size=-5))
+        self.assertEqual(1, create_policy(workers=4, workers_queue_size=1).workers_queue_size)